@@ -1,38 +1,78 @@
 import logging as log
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 
 import click
-from github import Auth, Github, GithubException
-from github.PullRequest import PullRequest
-from github.Repository import Repository
+from github import Auth, Github
 
-from infrapatch.action.config import ActionConfigProvider
+from infrapatch.action.config import ActionConfigProvider, BranchStrategy
 from infrapatch.core.log_helper import catch_exception, setup_logging
 from infrapatch.core.provider_handler import ProviderHandler
 from infrapatch.core.provider_handler_builder import ProviderHandlerBuilder
 from infrapatch.core.utils.git import Git
+from infrapatch.core.utils.github_client import GithubClient, GithubPullRequest
+from infrapatch.core.utils.release_notes_cache import ReleaseNotesCache
+from infrapatch.core.utils.request_scheduler import RequestScheduler
+from infrapatch.core.utils.run_budget import RunBudget
+from infrapatch.core.utils.terraform.registry_cache import PersistentRegistryCache
+
+SPARSE_CHECKOUT_PATTERNS = ["*.tf", "*.tfvars", ".terraform.lock.hcl"]
+PULL_REQUEST_TITLE = "InfraPatch Module and Provider Update"
 
 
 @click.group(invoke_without_command=True)
 @click.option("--debug", is_flag=True)
+@click.pass_context
 @catch_exception(handle=Exception)
-def main(debug: bool):
+def main(ctx: click.Context, debug: bool):
     setup_logging(debug)
 
     config = ActionConfigProvider()
+    run_budget = RunBudget(config.run_deadline, config.phase_budgets, config.request_timeout)
 
     git = Git(config.repository_root)
-    github = Github(auth=Auth.Token(config.github_token))
-    github_repo = github.get_repo(config.repository_name)
-    github_head_branch = github_repo.get_branch(config.head_branch)
+    if config.sparse_checkout:
+        # infrapatch only reads and patches .tf files
+        git.enable_sparse_checkout(SPARSE_CHECKOUT_PATTERNS)
+    # releases are listed with the maximum page size, so changelog ranges mostly need a single request
+    github = Github(auth=Auth.Token(config.github_token), timeout=config.request_timeout, per_page=100)  # type: ignore
+    github_client = GithubClient(config.github_token, config.repository_name, RequestScheduler(request_timeout=config.request_timeout), cache_directory=config.cache_directory)
+    ctx.call_on_close(github_client.save)
+    github_head_branch = github_client.get_branch(config.head_branch)
+    if github_head_branch is None:
+        raise Exception(f"Branch '{config.head_branch}' does not exist in repository '{config.repository_name}'.")
 
     if len(config.enabled_providers) == 0:
         raise Exception("No providers enabled. Please enable at least one provider.")
 
-    builder = ProviderHandlerBuilder(config.working_directory)
+    registry_cache = None
+    if config.cache_directory is not None:
+        registry_cache = PersistentRegistryCache(config.cache_directory, config.cache_ttl)
+        ctx.call_on_close(registry_cache.save)
+
+    builder = ProviderHandlerBuilder(config.working_directory, run_budget)
     builder.with_git_integration(config.repository_root)
+    if len(config.roots) > 0:
+        builder.with_roots(config.roots)
+    if config.cache_directory is not None:
+        release_notes_cache = ReleaseNotesCache(config.cache_directory)
+        ctx.call_on_close(release_notes_cache.save)
+        builder.with_release_notes_cache(release_notes_cache)
+    if config.changelog_range:
+        builder.with_changelog_range()
+    builder.with_commit_grouping(config.commit_grouping)
     if "terraform_modules" in config.enabled_providers or "terraform_providers" in config.enabled_providers:
-        builder.add_terraform_registry_configuration(config.default_registry_domain, config.terraform_registry_secrets)
+        builder.add_terraform_registry_configuration(
+            config.default_registry_domain,
+            config.terraform_registry_secrets,
+            config.terraform_registry_limits,
+            config.registry_snapshot,
+            config.offline,
+            config.registry_overrides,
+            registry_cache,
+            config.bulk_private_modules,
+        )
+        ctx.call_on_close(builder.registry_handler.close)
     if "terraform_modules" in config.enabled_providers:
         builder.with_terraform_module_provider(github)
     if "terraform_providers" in config.enabled_providers:
@@ -40,27 +80,41 @@ def main(debug: bool):
 
     provider_handler = builder.build()
 
-    git.fetch_origin()
+    github_target_branch = github_client.get_branch(config.target_branch)
+    if config.fetch_depth is None:
+        git.fetch_origin()
+    else:
+        fetched_branches = [config.head_branch] if github_target_branch is None else [config.head_branch, config.target_branch]
+        git.fetch_branches(fetched_branches, config.fetch_depth)
 
-    try:
-        github_target_branch = github_repo.get_branch(config.target_branch)
-    except GithubException:
-        github_target_branch = None
+    if config.pull_request_grouping is not None and config.report_only is False:
+        update_grouped_pull_requests(config, config.pull_request_grouping, git, github_client, provider_handler)
+        return
 
     upgradable_resources_head_branch = None
     pr = None
+    head_commit = git.get_head_commit()
     if github_target_branch is not None and config.report_only is False:
-        pr = get_pr(github_repo, head=config.target_branch, base=config.head_branch)
-        if pr is not None:
-            upgradable_resources_head_branch = provider_handler.get_upgradable_resources()
-        log.info(f"Branch {config.target_branch} already exists. Checking out...")
-        git.checkout_branch(config.target_branch, f"origin/{config.target_branch}")
-
-        log.info(f"Rebasing branch {config.target_branch} onto origin/{config.head_branch}")
-        git.run_git_command(["rebase", "-Xtheirs", f"origin/{config.head_branch}"])
-        git.push(["-f", "-u", "origin", config.target_branch])
-
-    provider_handler.print_resource_table(only_upgradable=True, disable_cache=True)
+        pr = get_pr(github_client, head=config.target_branch, base=config.head_branch)
+        if config.branch_strategy == BranchStrategy.REPLAY:
+            # the branch is pushed once all resources are patched again, so its history does not have to be replayed
+            log.info(f"Branch {config.target_branch} already exists. Resetting it to origin/{config.head_branch}...")
+            git.reset_branch(config.target_branch, f"origin/{config.head_branch}")
+        else:
+            if pr is not None:
+                upgradable_resources_head_branch = provider_handler.get_upgradable_resources()
+            log.info(f"Branch {config.target_branch} already exists. Checking out...")
+            git.checkout_branch(config.target_branch, f"origin/{config.target_branch}")
+
+            if config.fetch_depth is not None:
+                git.ensure_merge_base(f"origin/{config.target_branch}", f"origin/{config.head_branch}", [config.head_branch, config.target_branch])
+            log.info(f"Rebasing branch {config.target_branch} onto origin/{config.head_branch}")
+            git.run_git_command(["rebase", "-Xtheirs", f"origin/{config.head_branch}"])
+            git.push(["-f", "-u", "origin", config.target_branch])
+
+    # only the files changed by the checkout and rebase are parsed and resolved again
+    provider_handler.rescan_changed_files(git.get_changed_files(head_commit))
+    provider_handler.print_resource_table(only_upgradable=True)
 
     if config.report_only:
         log.info("Report only mode is enabled. No changes will be applied.")
@@ -71,12 +125,12 @@ def main(debug: bool):
         if pr is not None and upgradable_resources_head_branch is not None:
             log.info("Updating PR Body...")
             provider_handler.set_resources_patched_based_on_existing_resources(upgradable_resources_head_branch)
-            update_pr_body(pr, provider_handler)
+            update_pr_body(github_client, pr, provider_handler)
         return
 
     if github_target_branch is None:
         log.info(f"Branch {config.target_branch} does not exist. Creating and checking out...")
-        github_repo.create_git_ref(ref=f"refs/heads/{config.target_branch}", sha=github_head_branch.commit.sha)
+        github_client.create_branch(config.target_branch, github_head_branch.sha)
         git.checkout_branch(config.target_branch, f"origin/{config.head_branch}")
 
     provider_handler.upgrade_resources()
@@ -90,17 +144,53 @@ def main(debug: bool):
     git.push(["-f", "-u", "origin", config.target_branch])
 
     if pr is not None:
-        update_pr_body(pr, provider_handler)
+        update_pr_body(github_client, pr, provider_handler)
+        return
+    create_pr(github_client, config.head_branch, config.target_branch, provider_handler)
+
+
+def update_grouped_pull_requests(config: ActionConfigProvider, grouping: str, git: Git, github_client: GithubClient, provider_handler: ProviderHandler):
+    # the resources are scanned and resolved once, each group is patched on its own branch which is reset to the head branch
+    provider_handler.print_resource_table(only_upgradable=True)
+    groups = provider_handler.get_upgradable_resource_groups(grouping, config.working_directory)
+    if len(groups) == 0:
+        log.info("No resources with pending upgrade found.")
         return
-    create_pr(github_repo, config.head_branch, config.target_branch, provider_handler)
 
+    group_handlers: dict[str, tuple[str, ProviderHandler]] = {}
+    for group, resources in groups.items():
+        branch = f"{config.target_branch}-{group}"
+        log.info(f"Patching resources of group '{group}' on branch {branch}...")
+        git.reset_branch(branch, f"origin/{config.head_branch}")
+        group_handler = provider_handler.for_resources(resources)
+        group_handler.upgrade_resources()
+        group_handlers[branch] = (group, group_handler)
 
-def update_pr_body(pr, provider_handler):
+    provider_handler.print_statistics_table()
+    provider_handler.dump_statistics()
+
+    # all branches are pushed with a single connection to the remote
+    git.push(["-f", "origin", *[f"{branch}:refs/heads/{branch}" for branch in group_handlers]])
+
+    def update_group_pull_request(branch: str, group: str, group_handler: ProviderHandler):
+        pr = get_pr(github_client, base=config.head_branch, head=branch)
+        if pr is not None:
+            update_pr_body(github_client, pr, group_handler)
+            return
+        create_pr(github_client, config.head_branch, branch, group_handler, title=f"{PULL_REQUEST_TITLE} ({group})")
+
+    with ThreadPoolExecutor(max_workers=min(len(group_handlers), 8), thread_name_prefix="infrapatch-pull-requests") as executor:
+        futures = [executor.submit(update_group_pull_request, branch, group, group_handler) for branch, (group, group_handler) in group_handlers.items()]
+        for future in futures:
+            future.result()
+
+
+def update_pr_body(github_client: GithubClient, pr: Union[GithubPullRequest, None], provider_handler: ProviderHandler):
     if pr is not None:
         log.info("Updating existing pull request with new body.")
         body = get_pr_body(provider_handler)
         log.debug(f"Pull request body:\n{body}")
-        pr.edit(body=body)
+        github_client.update_pull_request_body(pr, body)
         return
 
 
@@ -130,35 +220,21 @@ def get_pr_body(provider_handler: ProviderHandler) -> str:
     return body
 
 
-def get_pr(repo: Repository, base: str, head: str) -> Union[PullRequest, None]:
+def get_pr(github_client: GithubClient, base: str, head: str) -> Union[GithubPullRequest, None]:
     base_ref = base
     head_ref = head
     if base_ref.startswith("origin/"):
         base_ref = base_ref[len("origin/") :]
     if head_ref.startswith("origin/"):
         head_ref = head_ref[len("origin/") :]
-    pulls = repo.get_pulls(state="open", sort="created", direction="desc")
-
-    if pulls.totalCount == 0:
-        log.debug("No pull request found")
-        return None
-
-    pr = [pr for pr in pulls if pr.base.ref == base_ref and pr.head.ref == head_ref]
-    if len(pr) == 0:
-        log.debug(f"No pull request found from '{head}' to '{base}'.")
-        return None
-    elif len(pr) == 1:
-        log.debug(f"Pull request found from '{head}' to '{base}'.")
-        return pr[0]
-    if len(pr) > 1:
-        raise Exception(f"Multiple pull requests found from '{head}' to '{base}'.")
+    return github_client.get_pull_request(head=head_ref, base=base_ref)
 
 
-def create_pr(repo: Repository, head_branch: str, target_branch: str, provider_handler: ProviderHandler) -> PullRequest:
+def create_pr(github_client: GithubClient, head_branch: str, target_branch: str, provider_handler: ProviderHandler, title: str = PULL_REQUEST_TITLE) -> GithubPullRequest:
     body = get_pr_body(provider_handler)
     log.info(f"Creating new pull request from '{target_branch}' to '{head_branch}'.")
     log.debug(f"Pull request body:\n{body}")
-    return repo.create_pull(title="InfraPatch Module and Provider Update", body=body, base=head_branch, head=target_branch)
+    return github_client.create_pull_request(title=title, body=body, head=target_branch, base=head_branch)
 
 
 if __name__ == "__main__":
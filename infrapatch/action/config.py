@@ -1,13 +1,26 @@
 import logging as log
 import os
 from pathlib import Path
-from typing import Any
+from typing import Any, Union
+
+from infrapatch.core.provider_handler import CommitGrouping, ResourceGrouping
+from infrapatch.core.utils.request_scheduler import HostLimits
+from infrapatch.core.utils.run_budget import parse_phase_budgets
 
 
 class MissingConfigException(Exception):
     pass
 
 
+class BranchStrategy:
+    REBASE = "rebase"  # rebase the existing target branch onto the head branch
+    REPLAY = "replay"  # reset the target branch to the head branch and patch all resources again
+
+    @classmethod
+    def all(cls) -> list[str]:
+        return [cls.REBASE, cls.REPLAY]
+
+
 class ActionConfigProvider:
     github_token: str
     head_branch: str
@@ -19,6 +32,23 @@ class ActionConfigProvider:
     repository_root: Path
     report_only: bool
     terraform_registry_secrets: dict[str, str]
+    terraform_registry_limits: dict[str, HostLimits]
+    run_deadline: Union[float, None]
+    phase_budgets: dict[str, float]
+    request_timeout: float
+    registry_snapshot: Union[Path, None]
+    offline: bool
+    registry_overrides: dict[str, str]
+    cache_directory: Union[Path, None]
+    cache_ttl: float
+    bulk_private_modules: bool
+    changelog_range: bool
+    branch_strategy: str
+    commit_grouping: str
+    fetch_depth: Union[int, None]
+    sparse_checkout: bool
+    pull_request_grouping: Union[str, None]
+    roots: list[str]
 
     def __init__(self) -> None:
         self.github_token = _get_value_from_env("GITHUB_TOKEN", secret=True)
@@ -28,9 +58,31 @@ class ActionConfigProvider:
         self.repository_root = Path(_get_value_from_env("REPOSITORY_ROOT"))
         self.enabled_providers = _get_value_from_env("ENABLED_PROVIDERS", default="").split(",")
         self.working_directory = self.repository_root.joinpath(_get_value_from_env("WORKING_DIRECTORY_RELATIVE", default=""))
+        self.roots = [root.strip() for root in _get_value_from_env("ROOTS", default="").splitlines() if root.strip() != ""]
         self.default_registry_domain = _get_value_from_env("DEFAULT_REGISTRY_DOMAIN")
         self.terraform_registry_secrets = _get_credentials_from_string(_get_value_from_env("TERRAFORM_REGISTRY_SECRET_STRING", secret=True, default=""))
+        self.terraform_registry_limits = _get_limits_from_string(_get_value_from_env("TERRAFORM_REGISTRY_LIMITS_STRING", default=""))
         self.report_only = _from_env_to_bool(_get_value_from_env("REPORT_ONLY", default="False").lower())
+        run_deadline = _get_value_from_env("RUN_DEADLINE_SECONDS", default="")
+        self.run_deadline = float(run_deadline) if run_deadline != "" else None
+        self.phase_budgets = parse_phase_budgets(_get_value_from_env("PHASE_BUDGETS", default=""))
+        self.request_timeout = float(_get_value_from_env("REQUEST_TIMEOUT_SECONDS", default="30"))
+        registry_snapshot = _get_value_from_env("REGISTRY_SNAPSHOT_PATH", default="")
+        self.registry_snapshot = self.repository_root.joinpath(registry_snapshot) if registry_snapshot != "" else None
+        self.offline = _from_env_to_bool(_get_value_from_env("OFFLINE", default="False"))
+        self.registry_overrides = _get_registry_overrides_from_string(_get_value_from_env("REGISTRY_OVERRIDES_STRING", default=""))
+        cache_directory = _get_value_from_env("CACHE_DIRECTORY", default="")
+        self.cache_directory = Path(cache_directory) if cache_directory != "" else None
+        self.cache_ttl = float(_get_value_from_env("CACHE_TTL_SECONDS", default="3600"))
+        self.bulk_private_modules = _from_env_to_bool(_get_value_from_env("BULK_PRIVATE_MODULES", default="False"))
+        self.changelog_range = _from_env_to_bool(_get_value_from_env("CHANGELOG_RANGE", default="False"))
+        self.branch_strategy = _get_choice_from_env("BRANCH_STRATEGY", BranchStrategy.all(), default=BranchStrategy.REBASE)
+        fetch_depth = _get_value_from_env("FETCH_DEPTH", default="")
+        self.fetch_depth = int(fetch_depth) if fetch_depth.strip() not in ["", "0"] else None
+        self.sparse_checkout = _from_env_to_bool(_get_value_from_env("SPARSE_CHECKOUT", default="False"))
+        self.commit_grouping = _get_choice_from_env("COMMIT_GROUPING", CommitGrouping.all(), default=CommitGrouping.RESOURCE)
+        pull_request_grouping = _get_choice_from_env("PULL_REQUEST_GROUPING", ["none", *ResourceGrouping.all()], default="none")
+        self.pull_request_grouping = pull_request_grouping if pull_request_grouping != "none" else None
 
 
 def _get_value_from_env(key: str, secret: bool = False, default: Any = None) -> Any:
@@ -46,6 +98,15 @@ def _get_value_from_env(key: str, secret: bool = False, default: Any = None) ->
     raise MissingConfigException(f"Missing configuration for key: {key}")
 
 
+def _get_choice_from_env(key: str, choices: list[str], default: str) -> str:
+    value = _get_value_from_env(key, default=default).strip().lower()
+    if value == "":
+        return default
+    if value not in choices:
+        raise Exception(f"Invalid value '{value}' for {key}, supported values are: {', '.join(choices)}.")
+    return value
+
+
 def _get_credentials_from_string(credentials_string: str) -> dict[str, str]:
     credentials = {}
     if credentials_string == "":
@@ -61,5 +122,37 @@ def _get_credentials_from_string(credentials_string: str) -> dict[str, str]:
     return credentials
 
 
+def _get_limits_from_string(limits_string: str) -> dict[str, HostLimits]:
+    limits = {}
+    for line in limits_string.splitlines():
+        if line.strip() == "":
+            continue
+        try:
+            name, limit_values = line.split("=", 1)
+            limits_dict = {}
+            for limit in limit_values.split(","):
+                key, value = limit.split("=", 1)
+                limits_dict[key.strip()] = value.strip()
+        except ValueError as e:
+            log.debug(f"Limits line '{line}' could not be split into name and limits.")
+            raise Exception(f"Error processing registry limits: '{e}'")
+        limits[name.strip()] = HostLimits.from_dict(limits_dict)
+    return limits
+
+
+def _get_registry_overrides_from_string(overrides_string: str) -> dict[str, str]:
+    overrides = {}
+    for line in overrides_string.splitlines():
+        if line.strip() == "":
+            continue
+        try:
+            domain, url = line.split("=", 1)
+        except ValueError as e:
+            log.debug(f"Registry override line '{line}' could not be split into registry domain and url.")
+            raise Exception(f"Error processing registry overrides: '{e}'")
+        overrides[domain.strip()] = url.strip()
+    return overrides
+
+
 def _from_env_to_bool(value: str) -> bool:
     return value.lower() in ["true", "1", "yes", "y", "t"]
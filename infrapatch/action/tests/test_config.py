@@ -3,7 +3,16 @@ from pathlib import Path
 
 import pytest
 
-from infrapatch.action.config import ActionConfigProvider, MissingConfigException, _from_env_to_bool, _get_credentials_from_string, _get_value_from_env
+from infrapatch.action.config import (
+    ActionConfigProvider,
+    MissingConfigException,
+    _from_env_to_bool,
+    _get_choice_from_env,
+    _get_credentials_from_string,
+    _get_limits_from_string,
+    _get_registry_overrides_from_string,
+    _get_value_from_env,
+)
 
 
 def test_get_credentials_from_string():
@@ -30,6 +39,41 @@ def test_get_credentials_from_string():
         assert str(e) == "Error processing secrets: 'not enough values to unpack (expected 2, got 1)'"
 
 
+def test_get_limits_from_string():
+    # Test case 1: Empty limits string
+    assert _get_limits_from_string("") == {}
+
+    # Test case 2: Multiple registries
+    limits = _get_limits_from_string("test_registry.ch=max_concurrency=2,requests_per_second=0.5\nregistry.terraform.io=max_retries=1")
+    assert limits["test_registry.ch"].max_concurrency == 2
+    assert limits["test_registry.ch"].requests_per_second == 0.5
+    assert limits["registry.terraform.io"].max_retries == 1
+
+    # Test case 3: Invalid limits string
+    with pytest.raises(Exception):
+        _get_limits_from_string("test_registry.ch=max_concurrency")
+
+
+def test_get_registry_overrides_from_string():
+    assert _get_registry_overrides_from_string("") == {}
+    overrides = _get_registry_overrides_from_string("registry.terraform.io=http://proxy:8080/registry.terraform.io\ntest_registry.ch = http://proxy:8080/test_registry.ch")
+    assert overrides == {"registry.terraform.io": "http://proxy:8080/registry.terraform.io", "test_registry.ch": "http://proxy:8080/test_registry.ch"}
+    with pytest.raises(Exception):
+        _get_registry_overrides_from_string("registry.terraform.io")
+
+
+def test_get_choice_from_env(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv("COMMIT_GROUPING", raising=False)
+    assert _get_choice_from_env("COMMIT_GROUPING", ["resource", "file"], default="resource") == "resource"
+    monkeypatch.setenv("COMMIT_GROUPING", "File")
+    assert _get_choice_from_env("COMMIT_GROUPING", ["resource", "file"], default="resource") == "file"
+    monkeypatch.setenv("COMMIT_GROUPING", "")
+    assert _get_choice_from_env("COMMIT_GROUPING", ["resource", "file"], default="resource") == "resource"
+    monkeypatch.setenv("COMMIT_GROUPING", "unknown")
+    with pytest.raises(Exception):
+        _get_choice_from_env("COMMIT_GROUPING", ["resource", "file"], default="resource")
+
+
 def test_get_value_from_env():
     # Test case 1: Value exists in os.environ
     os.environ["TEST_VALUE"] = "abc123"
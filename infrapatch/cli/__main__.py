@@ -1,17 +1,53 @@
+import json
+import logging as log
+import sys
+import time
 from pathlib import Path
 from typing import Union
 
 import click
+from github import Github
+from rich.console import Console
+from rich.table import Table
 
 from infrapatch.cli.__init__ import __version__
-from infrapatch.core.credentials_helper import get_registry_credentials
+from infrapatch.core.credentials_helper import get_registry_credentials, get_registry_limits
+import infrapatch.core.constants as cs
+from infrapatch.core.fleet import Fleet, dump_fleet_statistics, get_fleet_table, read_fleet_manifest
 from infrapatch.core.log_helper import catch_exception, setup_logging
+from infrapatch.core.models.statistics import Statistics
 from infrapatch.core.provider_handler import ProviderHandler
 from infrapatch.core.provider_handler_builder import ProviderHandlerBuilder
+from infrapatch.core.utils.checkpoint import CheckpointJournal
+from infrapatch.core.utils.file_watcher import FileChanges, create_file_watcher
+from infrapatch.core.utils.request_scheduler import HostLimits, RequestScheduler
+from infrapatch.core.utils.run_budget import RunBudget, parse_phase_budgets
+from infrapatch.core.utils.shard import ShardMode, get_merged_markdown_report, merge_statistics_files, parse_shard
+from infrapatch.core.utils.terraform.registry_proxy import RegistryProxy, RegistryProxyServer, ResponseCache
 from infrapatch.core.utils.terraform.hcl_edit_cli import HclEditCli
 from infrapatch.core.utils.terraform.hcl_handler import HclHandler
+from infrapatch.core.utils.terraform.git_source_handler import GitSourceHandler
+from infrapatch.core.utils.terraform.bulk_resolver import BulkResolver, parse_resolve_requests
+from infrapatch.core.utils.terraform.registry_cache import PersistentRegistryCache
+from infrapatch.core.utils.terraform.registry_handler import RegistryHandler
 
 provider_handler: Union[ProviderHandler, None] = None
+registry_handler: Union[RegistryHandler, None] = None
+registry_credentials: dict[str, str] = {}
+registry_limits: dict[str, HostLimits] = {}
+request_timeout_seconds: float = 30
+registry_cache: Union[PersistentRegistryCache, None] = None
+cache_directory_path: Union[Path, None] = None
+run_budget: Union[RunBudget, None] = None
+roots: Union[list[Path], None] = None
+working_directory: Union[Path, None] = None
+checkpoint_journal: Union[CheckpointJournal, None] = None
+
+# commands which only need the registry configuration and not the registry or provider handler
+COMMANDS_WITHOUT_REGISTRY_HANDLER = ["serve", "merge"]
+COMMANDS_WITHOUT_PROVIDER_HANDLER = ["serve", "resolve", "fleet"]
+# commands which can record their progress in the checkpoint journal
+COMMANDS_WITH_CHECKPOINT = ["update"]
 
 
 @click.group(invoke_without_command=True)
@@ -20,14 +56,92 @@ provider_handler: Union[ProviderHandler, None] = None
 @click.option("--working-directory-path", default=None, help="Working directory to run. Defaults to the current working directory")
 @click.option("--credentials-file-path", default=None, help="Path to a file containing credentials for private registries.")
 @click.option("--default-registry-domain", default="registry.terraform.io", help="Default registry domain for resources without a specified domain.")
+@click.option("--deadline", default=None, type=float, help="Maximum runtime in seconds. Resources which could not be resolved in time are reported as timed out.")
+@click.option(
+    "--phase-budgets", default="", help="Comma separated time budgets in seconds per phase, e.g. 'parse=60,resolve=300'. Phases are parse, resolve, release_notes and patch."
+)
+@click.option("--request-timeout", default=30, type=float, help="Timeout in seconds for a single request to a registry or GitHub.")
+@click.option("--registry-snapshot", default=None, help="Path to a registry snapshot (.json or .sqlite file) or a provider mirror directory to look up versions from.")
+@click.option("--offline", is_flag=True, help="Only use the registry snapshot and network mirrors for lookups, resources not found there are reported without a version.")
+@click.option(
+    "--registry-override",
+    "registry_override",
+    multiple=True,
+    help="Use another base url for a registry in the format <registry_domain>=<url>, e.g. an infrapatch registry proxy. Can be used multiple times.",
+)
+@click.option("--cache-directory", default=None, help="Directory to persist registry lookups in between runs. Disabled by default.")
+@click.option(
+    "--bulk-private-modules",
+    is_flag=True,
+    help="List all modules of the organizations of private registry modules (Terraform Cloud / Enterprise) at once instead of looking them up one by one.",
+)
+@click.option(
+    "--root",
+    "root",
+    multiple=True,
+    help="Terraform root directory relative to the working directory, globs like 'environments/*' are supported. Can be used multiple times to report each root separately.",
+)
+@click.option(
+    "--shard", default=None, help="Only process one part of the resources in the format <index>/<count>, e.g. '1/4'. The partial statistics can be combined with the merge command."
+)
+@click.option(
+    "--shard-by",
+    default=ShardMode.FILE,
+    type=click.Choice(ShardMode.all()),
+    help="Distribute the .tf files or the distinct module and provider sources between the shards. With 'source', every shard parses all files. Defaults to file.",
+)
+@click.option("--cache-ttl", default=3600, type=float, help="Seconds persisted registry lookups are used before they are looked up again.")
+@click.option(
+    "--checkpoint",
+    is_flag=True,
+    help="Record the progress of an update in a checkpoint journal in the working directory, so it can be resumed with --resume if it is interrupted.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Resume an interrupted update from the checkpoint journal in the working directory. Resolved versions and patches of unchanged files are not repeated.",
+)
+@click.pass_context
 @catch_exception(handle=Exception)
-def main(debug: bool, version: bool, working_directory_path: str, credentials_file_path: str, default_registry_domain: str):
+def main(
+    ctx: click.Context,
+    debug: bool,
+    version: bool,
+    working_directory_path: str,
+    credentials_file_path: str,
+    default_registry_domain: str,
+    deadline: Union[float, None],
+    phase_budgets: str,
+    request_timeout: float,
+    registry_snapshot: Union[str, None],
+    offline: bool,
+    registry_override: tuple[str, ...],
+    cache_directory: Union[str, None],
+    cache_ttl: float,
+    bulk_private_modules: bool,
+    root: tuple[str, ...],
+    shard: Union[str, None],
+    shard_by: str,
+    checkpoint: bool,
+    resume: bool,
+):
     if version:
         print(f"You are running infrapatch version: {__version__}")
         exit(0)
     setup_logging(debug)
 
-    global provider_handler
+    global \
+        provider_handler, \
+        registry_handler, \
+        registry_credentials, \
+        registry_limits, \
+        request_timeout_seconds, \
+        registry_cache, \
+        cache_directory_path, \
+        run_budget, \
+        roots, \
+        working_directory, \
+        checkpoint_journal
     credentials_file = None
     working_directory = Path.cwd()
 
@@ -40,9 +154,46 @@ def main(debug: bool, version: bool, working_directory_path: str, credentials_fi
         credentials_file = Path(credentials_file_path)
         if not credentials_file.exists() or not credentials_file.is_file():
             raise Exception(f"Credentials file '{credentials_file}' does not exist.")
-    credentials = get_registry_credentials(HclHandler(HclEditCli()), credentials_file)
-    provider_builder = ProviderHandlerBuilder(working_directory)
-    provider_builder.add_terraform_registry_configuration(default_registry_domain, credentials)
+    registry_credentials = get_registry_credentials(HclHandler(HclEditCli()), credentials_file)
+    registry_limits = get_registry_limits(credentials_file)
+    request_timeout_seconds = request_timeout
+    cache_directory_path = Path(cache_directory) if cache_directory is not None else None
+    if ctx.invoked_subcommand in COMMANDS_WITHOUT_REGISTRY_HANDLER:
+        return
+    if cache_directory_path is not None:
+        registry_cache = PersistentRegistryCache(cache_directory_path, cache_ttl)
+        ctx.call_on_close(registry_cache.save)
+    registry_snapshot_path = None
+    if registry_snapshot is not None:
+        registry_snapshot_path = Path(registry_snapshot)
+        if not registry_snapshot_path.exists():
+            raise Exception(f"Registry snapshot '{registry_snapshot_path}' does not exist.")
+    run_budget = RunBudget(deadline, parse_phase_budgets(phase_budgets), request_timeout)
+    provider_builder = ProviderHandlerBuilder(working_directory, run_budget)
+    provider_builder.add_terraform_registry_configuration(
+        default_registry_domain,
+        registry_credentials,
+        registry_limits,
+        registry_snapshot_path,
+        offline,
+        _parse_key_value_pairs(registry_override, "--registry-override"),
+        registry_cache,
+        bulk_private_modules,
+    )
+    registry_handler = provider_builder.registry_handler
+    ctx.call_on_close(registry_handler.close)
+    if ctx.invoked_subcommand in COMMANDS_WITHOUT_PROVIDER_HANDLER:
+        return
+    if shard is not None:
+        provider_builder.with_shard(parse_shard(shard, shard_by))
+    if len(root) > 0:
+        provider_builder.with_roots(root)
+        roots = provider_builder.roots
+    if (checkpoint or resume) and ctx.invoked_subcommand not in COMMANDS_WITH_CHECKPOINT:
+        raise Exception(f"Only the commands {', '.join(COMMANDS_WITH_CHECKPOINT)} can be checkpointed and resumed.")
+    if checkpoint or resume:
+        checkpoint_journal = CheckpointJournal(working_directory.joinpath(cs.CHECKPOINT_FILE_NAME), resume)
+        provider_builder.with_checkpoint_journal(checkpoint_journal)
     provider_builder.with_terraform_module_provider()
     provider_builder.with_terraform_provider_provider()
     provider_handler = provider_builder.build()
@@ -52,11 +203,27 @@ def main(debug: bool, version: bool, working_directory_path: str, credentials_fi
 @main.command()
 @click.option("--only-upgradable", is_flag=True, help="Only show providers and modules that can be upgraded.")
 @click.option("--dump-json-statistics", is_flag=True, help="Creates a json file containing statistics about the found resources and there update status as json file in the cwd.")
+@click.option(
+    "--stream-json-statistics",
+    default=None,
+    help="Writes the resources and statistics as NDJSON to this file while the .tf files are processed in chunks, instead of keeping all resources in memory. "
+    "Compressed with gzip if the file name ends with .gz. Only the statistics table is printed.",
+)
 @catch_exception(handle=Exception)
-def report(only_upgradable: bool, dump_json_statistics: bool):
+def report(only_upgradable: bool, dump_json_statistics: bool, stream_json_statistics: Union[str, None]):
     """Finds all modules and providers in the project_root and prints the newest version."""
     if provider_handler is None:
         raise Exception("provider_handler not initialized.")
+    if stream_json_statistics is not None:
+        if roots is not None or dump_json_statistics:
+            raise Exception("--stream-json-statistics can't be combined with --root or --dump-json-statistics.")
+        statistics = provider_handler.stream_statistics(Path(stream_json_statistics), only_upgradable=only_upgradable)
+        provider_handler.console.print(statistics.get_rich_table())
+        return
+    if roots is not None:
+        # all roots are scanned and resolved together, the results are reported per root
+        _report_roots(provider_handler, roots, only_upgradable=only_upgradable, dump_json_statistics=dump_json_statistics)
+        return
     provider_handler.print_resource_table(only_upgradable)
     provider_handler.print_statistics_table()
     if dump_json_statistics:
@@ -73,17 +240,317 @@ def update(confirm: bool, dump_json_statistics: bool):
     if provider_handler is None:
         raise Exception("main_handler not initialized.")
 
-    provider_handler.print_resource_table(only_upgradable=True)
+    if roots is not None:
+        for root, root_handler in provider_handler.split_by_roots(roots).items():
+            root_handler.console.rule(root.as_posix())
+            root_handler.print_resource_table(only_upgradable=True)
+    else:
+        provider_handler.print_resource_table(only_upgradable=True)
     if not confirm:
         if not click.confirm("Do you want to apply the changes?"):
             print("Aborting...")
+            # nothing was patched, so there is nothing to resume
+            _complete_checkpoint()
             return
 
     provider_handler.upgrade_resources()
+    if roots is not None:
+        _report_roots(provider_handler, roots, only_upgradable=None, dump_json_statistics=dump_json_statistics)
+        _complete_checkpoint()
+        return
+    provider_handler.print_statistics_table()
+    if dump_json_statistics:
+        provider_handler.dump_statistics()
+    _complete_checkpoint()
+
+
+def _complete_checkpoint():
+    # the journal is kept if the run fails or is interrupted, so the next run can resume with --resume
+    if checkpoint_journal is not None:
+        checkpoint_journal.complete()
+
+
+def _report_roots(provider_handler: ProviderHandler, roots: list[Path], only_upgradable: Union[bool, None], dump_json_statistics: bool):
+    # prints the resources and statistics of every root followed by the statistics of all roots, resources are skipped if only_upgradable is None
+    for root, root_handler in provider_handler.split_by_roots(roots).items():
+        root_handler.console.rule(root.as_posix())
+        if only_upgradable is not None:
+            root_handler.print_resource_table(only_upgradable)
+        root_handler.print_statistics_table()
+        if dump_json_statistics:
+            root_handler.dump_statistics()
+    provider_handler.console.rule(f"All {len(roots)} roots")
     provider_handler.print_statistics_table()
     if dump_json_statistics:
         provider_handler.dump_statistics()
 
 
+@main.command()
+@click.option("--only-upgradable", is_flag=True, help="Only show providers and modules that can be upgraded.")
+@click.option("--ndjson", is_flag=True, help="Print the resources of the changed files as NDJSON instead of the resource table.")
+@click.option("--poll-interval", default=None, type=float, help="Poll for changes in this interval in seconds instead of using inotify.")
+@catch_exception(handle=Exception)
+def watch(only_upgradable: bool, ndjson: bool, poll_interval: Union[float, None]):
+    """Reports the modules and providers in the project_root and reports them again whenever .tf files change.
+
+    Only the changed files are parsed again, the versions of all other resources and the registry lookups are kept in memory."""
+    if provider_handler is None or working_directory is None:
+        raise Exception("provider_handler not initialized.")
+    # changed files outside of the roots are ignored by the providers
+    watcher = create_file_watcher(working_directory, poll_interval)
+    start = time.monotonic()
+    provider_handler.get_resources()
+    _print_watch_result(provider_handler, None, only_upgradable, ndjson, time.monotonic() - start)
+    # changes of a failed rescan are rescanned again together with the next changes
+    failed_changes = FileChanges()
+    try:
+        while True:
+            changes = watcher.wait_for_changes()
+            if changes.is_empty():
+                continue
+            changes = FileChanges(changes.files | failed_changes.files, changes.rescan_all or failed_changes.rescan_all)
+            start = time.monotonic()
+            try:
+                if changes.rescan_all:
+                    provider_handler.get_resources(disable_cache=True)
+                else:
+                    provider_handler.rescan_changed_files(sorted(changes.files))
+            except Exception as e:
+                # e.g. a file saved with invalid syntax or deleted while it was parsed, the watch continues with the previous resources
+                log.error(f"Could not rescan the changed files, keeping the previous resources: {e}")
+                failed_changes = changes
+                continue
+            failed_changes = FileChanges()
+            _print_watch_result(provider_handler, None if changes.rescan_all else changes.files, only_upgradable, ndjson, time.monotonic() - start)
+    except KeyboardInterrupt:
+        log.debug("Stopped watching for changes.")
+    finally:
+        watcher.close()
+
+
+def _print_watch_result(provider_handler: ProviderHandler, changed_files: Union[set[Path], None], only_upgradable: bool, ndjson: bool, duration: float):
+    # without changed files, all resources are printed
+    if not ndjson:
+        provider_handler.console.clear()
+        provider_handler.print_resource_table(only_upgradable)
+        provider_handler.print_statistics_table()
+        scope = "all files" if changed_files is None else f"{len(changed_files)} changed files"
+        provider_handler.console.print(f"Scanned {scope} in {duration * 1000:.0f}ms, watching for changes...")
+        return
+    resources_by_provider = provider_handler.get_upgradable_resources() if only_upgradable else provider_handler.get_resources()
+    changed = {file.absolute().resolve() for file in changed_files} if changed_files is not None else None
+    resources = [
+        {"provider": provider_name, **resource.model_dump(mode="json")}
+        for provider_name, provider_resources in resources_by_provider.items()
+        for resource in provider_resources
+        if changed is None or resource.source_file.absolute().resolve() in changed
+    ]
+    files = sorted(file.as_posix() for file in changed_files) if changed_files is not None else None
+    sys.stdout.write(f"{json.dumps({'files': files, 'duration_ms': round(duration * 1000, 1), 'resources': resources})}\n")
+    sys.stdout.flush()
+
+
+@main.command()
+@click.argument("input_file", default="-", type=click.File("r"))
+@click.option("--max-workers", default=cs.DEFAULT_RESOLVE_WORKERS, type=int, help="Number of sources resolved concurrently.")
+@catch_exception(handle=Exception)
+def resolve(input_file, max_workers: int):
+    """Resolves the newest version and source url of the module and provider sources in INPUT_FILE (stdin by default) and prints them as NDJSON.
+
+    Every line of the input is either a source or a JSON object like {"source": "hashicorp/aws", "type": "provider"}.
+    The results are printed as soon as they are available and contain the line index of the request."""
+    if registry_handler is None:
+        raise Exception("registry_handler not initialized.")
+    for result in BulkResolver(registry_handler, max_workers).resolve(parse_resolve_requests(input_file)):
+        sys.stdout.write(f"{result.to_json()}\n")
+        sys.stdout.flush()
+
+
+@main.command()
+@click.argument("repositories", nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.option("--manifest", default=None, type=click.Path(exists=True, dir_okay=False), help="File with one repository path per line, relative to the file.")
+@click.option("--max-workers", default=4, type=int, help="Number of repositories processed concurrently.")
+@click.option("--update", "apply_updates", is_flag=True, help="Update the resources of all repositories without confirmation.")
+@click.option("--statistics-file", default=None, help="Path of a json file to write the combined statistics of all repositories to.")
+@catch_exception(handle=Exception)
+def fleet(repositories: tuple[str, ...], manifest: Union[str, None], max_workers: int, apply_updates: bool, statistics_file: Union[str, None]):
+    """Reports or updates the modules and providers of multiple repository checkouts concurrently.
+
+    The registry lookups, registry cache and GitHub client are shared between all repositories, so every source is only looked up once."""
+    if registry_handler is None or run_budget is None:
+        raise Exception("registry_handler not initialized.")
+    repository_paths = [Path(repository) for repository in repositories]
+    if manifest is not None:
+        repository_paths.extend(read_fleet_manifest(Path(manifest)))
+    if len(repository_paths) == 0:
+        raise Exception("No repositories given, pass repository paths or a manifest.")
+    shared_registry_handler = registry_handler
+    shared_run_budget = run_budget
+    github = Github(timeout=request_timeout_seconds)  # type: ignore
+    git_source_handler = GitSourceHandler(shared_run_budget, registry_cache)
+
+    def create_provider_handler(repository: Path) -> ProviderHandler:
+        # phases are tracked per repository, the deadline of the whole run still applies
+        repository_run_budget = RunBudget(shared_run_budget.remaining(), shared_run_budget.phase_budgets, shared_run_budget.request_timeout)
+        return (
+            ProviderHandlerBuilder(repository, repository_run_budget)
+            .with_registry_handler(shared_registry_handler, registry_cache)
+            .with_git_source_handler(git_source_handler)
+            .without_progress()
+            .with_terraform_module_provider(github)
+            .with_terraform_provider_provider(github)
+            .build()
+        )
+
+    results = Fleet(create_provider_handler, max_workers).run(repository_paths, update=apply_updates)
+    Console(width=cs.CLI_WIDTH).print(get_fleet_table(results))
+    if statistics_file is not None:
+        dump_fleet_statistics(results, Path(statistics_file))
+
+
+@main.command()
+@click.argument("statistics_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--output", default=f"{cs.APP_NAME}_Statistics.json", help="Path of the merged statistics file.")
+@click.option("--markdown", default=None, help="Path of a markdown file to write the pending and changed resources and the statistics to, e.g. for a pull request body.")
+@catch_exception(handle=Exception)
+def merge(statistics_files: tuple[str, ...], output: str, markdown: Union[str, None]):
+    """Merges the statistics files of multiple shards (--shard) into one statistics file and report."""
+    merged = merge_statistics_files([Path(statistics_file) for statistics_file in statistics_files])
+    with open(output, "w") as file:
+        json.dump(merged, file)
+    if markdown is not None:
+        Path(markdown).write_text(get_merged_markdown_report(merged))
+    Console(width=cs.CLI_WIDTH).print(Statistics.model_validate(merged).get_rich_table())
+    print(f"Merged {len(statistics_files)} statistics files into '{output}'.")
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on.")
+@click.option("--port", default=8080, type=int, help="Port to listen on.")
+@click.option(
+    "--upstream",
+    "upstream",
+    multiple=True,
+    default=["registry.terraform.io"],
+    help="Upstream registry to proxy, either a registry domain or <name>=<url>. Can be used multiple times. Defaults to registry.terraform.io.",
+)
+@click.option("--cache-size", default=10000, type=int, help="Maximum number of responses kept in memory.")
+@click.option("--ttl", default=300, type=float, help="Seconds a cached response is served before it is revalidated with the upstream registry.")
+@click.option(
+    "--access-token",
+    default=None,
+    envvar="INFRAPATCH_PROXY_ACCESS_TOKEN",
+    help="Token clients have to send to use the proxy. Required to proxy registries with credentials and to revalidate cached responses.",
+)
+@catch_exception(handle=Exception)
+def serve(host: str, port: int, upstream: tuple[str, ...], cache_size: int, ttl: float, access_token: Union[str, None]):
+    """Runs a caching proxy for terraform registries. Point infrapatch at it with --registry-override <registry_domain>=http://<host>:<port>/<registry_domain>.
+
+    Clients send the access token with the credentials of the proxy host, e.g. "<host>:<port>" in the credentials file."""
+    upstreams = {}
+    for value in upstream:
+        if "=" in value:
+            upstreams.update(_parse_key_value_pairs((value,), "--upstream"))
+        else:
+            upstreams[value] = f"https://{value}"
+    # with a cache directory, cached responses are persisted and survive restarts of the proxy
+    cache = ResponseCache(cache_size, cache_directory_path.joinpath("proxy") if cache_directory_path is not None else None)
+    request_scheduler = RequestScheduler(registry_limits, request_timeout=request_timeout_seconds)
+    proxy = RegistryProxy(upstreams, registry_credentials, request_scheduler, cache, ttl, access_token)
+    server = RegistryProxyServer(proxy, host, port)
+    log.info(f"Serving registry proxy for {', '.join(upstreams)} on {server.url}, stats are available at {server.url}/_infrapatch/stats.")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        request_scheduler.close()
+
+
+@main.group()
+def cache():
+    """Manages the persistent registry cache configured with --cache-directory."""
+    pass
+
+
+@cache.command()
+@catch_exception(handle=Exception)
+def warm():
+    """Looks up all modules and providers in the working directory and stores them in the registry cache."""
+    provider_handler, registry_cache = _get_cache_context()
+    resources = provider_handler.get_resources()
+    print(f"Warmed registry cache with {sum(len(provider_resources) for provider_resources in resources.values())} resources.")
+    _print_cache_stats(registry_cache)
+
+
+@cache.command(name="export")
+@click.argument("archive")
+@catch_exception(handle=Exception)
+def export_cache(archive: str):
+    """Exports the registry cache to an archive, compressed with gzip if the archive ends with .gz."""
+    _, registry_cache = _get_cache_context()
+    registry_cache.export_cache(Path(archive))
+    print(f"Exported registry cache to '{archive}'.")
+
+
+@cache.command(name="import")
+@click.argument("archive")
+@catch_exception(handle=Exception)
+def import_cache(archive: str):
+    """Imports a registry cache archive, entries newer than the ones in the cache replace them."""
+    _, registry_cache = _get_cache_context()
+    imported = registry_cache.import_cache(Path(archive))
+    print(f"Imported {imported} entries from '{archive}'.")
+
+
+@cache.command()
+@click.option("--max-age", default=None, type=float, help="Maximum age in seconds of the entries to keep. Defaults to the cache ttl.")
+@catch_exception(handle=Exception)
+def prune(max_age: Union[float, None]):
+    """Removes old entries from the registry cache."""
+    _, registry_cache = _get_cache_context()
+    print(f"Pruned {registry_cache.prune(max_age)} entries from the registry cache.")
+
+
+@cache.command()
+@catch_exception(handle=Exception)
+def stats():
+    """Prints size, hit ratio and age distribution of the registry cache."""
+    _, registry_cache = _get_cache_context()
+    _print_cache_stats(registry_cache)
+
+
+def _get_cache_context() -> tuple[ProviderHandler, PersistentRegistryCache]:
+    if registry_cache is None:
+        raise Exception("No cache directory configured, use --cache-directory to enable the registry cache.")
+    if provider_handler is None:
+        raise Exception("provider_handler not initialized.")
+    return provider_handler, registry_cache
+
+
+def _print_cache_stats(registry_cache: PersistentRegistryCache) -> None:
+    cache_stats = registry_cache.get_stats()
+    table = Table(show_header=True, title="Registry Cache", expand=True)
+    table.add_column("Statistic")
+    table.add_column("Value")
+    for key, value in cache_stats.items():
+        if key == "age":
+            continue
+        table.add_row(key, str(value))
+    for bucket, count in cache_stats["age"].items():
+        table.add_row(f"age {bucket}", str(count))
+    Console(width=cs.CLI_WIDTH).print(table)
+
+
+def _parse_key_value_pairs(values: tuple[str, ...], option_name: str) -> dict[str, str]:
+    pairs = {}
+    for value in values:
+        try:
+            key, pair_value = value.split("=", 1)
+        except ValueError:
+            raise Exception(f"Invalid value '{value}' for {option_name}, expected format '<key>=<value>'.")
+        pairs[key.strip()] = pair_value.strip()
+    return pairs
+
+
 if __name__ == "__main__":
     main()
@@ -6,4 +6,16 @@ APP_NAME = "InfraPatch"
 
 DEFAULT_CREDENTIALS_FILE_NAME = "infrapatch_credentials.json"
 
+# Journal of the progress of a run in the working directory, used to resume interrupted runs
+CHECKPOINT_FILE_NAME = "infrapatch_checkpoint.jsonl"
+
 infrapatch_options_prefix = "# infrapatch_options:"
+
+# Number of parallel workers used to resolve resource versions from the registries
+DEFAULT_RESOLVE_WORKERS = 32
+
+# Number of parallel workers used to get release notes from GitHub
+DEFAULT_RELEASE_NOTES_WORKERS = 8
+
+# Number of .tf files which are parsed and resolved at once when the statistics are streamed
+DEFAULT_STREAM_CHUNK_SIZE = 500
@@ -1,29 +1,50 @@
-from typing import Union
+from typing import Any, Union
 import json
 import logging as log
 import infrapatch.core.constants as cs
 from pathlib import Path
 
+from infrapatch.core.utils.request_scheduler import HostLimits
 from infrapatch.core.utils.terraform.hcl_handler import HclHandler
 
 
 def get_registry_credentials(hcl_handler: HclHandler, credentials_file: Union[Path, None] = None) -> dict[str, str]:
     credentials = hcl_handler.get_credentials_form_user_rc_file()
+    for name, value in _read_credentials_file(credentials_file).items():
+        # registries can either be configured with a plain token or with an object containing the token and request limits
+        token = value.get("token") if isinstance(value, dict) else value
+        if token is None:
+            continue
+        log.debug(f"Found the following credentials in credentials file: {name}={token[0:5]}...")
+        if name in credentials:
+            log.debug(f"Credentials for registry '{name}' already found in terraformrc file and credentials file, using value from credentials file.")
+        credentials[name] = token
+    return credentials
+
+
+def get_registry_limits(credentials_file: Union[Path, None] = None) -> dict[str, HostLimits]:
+    limits: dict[str, HostLimits] = {}
+    for name, value in _read_credentials_file(credentials_file).items():
+        if not isinstance(value, dict):
+            continue
+        limit_values = {key: limit for key, limit in value.items() if key != "token"}
+        if len(limit_values) == 0:
+            continue
+        limits[name] = HostLimits.from_dict(limit_values)
+        log.debug(f"Found the following limits for registry '{name}' in credentials file: {limits[name]}")
+    return limits
+
+
+def _read_credentials_file(credentials_file: Union[Path, None] = None) -> dict[str, Any]:
     if credentials_file is None:
         credentials_file = Path.cwd().joinpath(cs.DEFAULT_CREDENTIALS_FILE_NAME)
     else:
         credentials_file = Path(credentials_file)
     if not credentials_file.exists() or not credentials_file.is_file():
         log.debug(f"No credentials file found at '{credentials_file}'.")
-        return credentials
+        return {}
     try:
         with open(credentials_file.absolute(), "r") as file:
-            credentials_file_dict = json.load(file)
-            for name, token in credentials_file_dict.items():
-                log.debug(f"Found the following credentials in credentials file: {name}={token[0:5]}...")
-                if name in credentials:
-                    log.debug(f"Credentials for registry '{name}' already found in terraformrc file and credentials file, using value from credentials file.")
-                credentials[name] = token
-        return credentials
+            return json.load(file)
     except Exception as e:
         raise Exception(f"Could not read credentials file: {e}")
@@ -0,0 +1,119 @@
+import json
+import logging as log
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Sequence, Union
+
+from rich.table import Table
+
+from infrapatch.core.models.statistics import Statistics
+from infrapatch.core.provider_handler import ProviderHandler
+
+
+class FleetException(Exception):
+    pass
+
+
+@dataclass
+class FleetRepositoryResult:
+    path: Path
+    statistics: Union[Statistics, None] = None
+    error: Union[str, None] = None
+
+
+# Processes multiple repository checkouts concurrently.
+# The provider handlers are expected to share their registry handler, so each source is only resolved once for all repositories.
+class Fleet:
+    def __init__(self, create_provider_handler: Callable[[Path], ProviderHandler], max_workers: int = 4):
+        self.create_provider_handler = create_provider_handler
+        self.max_workers = max_workers
+
+    def run(self, repositories: Sequence[Path], update: bool = False) -> list[FleetRepositoryResult]:
+        if len(repositories) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(repositories)), thread_name_prefix="infrapatch-fleet") as executor:
+            # the results keep the order of the repositories
+            return list(executor.map(lambda repository: self._process_repository(repository, update), repositories))
+
+    def _process_repository(self, repository: Path, update: bool) -> FleetRepositoryResult:
+        log.info(f"Processing repository '{repository}'...")
+        try:
+            provider_handler = self.create_provider_handler(repository)
+            provider_handler.get_resources()
+            if update:
+                provider_handler.upgrade_resources()
+            statistics = provider_handler._get_statistics()
+        except Exception as e:
+            # a single failing repository does not abort the whole fleet
+            log.error(f"Error processing repository '{repository}': {e}")
+            return FleetRepositoryResult(path=repository, error=str(e))
+        log.info(f"Processed repository '{repository}' with {statistics.total_resources} resources.")
+        return FleetRepositoryResult(path=repository, statistics=statistics)
+
+
+def read_fleet_manifest(manifest: Path) -> list[Path]:
+    # one repository path per line, relative paths are relative to the manifest, lines starting with # are ignored
+    if not manifest.is_file():
+        raise FleetException(f"Fleet manifest '{manifest}' does not exist.")
+    repositories = []
+    for line in manifest.read_text().splitlines():
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        path = Path(line)
+        repositories.append(path if path.is_absolute() else manifest.parent.joinpath(path))
+    return repositories
+
+
+def get_fleet_statistics(results: Sequence[FleetRepositoryResult]) -> dict[str, Any]:
+    total = {
+        "repositories": len(results),
+        "failed_repositories": 0,
+        "errors": 0,
+        "resources_patched": 0,
+        "resources_pending_update": 0,
+        "resources_timed_out": 0,
+        "total_resources": 0,
+    }
+    repositories = []
+    for result in results:
+        repository: dict[str, Any] = {"path": result.path.as_posix(), "error": result.error, "statistics": None}
+        if result.statistics is None:
+            total["failed_repositories"] += 1
+        else:
+            repository["statistics"] = result.statistics.model_dump(mode="json")
+            for key in ["errors", "resources_patched", "resources_pending_update", "resources_timed_out", "total_resources"]:
+                total[key] += getattr(result.statistics, key)
+        repositories.append(repository)
+    return {"total": total, "repositories": repositories}
+
+
+def dump_fleet_statistics(results: Sequence[FleetRepositoryResult], statistics_file: Path) -> None:
+    log.debug(f"Writing fleet statistics to {statistics_file.absolute().as_posix()}.")
+    with open(statistics_file, "w") as file:
+        json.dump(get_fleet_statistics(results), file)
+
+
+def get_fleet_table(results: Sequence[FleetRepositoryResult]) -> Table:
+    table = Table(show_header=True, title="Fleet Statistics", expand=True)
+    table.add_column("Repository")
+    table.add_column("Errors")
+    table.add_column("Patched")
+    table.add_column("Pending Update")
+    table.add_column("Timed Out")
+    table.add_column("Total")
+    for result in results:
+        if result.statistics is None:
+            table.add_row(result.path.as_posix(), f"[red]{result.error}", "", "", "", "")
+            continue
+        statistics = result.statistics
+        table.add_row(
+            result.path.as_posix(),
+            str(statistics.errors),
+            str(statistics.resources_patched),
+            str(statistics.resources_pending_update),
+            str(statistics.resources_timed_out),
+            str(statistics.total_resources),
+        )
+    return table
@@ -1,5 +1,5 @@
 from typing import Any, Sequence
-from pydantic import BaseModel
+from pydantic import BaseModel, SerializeAsAny
 from pytablewriter import MarkdownTableWriter
 from rich.table import Table
 from infrapatch.core.models.versioned_resource import VersionedResource
@@ -9,6 +9,7 @@ class BaseStatistics(BaseModel):
     errors: int
     resources_patched: int
     resources_pending_update: int
+    resources_timed_out: int = 0
     total_resources: int
 
     def to_dict(self) -> dict[str, Any]:
@@ -16,7 +17,8 @@ class BaseStatistics(BaseModel):
 
 
 class ProviderStatistics(BaseStatistics):
-    resources: Sequence[VersionedResource]
+    # the resources are serialized with the fields of their subclass, e.g. the source of terraform resources
+    resources: Sequence[SerializeAsAny[VersionedResource]]
 
 
 class Statistics(BaseStatistics):
@@ -27,12 +29,14 @@ class Statistics(BaseStatistics):
         table.add_column("Errors")
         table.add_column("Patched")
         table.add_column("Pending Update")
+        table.add_column("Timed Out")
         table.add_column("Total")
         table.add_column("Enabled Providers")
         table.add_row(
             str(self.errors),
             str(self.resources_patched),
             str(self.resources_pending_update),
+            str(self.resources_timed_out),
             str(self.total_resources),
             str(len(self.providers)),
         )
@@ -43,6 +47,7 @@ class Statistics(BaseStatistics):
             "Errors": self.errors,
             "Patched": self.resources_patched,
             "Pending Update": self.resources_pending_update,
+            "Timed Out": self.resources_timed_out,
             "Total": self.total_resources,
             "Enabled Providers": len(self.providers),
         }
@@ -86,6 +86,14 @@ def test_version_not_found():
     assert resource.installed_version_equal_or_newer_than_new_version() is True
 
 
+def test_timed_out():
+    resource = VersionedResource(name="test_resource", current_version="1.0.0", source_file=Path("test_file.py"), start_line_number=1)
+    resource.set_timed_out()
+    assert resource.status == ResourceStatus.TIMED_OUT
+    assert resource.installed_version_equal_or_newer_than_new_version() is True
+    assert resource.check_if_up_to_date() is True
+
+
 def test_path():
     resource = VersionedResource(name="test_resource", current_version="1.0.0", source_file=Path("/var/testdir/test_file.py"), start_line_number=1)
     assert resource.source_file == Path("/var/testdir/test_file.py")
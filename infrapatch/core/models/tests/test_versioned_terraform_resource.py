@@ -1,8 +1,9 @@
 from pathlib import Path, PosixPath
 
 import pytest
+from pydantic import ValidationError
 
-from infrapatch.core.models.versioned_terraform_resources import TerraformModule, TerraformProvider
+from infrapatch.core.models.versioned_terraform_resources import TerraformGitModule, TerraformModule, TerraformProvider
 
 
 def test_attributes():
@@ -34,6 +35,13 @@ def test_attributes():
     assert provider.base_domain == "testregistry.ch"
     assert provider.identifier == "test_provider/test_provider"
 
+    # test with a registry domain with multiple labels
+    module = TerraformModule(
+        name="test_resource", current_version="1.0.0", source_file=Path("test_file.py"), source_string="app.terraform.io/test/test_module/test_provider", start_line_number=1
+    )
+    assert module.base_domain == "app.terraform.io"
+    assert module.identifier == "test/test_module/test_provider"
+
     # test invalid sources
     with pytest.raises(Exception):
         TerraformModule(name="test_resource", current_version="1.0.0", source_file=Path("test_file.py"), source_string="test/test_module/test_provider/test", start_line_number=1)
@@ -102,3 +110,73 @@ def test_to_dict():
             "ignore_resource": False,
         },
     }
+
+
+def test_git_module_attributes():
+    module = TerraformGitModule(
+        name="test_resource",
+        current_version="1.0.0",
+        source_file=Path("test_file.tf"),
+        source_string="git::https://example.com/test/repo.git//modules/vpc?ref=v1.0.0",
+        start_line_number=1,
+    )
+    assert module.repository_url == "https://example.com/test/repo.git"
+    assert module.subdirectory == "modules/vpc"
+    assert module.ref == "v1.0.0"
+    assert module.ref_prefix == "v"
+    assert module.identifier == "https://example.com/test/repo.git//modules/vpc"
+    assert module.get_source_with_ref("v1.1.0") == "git::https://example.com/test/repo.git//modules/vpc?ref=v1.1.0"
+
+    module = TerraformGitModule(
+        name="test_resource", current_version="1.0.0", source_file=Path("test_file.tf"), source_string="github.com/test/repo?ref=1.0.0", start_line_number=1
+    )
+    assert module.repository_url == "https://github.com/test/repo"
+    assert module.subdirectory is None
+    assert module.ref_prefix == ""
+
+    module = TerraformGitModule(
+        name="test_resource", current_version="1.0.0", source_file=Path("test_file.tf"), source_string="git@github.com:test/repo.git?depth=1&ref=v1.0.0", start_line_number=1
+    )
+    assert module.repository_url == "git@github.com:test/repo.git"
+    assert module.get_source_with_ref("v2.0.0") == "git@github.com:test/repo.git?depth=1&ref=v2.0.0"
+
+    with pytest.raises(Exception):
+        TerraformGitModule(name="test_resource", current_version="1.0.0", source_file=Path("test_file.tf"), source_string="test/test_module/test_provider", start_line_number=1)
+
+
+def test_sources_are_shared_and_updated():
+    modules = [
+        TerraformModule(
+            name=f"test_resource{index}", current_version="1.0.0", source_file=Path("test_file.tf"), source_string="Test/Test_Module/Test_Provider", start_line_number=index
+        )
+        for index in range(2)
+    ]
+    # resources with the same source share the parsed source string
+    assert modules[0].source == "test/test_module/test_provider"
+    assert modules[0].source is modules[1].source
+
+    modules[0].newest_version = "2.0.0"
+    modules[0].source = "testregistry.ch/test/test_module/test_provider"
+    assert modules[0].base_domain == "testregistry.ch"
+    assert modules[0].identifier == "test/test_module/test_provider"
+    assert modules[0].newest_version is None
+    # the parsed fields are kept when the resources are loaded from the statistics
+    assert TerraformModule.model_validate(modules[1].model_dump()) == modules[1]
+
+
+def test_versions_and_options_are_shared():
+    modules = [
+        TerraformModule(
+            name="".join(["test", "_resource"]),
+            current_version=".".join(["1", "0", "0"]),
+            source_file=Path("test_file.tf"),
+            source_string="test/test/test",
+            start_line_number=index,
+        )
+        for index in range(2)
+    ]
+    assert modules[0].name is modules[1].name
+    assert modules[0].current_version is modules[1].current_version
+    assert modules[0].options is modules[1].options
+    with pytest.raises(ValidationError):
+        modules[0].options.ignore_resource = True  # type: ignore
@@ -1,12 +1,17 @@
+import functools
 import logging as log
 import re
+import sys
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
 from urllib.parse import urlparse
 
 import semantic_version
-from git import Sequence
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+# compiled once, since versions are checked for every resource of a scan
+EXACT_VERSION_PATTERN = re.compile(r"^[0-9]+\.[0-9]+\.[0-9]+$")
+TILDE_CONSTRAINT_PATTERN = re.compile(r"^~>[0-9]+\.[0-9]+\.[0-9]+$")
 
 
 class ResourceStatus:
@@ -15,12 +20,19 @@ class ResourceStatus:
     PATCHED = "patched"
     PATCH_ERROR = "patch_error"
     NO_VERSION_FOUND = "no_version_found"
+    TIMED_OUT = "timed_out"
 
 
 class VersionedResourceOptions(BaseModel):
+    # frozen, so resources without options can share one instance, options of a resource are replaced instead of changed
+    model_config = ConfigDict(frozen=True)
+
     ignore_resource: bool = False
 
 
+DEFAULT_OPTIONS = VersionedResourceOptions()
+
+
 class VersionedResource(BaseModel):
     name: str
     current_version: str
@@ -29,7 +41,16 @@ class VersionedResource(BaseModel):
     newest_version_string: Optional[str] = None
     status: str = ResourceStatus.UNPATCHED
     github_repo_string: Optional[str] = None
-    options: VersionedResourceOptions = VersionedResourceOptions()
+    # a factory instead of a default instance, which would be deep copied for every resource
+    options: VersionedResourceOptions = Field(default_factory=lambda: DEFAULT_OPTIONS)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _intern_strings(cls, values: Any) -> Any:
+        # names and versions repeat across the files of a repository, the parsed strings are shared instead of kept per resource
+        if not isinstance(values, dict):
+            return values
+        return {**values, **{key: sys.intern(values[key]) for key in ["name", "current_version"] if type(values.get(key)) is str}}
 
     @property
     def resource_name(self):
@@ -83,14 +104,14 @@ class VersionedResource(BaseModel):
     def set_no_version_found(self):
         self.status = ResourceStatus.NO_VERSION_FOUND
 
+    def set_timed_out(self):
+        self.status = ResourceStatus.TIMED_OUT
+
     def set_up_to_date(self):
         self.status = ResourceStatus.UP_TO_DATE
 
     def has_tile_constraint(self) -> bool:
-        result = re.match(r"^~>[0-9]+\.[0-9]+\.[0-9]+$", self.current_version)
-        if result is None:
-            return False
-        return True
+        return TILDE_CONSTRAINT_PATTERN.match(self.current_version) is not None
 
     def set_patch_error(self):
         self.status = ResourceStatus.PATCH_ERROR
@@ -100,30 +121,30 @@ class VersionedResource(BaseModel):
         return result
 
     def installed_version_equal_or_newer_than_new_version(self):
-        if self.status == ResourceStatus.NO_VERSION_FOUND:
+        if self.status == ResourceStatus.NO_VERSION_FOUND or self.status == ResourceStatus.TIMED_OUT:
             return True
         if self.newest_version_string is None:
             raise Exception(f"Newest version of resource '{self.name}' is not set.")
 
-        newest = semantic_version.Version(self.newest_version_base)
+        newest = parse_version(self.newest_version_base)
 
         # check if the current version has the following format: "1.2.3"
-        if re.match(r"^[0-9]+\.[0-9]+\.[0-9]+$", self.current_version):
-            current = semantic_version.Version(self.current_version)
+        if EXACT_VERSION_PATTERN.match(self.current_version):
+            current = parse_version(self.current_version)
             if current >= newest:
                 return True
             return False
 
         # chech if the current version has the following format: "~>3.76.0"
         if self.has_tile_constraint():
-            current = semantic_version.Version(self.current_version.strip("~>"))
+            current = parse_version(self.current_version.strip("~>"))
             if current.major > newest.major:  # type: ignore
                 return True
             if current.minor >= newest.minor:  # type: ignore
                 return True
             return False
 
-        current_constraint = semantic_version.NpmSpec(self.current_version)
+        current_constraint = _parse_constraint(self.current_version)
         if newest in current_constraint:
             return True
         return False
@@ -141,6 +162,17 @@ class VersionedResource(BaseModel):
         return self.model_dump()
 
 
+# most resources of a repository share a few versions and constraints, so they are only parsed once
+@functools.lru_cache(maxsize=4096)
+def parse_version(version: str) -> semantic_version.Version:
+    return semantic_version.Version(version)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_constraint(constraint: str) -> semantic_version.NpmSpec:
+    return semantic_version.NpmSpec(constraint)
+
+
 class VersionedResourceReleaseNotes(BaseModel):
     resources: Sequence[VersionedResource]
     name: str
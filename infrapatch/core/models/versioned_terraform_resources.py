@@ -1,9 +1,20 @@
+import functools
 import logging as log
 import re
-from typing import Optional
+import sys
+from typing import Any, Optional
+from urllib.parse import parse_qs
+
+from pydantic import model_validator
 
 from infrapatch.core.models.versioned_resource import VersionedResource
 
+MODULE_GENERIC_REGISTRY_PATTERN = re.compile(r"^(?:[a-zA-Z0-9-]+\.)+[a-zA-Z0-9-]+/[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+$")
+MODULE_PUBLIC_REGISTRY_PATTERN = re.compile(r"^[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+$")
+PROVIDER_GENERIC_REGISTRY_PATTERN = re.compile(r"^(?:[a-zA-Z0-9-]+\.)+[a-zA-Z0-9-]+/[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+$")
+PROVIDER_PUBLIC_REGISTRY_PATTERN = re.compile(r"^[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+$")
+GIT_SSH_SOURCE_PATTERN = re.compile(r"^git@[^:]+:")
+
 
 class VersionedTerraformResource(VersionedResource):
     source_string: str
@@ -26,8 +37,11 @@ class VersionedTerraformResource(VersionedResource):
 
 
 class TerraformModule(VersionedTerraformResource):
-    def model_post_init(self, __context):
-        self.source = self.source_string
+    @model_validator(mode="before")
+    @classmethod
+    def _parse_source(cls, values: Any) -> Any:
+        # the source is parsed before the validation instead of assigning every field afterwards, which is slow for pydantic models
+        return _with_parsed_registry_source(values, MODULE_GENERIC_REGISTRY_PATTERN, MODULE_PUBLIC_REGISTRY_PATTERN)
 
     @property
     def source(self) -> str:
@@ -39,23 +53,15 @@ class TerraformModule(VersionedTerraformResource):
 
     @source.setter
     def source(self, source: str):
-        source_lower_case = source.lower()
-        self.source_string = source_lower_case
+        self.source_string, self.base_domain, self.identifier = parse_registry_source(source, MODULE_GENERIC_REGISTRY_PATTERN, MODULE_PUBLIC_REGISTRY_PATTERN)
         self.newest_version_string = None
-        if re.match(r"^[a-zA-Z0-9-]+\.[a-zA-Z0-9-]+/[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+$", source_lower_case):
-            log.debug(f"Source '{source_lower_case}' is from a generic registry.")
-            self.base_domain = source_lower_case.split("/")[0]
-            self.identifier = "/".join(source_lower_case.split("/")[1:])
-        elif re.match(r"^[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+$", source_lower_case):
-            log.debug(f"Source '{source_lower_case}' is from the public registry.")
-            self.identifier = source_lower_case
-        else:
-            raise Exception(f"Source '{source_lower_case}' is not a valid terraform resource source.")
 
 
 class TerraformProvider(VersionedTerraformResource):
-    def model_post_init(self, __context):
-        self.source = self.source_string
+    @model_validator(mode="before")
+    @classmethod
+    def _parse_source(cls, values: Any) -> Any:
+        return _with_parsed_registry_source(values, PROVIDER_GENERIC_REGISTRY_PATTERN, PROVIDER_PUBLIC_REGISTRY_PATTERN)
 
     @property
     def source(self) -> str:
@@ -67,15 +73,85 @@ class TerraformProvider(VersionedTerraformResource):
 
     @source.setter
     def source(self, source: str) -> None:
-        source_lower_case = source.lower()
-        self.source_string = source_lower_case
+        self.source_string, self.base_domain, self.identifier = parse_registry_source(source, PROVIDER_GENERIC_REGISTRY_PATTERN, PROVIDER_PUBLIC_REGISTRY_PATTERN)
+        self.newest_version_string = None
+
+
+class TerraformGitModule(VersionedTerraformResource):
+    repository_url: Optional[str] = None
+    subdirectory: Optional[str] = None
+    ref: Optional[str] = None
+
+    def model_post_init(self, __context):
+        self.source = self.source_string
+
+    @property
+    def source(self) -> str:
+        return self.source_string
+
+    @property
+    def resource_name(self):
+        return "Terraform Git Module"
+
+    @property
+    def ref_prefix(self) -> str:
+        # tags like "v1.2.3" are compared as versions, the prefix is kept when the ref is updated
+        if self.ref is not None and self.ref.startswith("v"):
+            return "v"
+        return ""
+
+    @source.setter
+    def source(self, source: str):
+        if not is_git_source(source):
+            raise Exception(f"Source '{source}' is not a valid git module source.")
+        self.source_string = source
         self.newest_version_string = None
-        if re.match(r"^[a-zA-Z0-9-]+\.[a-zA-Z0-9-]+/[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+$", source_lower_case):
-            log.debug(f"Source '{source_lower_case}' is from a generic registry.")
-            self.base_domain = source_lower_case.split("/")[0]
-            self.identifier = "/".join(source_lower_case.split("/")[1:])
-        elif re.match(r"^[a-zA-Z0-9-_]+/[a-zA-Z0-9-_]+$", source_lower_case):
-            log.debug(f"Source '{source_lower_case}' is from the public registry.")
-            self.identifier = source_lower_case
-        else:
-            raise Exception(f"Source '{source_lower_case}' is not a valid terraform resource source.")
+        self.repository_url, self.subdirectory, self.ref = parse_git_source(source)
+        self.identifier = self.repository_url if self.subdirectory is None else f"{self.repository_url}//{self.subdirectory}"
+        log.debug(f"Source '{source}' is from the git repository '{self.repository_url}'.")
+
+    def get_source_with_ref(self, ref: str) -> str:
+        return re.sub(r"([?&])ref=[^&]*", lambda match: f"{match.group(1)}ref={ref}", self.source_string)
+
+
+def is_git_source(source: str) -> bool:
+    return source.startswith("git::") or source.startswith("github.com/") or GIT_SSH_SOURCE_PATTERN.match(source) is not None
+
+
+# most sources are used by many resources, so they are only classified once and share one interned string
+@functools.lru_cache(maxsize=8192)
+def parse_registry_source(source: str, generic_registry_pattern: re.Pattern, public_registry_pattern: re.Pattern) -> tuple[str, Optional[str], str]:
+    # returns the lower case source, the base domain of a generic registry and the identifier within the registry
+    source_lower_case = sys.intern(source.lower())
+    if generic_registry_pattern.match(source_lower_case):
+        log.debug(f"Source '{source_lower_case}' is from a generic registry.")
+        base_domain, identifier = source_lower_case.split("/", 1)
+        return source_lower_case, sys.intern(base_domain), sys.intern(identifier)
+    if public_registry_pattern.match(source_lower_case):
+        log.debug(f"Source '{source_lower_case}' is from the public registry.")
+        return source_lower_case, None, source_lower_case
+    raise Exception(f"Source '{source_lower_case}' is not a valid terraform resource source.")
+
+
+def _with_parsed_registry_source(values: Any, generic_registry_pattern: re.Pattern, public_registry_pattern: re.Pattern) -> Any:
+    if not isinstance(values, dict) or not isinstance(values.get("source_string"), str):
+        return values
+    source_string, base_domain, identifier = parse_registry_source(values["source_string"], generic_registry_pattern, public_registry_pattern)
+    return {**values, "source_string": source_string, "base_domain": base_domain, "identifier": identifier}
+
+
+def parse_git_source(source: str) -> tuple[str, Optional[str], Optional[str]]:
+    # returns the repository url, the subdirectory and the ref of sources like git::https://example.com/repo.git//modules/vpc?ref=v1.2.3
+    address = source.removeprefix("git::")
+    query = ""
+    if "?" in address:
+        address, query = address.split("?", 1)
+    ref = parse_qs(query).get("ref", [None])[0]
+    scheme_end = address.find("://")
+    subdirectory_start = address.find("//", scheme_end + 3 if scheme_end >= 0 else 0)
+    subdirectory = None
+    if subdirectory_start >= 0:
+        address, subdirectory = address[:subdirectory_start], address[subdirectory_start + 2 :]
+    if address.startswith("github.com/"):
+        address = f"https://{address}"
+    return address, subdirectory, ref
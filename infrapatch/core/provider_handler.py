@@ -1,21 +1,58 @@
 import logging as log
+import re
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, as_completed
 from pathlib import Path
 from typing import Sequence, Union
 
-from git import Repo
 from pytablewriter import MarkdownTableWriter
 from rich import progress
 from rich.console import Console
 
+import infrapatch.core.constants as cs
 from infrapatch.core.models.statistics import ProviderStatistics, Statistics
 from infrapatch.core.models.versioned_resource import ResourceStatus, VersionedResource, VersionedResourceReleaseNotes
 from infrapatch.core.providers.base_provider_interface import BaseProviderInterface
+from infrapatch.core.utils.checkpoint import CheckpointJournal
+from infrapatch.core.utils.git import Git
 from infrapatch.core.utils.options_processor import OptionsProcessorInterface
+from infrapatch.core.utils.run_budget import BudgetPhase, RunBudget
+from infrapatch.core.utils.statistics_stream import StatisticsCounter, StatisticsStreamWriter
+
+
+class CommitGrouping:
+    RESOURCE = "resource"
+    FILE = "file"
+    PROVIDER = "provider"
+    SINGLE = "single"
+
+    @classmethod
+    def all(cls) -> list[str]:
+        return [cls.RESOURCE, cls.FILE, cls.PROVIDER, cls.SINGLE]
+
+
+class ResourceGrouping:
+    PROVIDER = "provider"  # one group per provider, e.g. terraform modules and terraform providers
+    SOURCE = "source"  # one group per module or provider source
+    DIRECTORY = "directory"  # one group per directory containing terraform files
+
+    @classmethod
+    def all(cls) -> list[str]:
+        return [cls.PROVIDER, cls.SOURCE, cls.DIRECTORY]
 
 
 class ProviderHandler:
     def __init__(
-        self, providers: Sequence[BaseProviderInterface], console: Console, statistics_file: Path, options_processor: OptionsProcessorInterface, repo: Union[Repo, None] = None
+        self,
+        providers: Sequence[BaseProviderInterface],
+        console: Console,
+        statistics_file: Path,
+        options_processor: OptionsProcessorInterface,
+        git: Union[Git, None] = None,
+        run_budget: Union[RunBudget, None] = None,
+        release_notes_workers: int = cs.DEFAULT_RELEASE_NOTES_WORKERS,
+        commit_grouping: str = CommitGrouping.RESOURCE,
+        show_progress: bool = True,
+        checkpoint_journal: Union[CheckpointJournal, None] = None,
     ) -> None:
         self.providers: dict[str, BaseProviderInterface] = {}
         for provider in providers:
@@ -24,8 +61,15 @@ class ProviderHandler:
         self._resource_cache: dict[str, Sequence[VersionedResource]] = {}
         self.console = console
         self.statistics_file = statistics_file
-        self.repo = repo
+        self.git = git
         self.options_processor = options_processor
+        self.run_budget = run_budget if run_budget is not None else RunBudget()
+        self.release_notes_workers = release_notes_workers
+        if commit_grouping not in CommitGrouping.all():
+            raise Exception(f"Unknown commit grouping '{commit_grouping}', supported groupings are: {', '.join(CommitGrouping.all())}.")
+        self.commit_grouping = commit_grouping
+        self.show_progress = show_progress
+        self.checkpoint_journal = checkpoint_journal
 
     def get_resources(self, disable_cache: bool = False) -> dict[str, Sequence[VersionedResource]]:
         for provider_name, provider in self.providers.items():
@@ -47,6 +91,27 @@ class ProviderHandler:
             self._resource_cache[provider.get_provider_name()] = un_ignored_resources
         return self._resource_cache
 
+    def rescan_changed_files(self, changed_files: Sequence[Path]) -> None:
+        # only the changed files are parsed again, the resources of all other files are kept including their resolved versions
+        if len(self._resource_cache) == 0:
+            self.get_resources()
+            return
+        changed = {file.absolute().resolve() for file in changed_files if file.suffix == ".tf"}
+        log.debug(f"Rescanning {len(changed)} changed .tf files.")
+        # the cache is only updated once all providers are rescanned, so a failed rescan keeps the previous resources
+        rescanned_resources: dict[str, Sequence[VersionedResource]] = {}
+        for provider_name, provider in self.providers.items():
+            if provider_name not in self._resource_cache:
+                continue
+            # copies, so resources handed out before the rescan are not changed by later patches
+            kept_resources = [resource.model_copy() for resource in self._resource_cache[provider_name] if resource.source_file.absolute().resolve() not in changed]
+            existing_files = sorted(file for file in changed if file.is_file())
+            changed_resources = provider.get_resources_from_files(existing_files) if len(existing_files) > 0 else []
+            for resource in changed_resources:
+                self.options_processor.process_options_for_resource(resource)
+            rescanned_resources[provider_name] = [*kept_resources, *[resource for resource in changed_resources if not resource.options.ignore_resource]]
+        self._resource_cache.update(rescanned_resources)
+
     def get_patched_resources(self) -> dict[str, Sequence[VersionedResource]]:
         resources = self.get_resources()
         patched_resources: dict[str, Sequence[VersionedResource]] = {}
@@ -68,29 +133,134 @@ class ProviderHandler:
                 return True
         return False
 
+    def get_upgradable_resource_groups(self, grouping: str, root: Path) -> dict[str, dict[str, Sequence[VersionedResource]]]:
+        # group names only contain characters which are valid in branch names
+        if grouping not in ResourceGrouping.all():
+            raise Exception(f"Unknown resource grouping '{grouping}', supported groupings are: {', '.join(ResourceGrouping.all())}.")
+        groups: dict[str, dict[str, list[VersionedResource]]] = {}
+        for provider_name, resources in self.get_upgradable_resources().items():
+            for resource in resources:
+                group = _get_group_name(provider_name, resource, grouping, root)
+                groups.setdefault(group, {name: [] for name in self.providers})[provider_name].append(resource)
+        return dict(sorted(groups.items()))
+
+    def for_resources(self, resources: dict[str, Sequence[VersionedResource]], statistics_file: Union[Path, None] = None) -> "ProviderHandler":
+        # handler sharing the providers and resolved resources, which only upgrades and reports the given resources
+        provider_handler = ProviderHandler(
+            list(self.providers.values()),
+            self.console,
+            statistics_file if statistics_file is not None else self.statistics_file,
+            self.options_processor,
+            git=self.git,
+            run_budget=self.run_budget,
+            release_notes_workers=self.release_notes_workers,
+            commit_grouping=self.commit_grouping,
+            show_progress=self.show_progress,
+            checkpoint_journal=self.checkpoint_journal,
+        )
+        provider_handler._resource_cache = {provider_name: list(resources.get(provider_name, [])) for provider_name in self.providers}
+        return provider_handler
+
+    def split_by_roots(self, roots: Sequence[Path]) -> dict[Path, "ProviderHandler"]:
+        # resources of nested roots belong to the innermost root, the statistics of each root are written to the root directory
+        resolved_roots = sorted({root.absolute().resolve(): root for root in roots}.items(), key=lambda item: len(item[0].parts), reverse=True)
+        root_resources: dict[Path, dict[str, list[VersionedResource]]] = {root: {provider_name: [] for provider_name in self.providers} for _, root in resolved_roots}
+        for provider_name, resources in self.get_resources().items():
+            for resource in resources:
+                source_file = resource.source_file.absolute().resolve()
+                for resolved_root, root in resolved_roots:
+                    if source_file.is_relative_to(resolved_root):
+                        root_resources[root][provider_name].append(resource)
+                        break
+        return {
+            root: self.for_resources(root_resources[root], statistics_file=root.joinpath(self.statistics_file.name))
+            for root in sorted(root_resources, key=lambda root: root.as_posix())
+        }
+
     def upgrade_resources(self) -> bool:
         if self._resource_cache is None:
             raise Exception("No resources found. Run get_resources() first.")
-        if not self.check_if_upgrades_available():
+        resumed_resources = self._get_uncommitted_resumed_resources()
+        if not self.check_if_upgrades_available() and len([resource for resources in resumed_resources.values() for resource in resources]) == 0:
             log.info("No upgrades available.")
             return False
         upgradable_resources = self.get_upgradable_resources()
-        for provider_name, resources in upgradable_resources.items():
-            for resource in progress.track(resources, description=f"Upgrading resources for Provider {self.providers[provider_name].get_provider_display_name()}..."):
-                try:
-                    resource = self.providers[provider_name].patch_resource(resource)
-                except Exception as e:
-                    log.error(f"Error patching resource '{resource.name}': {e}")
-                    resource.set_patch_error()
-                    continue
-                resource.set_patched()
-                if self.repo is not None:
-                    log.debug(f"Commiting file: {resource.source_file.absolute().as_posix()} .")
-                    self.repo.index.add(resource.source_file.absolute().as_posix())
-                    self.repo.index.commit(f"Bump {resource.resource_name} '{resource.name}' from version '{resource.current_version}' to '{resource.newest_version}'.")
-
+        patched_resources: list[VersionedResource] = []
+        with self.run_budget.phase(BudgetPhase.PATCH):
+            for provider_name, resources in upgradable_resources.items():
+                # resources patched by an interrupted run are committed together with the resources patched now
+                provider_patched_resources = list(resumed_resources[provider_name])
+                if self.commit_grouping == CommitGrouping.RESOURCE:
+                    for resource in provider_patched_resources:
+                        self._commit([resource], f"Bump {resource.resource_name} '{resource.name}' to version '{resource.newest_version}'.")
+                provider_patched_resources.extend(self._upgrade_provider_resources(provider_name, resources))
+                if self.commit_grouping == CommitGrouping.FILE:
+                    self._commit_by_file(provider_patched_resources)
+                elif self.commit_grouping == CommitGrouping.PROVIDER:
+                    self._commit(
+                        provider_patched_resources, f"Bump {len(provider_patched_resources)} resources of Provider {self.providers[provider_name].get_provider_display_name()}."
+                    )
+                patched_resources.extend(provider_patched_resources)
+        if self.commit_grouping == CommitGrouping.SINGLE:
+            self._commit(patched_resources, f"Bump {len(patched_resources)} modules and providers.")
+        if self.git is not None:
+            self.git.sync_index()
         return True
 
+    def _get_uncommitted_resumed_resources(self) -> dict[str, Sequence[VersionedResource]]:
+        resumed_resources: dict[str, Sequence[VersionedResource]] = {provider_name: [] for provider_name in self.providers}
+        if self.checkpoint_journal is None or self.git is None:
+            return resumed_resources
+        for provider_name, resources in self.get_patched_resources().items():
+            resumed_resources[provider_name] = [resource for resource in resources if not self._is_committed(resource)]
+        return resumed_resources
+
+    def _is_committed(self, resource: VersionedResource) -> bool:
+        # commits of an interrupted run only count if they are still part of the checked out branch
+        if self.checkpoint_journal is None or self.git is None:
+            return False
+        commit = self.checkpoint_journal.get_commit(resource)
+        return commit is not None and self.git.contains_commit(commit)
+
+    def _upgrade_provider_resources(self, provider_name: str, resources: Sequence[VersionedResource]) -> list[VersionedResource]:
+        patched_resources: list[VersionedResource] = []
+        for i, resource in enumerate(
+            progress.track(
+                resources, description=f"Upgrading resources for Provider {self.providers[provider_name].get_provider_display_name()}...", disable=not self.show_progress
+            )
+        ):
+            if self.run_budget.expired():
+                log.warning(f"Time budget for patching exhausted, {len(resources) - i} resources of Provider {provider_name} remain pending.")
+                break
+            try:
+                resource = self.providers[provider_name].patch_resource(resource)
+            except Exception as e:
+                log.error(f"Error patching resource '{resource.name}': {e}")
+                resource.set_patch_error()
+                continue
+            resource.set_patched()
+            patched_resources.append(resource)
+            if self.commit_grouping == CommitGrouping.RESOURCE:
+                self._commit([resource], _get_commit_message(resource))
+        return patched_resources
+
+    def _commit_by_file(self, resources: Sequence[VersionedResource]) -> None:
+        resources_by_file: dict[Path, list[VersionedResource]] = {}
+        for resource in resources:
+            resources_by_file.setdefault(resource.source_file, []).append(resource)
+        for source_file, file_resources in resources_by_file.items():
+            message = _get_commit_message(file_resources[0]) if len(file_resources) == 1 else f"Bump {len(file_resources)} resources in '{source_file.name}'."
+            self._commit(file_resources, message)
+
+    def _commit(self, resources: Sequence[VersionedResource], message: str) -> None:
+        if self.git is None or len(resources) == 0:
+            return
+        files = sorted({resource.source_file.absolute() for resource in resources})
+        log.debug(f"Commiting files: {', '.join(file.as_posix() for file in files)} .")
+        commit = self.git.commit_files(files, message)
+        if commit is not None and self.checkpoint_journal is not None:
+            self.checkpoint_journal.record_commit(commit, resources)
+
     def print_resource_table(self, only_upgradable: bool, disable_cache: bool = False):
         provider_resources = self.get_resources(disable_cache)
         if len([resource for provider in provider_resources for resource in provider_resources[provider]]) == 0:
@@ -120,6 +290,7 @@ class ProviderHandler:
                 errors=len([resource for resource in provider_resources if resource.status == ResourceStatus.PATCH_ERROR]),
                 resources_patched=len([resource for resource in provider_resources if resource.status == ResourceStatus.PATCHED]),
                 resources_pending_update=len([resource for resource in provider_resources if resource.check_if_up_to_date() is False]),
+                resources_timed_out=len([resource for resource in provider_resources if resource.status == ResourceStatus.TIMED_OUT]),
                 total_resources=len(provider_resources),
                 resources=provider_resources,
             )
@@ -127,6 +298,7 @@ class ProviderHandler:
             errors=sum([provider_statistics[provider].errors for provider in provider_statistics]),
             resources_patched=sum([provider_statistics[provider].resources_patched for provider in provider_statistics]),
             resources_pending_update=sum([provider_statistics[provider].resources_pending_update for provider in provider_statistics]),
+            resources_timed_out=sum([provider_statistics[provider].resources_timed_out for provider in provider_statistics]),
             total_resources=sum([provider_statistics[provider].total_resources for provider in provider_statistics]),
             providers=provider_statistics,
         )
@@ -140,6 +312,34 @@ class ProviderHandler:
         with open(self.statistics_file, "w") as f:
             f.write(statistics.model_dump_json())
 
+    def stream_statistics(self, statistics_file: Path, only_upgradable: bool = False, chunk_size: int = cs.DEFAULT_STREAM_CHUNK_SIZE) -> Statistics:
+        # the resources are processed in chunks of files and written right away instead of being cached, so the memory does not grow with the number of resources
+        # returns the statistics without the resources
+        provider_statistics: dict[str, ProviderStatistics] = {}
+        with StatisticsStreamWriter(statistics_file) as writer:
+            for provider_name, provider in self.providers.items():
+                counter = StatisticsCounter()
+                for resources in provider.iter_resources(chunk_size):
+                    for resource in resources:
+                        self.options_processor.process_options_for_resource(resource)
+                        if resource.options.ignore_resource:
+                            continue
+                        counter.add(resource)
+                        if only_upgradable and resource.check_if_up_to_date():
+                            continue
+                        writer.write_resource(provider_name, resource)
+                provider_statistics[provider_name] = counter.get_provider_statistics()
+            statistics = Statistics(
+                errors=sum([provider_statistics[provider].errors for provider in provider_statistics]),
+                resources_patched=sum([provider_statistics[provider].resources_patched for provider in provider_statistics]),
+                resources_pending_update=sum([provider_statistics[provider].resources_pending_update for provider in provider_statistics]),
+                resources_timed_out=sum([provider_statistics[provider].resources_timed_out for provider in provider_statistics]),
+                total_resources=sum([provider_statistics[provider].total_resources for provider in provider_statistics]),
+                providers=provider_statistics,
+            )
+            writer.write_statistics(statistics)
+        return statistics
+
     def print_statistics_table(self, disable_cache: bool = False):
         table = self._get_statistics(disable_cache).get_rich_table()
         self.console.print(table)
@@ -175,19 +375,71 @@ class ProviderHandler:
                 self._resource_cache[provider_name][i] = found_resource  # type: ignore
 
     def get_release_notes(self, resources: dict[str, Sequence[VersionedResource]]) -> dict[str, Sequence[VersionedResourceReleaseNotes]]:
+        with self.run_budget.phase(BudgetPhase.RELEASE_NOTES):
+            return self._get_release_notes(resources)
+
+    def _get_release_notes(self, resources: dict[str, Sequence[VersionedResource]]) -> dict[str, Sequence[VersionedResourceReleaseNotes]]:
         release_notes: dict[str, Sequence[VersionedResourceReleaseNotes]] = {}
         for provider_name, provider in self.providers.items():
-            provider_release_notes: list[VersionedResourceReleaseNotes] = []
             patched_resources = [resource for resource in resources[provider_name] if resource.status == ResourceStatus.PATCHED]
             grouped_resources = provider.get_grouped_by_identifier(patched_resources)
-            for identifier in progress.track(grouped_resources, description=f"Getting release notes for resources of Provider {provider.get_provider_display_name()}..."):
-                identifier_resources = grouped_resources[identifier]
+            identifiers = []
+            for identifier, identifier_resources in grouped_resources.items():
                 if identifier_resources[0].status == ResourceStatus.NO_VERSION_FOUND:
                     log.debug(f"Skipping resource '{identifier_resources[0].name}' since no version was found.")
                     continue
-                resource_release_note = provider.get_resource_release_notes(grouped_resources[identifier][0])
-                if resource_release_note is not None:
-                    resource_release_note.resources = grouped_resources[identifier]
-                    provider_release_notes.append(resource_release_note)
-            release_notes[provider_name] = provider_release_notes
+                identifiers.append(identifier)
+            release_notes[provider_name] = self._get_provider_release_notes(provider, grouped_resources, identifiers)
         return release_notes
+
+    def _get_provider_release_notes(
+        self, provider: BaseProviderInterface, grouped_resources: dict[str, Sequence[VersionedResource]], identifiers: list[str]
+    ) -> list[VersionedResourceReleaseNotes]:
+        if len(identifiers) == 0:
+            return []
+        executor = ThreadPoolExecutor(max_workers=self.release_notes_workers, thread_name_prefix="infrapatch-release-notes")
+        futures: dict[Future, str] = {executor.submit(provider.get_resource_release_notes, grouped_resources[identifier][0]): identifier for identifier in identifiers}
+        results: dict[str, Union[VersionedResourceReleaseNotes, None]] = {}
+        try:
+            for future in progress.track(
+                as_completed(futures, timeout=self.run_budget.remaining()),
+                total=len(futures),
+                description=f"Getting release notes for resources of Provider {provider.get_provider_display_name()}...",
+                disable=not self.show_progress,
+            ):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    if not self.run_budget.expired():
+                        raise
+                    log.debug(f"Getting release notes of '{futures[future]}' failed after the time budget was exhausted: {e}")
+        except TimeoutError:
+            log.warning(f"Time budget for release notes exhausted, skipping {len(futures) - len(results)} release notes of Provider {provider.get_provider_display_name()}.")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # the release notes keep the order of the identifiers, independent of the order the lookups completed in
+        provider_release_notes: list[VersionedResourceReleaseNotes] = []
+        for identifier in identifiers:
+            resource_release_note = results.get(identifier)
+            if resource_release_note is not None:
+                resource_release_note.resources = grouped_resources[identifier]
+                provider_release_notes.append(resource_release_note)
+        return provider_release_notes
+
+
+def _get_commit_message(resource: VersionedResource) -> str:
+    return f"Bump {resource.resource_name} '{resource.name}' from version '{resource.current_version}' to '{resource.newest_version}'."
+
+
+def _get_group_name(provider_name: str, resource: VersionedResource, grouping: str, root: Path) -> str:
+    if grouping == ResourceGrouping.PROVIDER:
+        name = provider_name
+    elif grouping == ResourceGrouping.SOURCE:
+        name = getattr(resource, "identifier", None) or resource.name
+    else:
+        directory = resource.source_file.absolute().parent
+        name = directory.relative_to(root.absolute()).as_posix() if directory.is_relative_to(root.absolute()) else directory.as_posix()
+        if name == ".":
+            name = "root"
+    return re.sub(r"[^a-z0-9._]+", "-", name.lower()).strip("-.")
@@ -1,35 +1,152 @@
 import logging as log
 from pathlib import Path
-from typing import Self, Union
+from typing import Self, Sequence, Union
 
 from github import Github
 from infrapatch.core.providers.terraform.terraform_provider_provider import TerraformProviderProvider
 
 from infrapatch.core.providers.terraform.terraform_module_provider import TerraformModuleProvider
-from git import Repo
 from rich.console import Console
 
 import infrapatch.core.constants as const
 import infrapatch.core.constants as cs
-from infrapatch.core.provider_handler import ProviderHandler
+from infrapatch.core.provider_handler import CommitGrouping, ProviderHandler
+from infrapatch.core.utils.checkpoint import CheckpointJournal
+from infrapatch.core.utils.git import Git
 from infrapatch.core.utils.options_processor import OptionsProcessor
+from infrapatch.core.utils.release_notes_cache import ReleaseNotesCache
+from infrapatch.core.utils.request_scheduler import HostLimits, RequestScheduler
+from infrapatch.core.utils.run_budget import RunBudget
+from infrapatch.core.utils.shard import Shard
+from infrapatch.core.utils.terraform.git_source_handler import GitSourceHandler
 from infrapatch.core.utils.terraform.hcl_edit_cli import HclEditCli
 from infrapatch.core.utils.terraform.hcl_handler import HclHandler
+from infrapatch.core.utils.terraform.registry_cache import PersistentRegistryCache
 from infrapatch.core.utils.terraform.registry_handler import RegistryHandler
+from infrapatch.core.utils.terraform.registry_snapshot import CompositeRegistrySnapshot, ProviderMirrorSnapshot, RegistrySnapshotInterface, load_registry_snapshot
 
 
 class ProviderHandlerBuilder:
-    def __init__(self, working_directory: Path) -> None:
+    def __init__(self, working_directory: Path, run_budget: Union[RunBudget, None] = None) -> None:
         self.providers = []
         self.working_directory = working_directory
         self.registry_handler = None
-        self.git_repo = None
-        pass
+        self.registry_cache = None
+        self.release_notes_cache = None
+        self.changelog_range = False
+        self.commit_grouping = CommitGrouping.RESOURCE
+        self.git = None
+        self.git_source_handler = None
+        self.show_progress = True
+        self.roots: Union[list[Path], None] = None
+        self.shard: Union[Shard, None] = None
+        self.checkpoint_journal: Union[CheckpointJournal, None] = None
+        self.run_budget = run_budget if run_budget is not None else RunBudget()
 
-    def add_terraform_registry_configuration(self, default_registry_domain: str, credentials: dict[str, str]) -> Self:
+    def add_terraform_registry_configuration(
+        self,
+        default_registry_domain: str,
+        credentials: dict[str, str],
+        registry_limits: Union[dict[str, HostLimits], None] = None,
+        registry_snapshot: Union[Path, None] = None,
+        offline: bool = False,
+        registry_overrides: Union[dict[str, str], None] = None,
+        registry_cache: Union[PersistentRegistryCache, None] = None,
+        bulk_listing: bool = False,
+    ) -> Self:
         log.debug(f"Using {default_registry_domain} as default registry domain for Terraform.")
         log.debug(f"Found {len(credentials)} credentials for Terraform registries.")
-        self.registry_handler = RegistryHandler(default_registry_domain, credentials)
+        if registry_limits is not None:
+            log.debug(f"Found {len(registry_limits)} request limit configurations for Terraform registries.")
+        self.registry_cache = registry_cache
+        request_scheduler = RequestScheduler(registry_limits, request_timeout=self.run_budget.request_timeout)
+        snapshot = self._get_registry_snapshot(request_scheduler, registry_snapshot, offline)
+        if offline and snapshot is None:
+            raise Exception("Offline mode requires a registry snapshot or a local mirror directory configured as network mirror in the terraformrc file.")
+        if registry_overrides is not None:
+            for domain, url in registry_overrides.items():
+                log.debug(f"Using '{url}' instead of the registry '{domain}'.")
+        self.registry_handler = RegistryHandler(
+            default_registry_domain,
+            credentials,
+            request_scheduler,
+            self.run_budget,
+            snapshot=snapshot,
+            offline=offline,
+            registry_overrides=registry_overrides,
+            persistent_cache=registry_cache,
+            bulk_listing=bulk_listing,
+        )
+        return self
+
+    def with_registry_handler(self, registry_handler: RegistryHandler, registry_cache: Union[PersistentRegistryCache, None] = None) -> Self:
+        # shares the registry handler and its caches with other builders, e.g. when processing multiple projects
+        log.debug("Using existing registry handler.")
+        self.registry_handler = registry_handler
+        self.registry_cache = registry_cache
+        return self
+
+    def with_git_source_handler(self, git_source_handler: GitSourceHandler) -> Self:
+        # has to be added before the module provider, like the release notes cache
+        log.debug("Using existing git source handler.")
+        self.git_source_handler = git_source_handler
+        return self
+
+    def with_roots(self, patterns: Sequence[str]) -> Self:
+        # has to be added before the providers, the patterns are globs relative to the working directory
+        roots: list[Path] = []
+        for pattern in patterns:
+            matches = sorted(path for path in self.working_directory.glob(pattern) if path.is_dir())
+            if len(matches) == 0:
+                raise Exception(f"Root '{pattern}' does not match any directory in '{self.working_directory}'.")
+            roots.extend(match for match in matches if match not in roots)
+        log.debug(f"Using {len(roots)} roots: {', '.join(root.as_posix() for root in roots)}")
+        self.roots = roots
+        return self
+
+    def with_shard(self, shard: Shard) -> Self:
+        # has to be added before the providers, like the roots
+        log.debug(f"Only processing shard {shard.name} by {shard.mode}.")
+        self.shard = shard
+        return self
+
+    def with_checkpoint_journal(self, checkpoint_journal: CheckpointJournal) -> Self:
+        # has to be added before the providers, like the roots
+        log.debug(f"Recording progress in checkpoint journal '{checkpoint_journal.journal_file}'.")
+        self.checkpoint_journal = checkpoint_journal
+        return self
+
+    def without_progress(self) -> Self:
+        log.debug("Disabling progress bars.")
+        self.show_progress = False
+        return self
+
+    def _get_registry_snapshot(self, request_scheduler: RequestScheduler, registry_snapshot: Union[Path, None], offline: bool) -> Union[RegistrySnapshotInterface, None]:
+        snapshots: list[RegistrySnapshotInterface] = []
+        if registry_snapshot is not None:
+            log.debug(f"Using registry snapshot '{registry_snapshot}'.")
+            snapshots.append(load_registry_snapshot(registry_snapshot))
+        for network_mirror in HclHandler(HclEditCli()).get_network_mirrors_from_user_rc_file():
+            mirror = ProviderMirrorSnapshot(network_mirror.url, request_scheduler, network_mirror.include, network_mirror.exclude)
+            if offline and mirror.is_remote:
+                log.debug(f"Skipping network mirror '{network_mirror.url}' from terraformrc file in offline mode.")
+                continue
+            log.debug(f"Using network mirror '{network_mirror.url}' from terraformrc file.")
+            snapshots.append(mirror)
+        if len(snapshots) == 0:
+            return None
+        return CompositeRegistrySnapshot(snapshots)
+
+    def with_release_notes_cache(self, release_notes_cache: ReleaseNotesCache) -> Self:
+        # has to be added before the providers, since it is shared between them
+        log.debug("Using persistent release notes cache.")
+        self.release_notes_cache = release_notes_cache
+        return self
+
+    def with_changelog_range(self) -> Self:
+        # has to be added before the providers, like the release notes cache
+        log.debug("Adding the release notes of all versions between the current and the newest version.")
+        self.changelog_range = True
         return self
 
     def with_terraform_module_provider(self, github: Union[Github, None] = None) -> Self:
@@ -37,8 +154,23 @@ class ProviderHandlerBuilder:
             raise Exception("No registry configuration added to ProviderHandlerBuilder.")
         log.debug("Adding TerraformModuleProvider to ProviderHandlerBuilder.")
         if github is None:
-            github = Github()
-        tf_module_provider = TerraformModuleProvider(HclEditCli(), self.registry_handler, HclHandler(HclEditCli()), self.working_directory, github)
+            github = Github(timeout=self.run_budget.request_timeout)  # type: ignore
+        git_source_handler = self.git_source_handler if self.git_source_handler is not None else GitSourceHandler(self.run_budget, self.registry_cache)
+        tf_module_provider = TerraformModuleProvider(
+            HclEditCli(),
+            self.registry_handler,
+            HclHandler(HclEditCli()),
+            self.working_directory,
+            github,
+            run_budget=self.run_budget,
+            git_source_handler=git_source_handler,
+            release_notes_cache=self.release_notes_cache,
+            changelog_range=self.changelog_range,
+            show_progress=self.show_progress,
+            roots=self.roots,
+            shard=self.shard,
+            checkpoint_journal=self.checkpoint_journal,
+        )
         self.providers.append(tf_module_provider)
         return self
 
@@ -47,21 +179,50 @@ class ProviderHandlerBuilder:
             raise Exception("No registry configuration added to ProviderHandlerBuilder.")
         log.debug("Adding TerraformModuleProvider to ProviderHandlerBuilder.")
         if github is None:
-            github = Github()
-        tf_module_provider = TerraformProviderProvider(HclEditCli(), self.registry_handler, HclHandler(HclEditCli()), self.working_directory, github)
+            github = Github(timeout=self.run_budget.request_timeout)  # type: ignore
+        tf_module_provider = TerraformProviderProvider(
+            HclEditCli(),
+            self.registry_handler,
+            HclHandler(HclEditCli()),
+            self.working_directory,
+            github,
+            run_budget=self.run_budget,
+            release_notes_cache=self.release_notes_cache,
+            changelog_range=self.changelog_range,
+            show_progress=self.show_progress,
+            roots=self.roots,
+            shard=self.shard,
+            checkpoint_journal=self.checkpoint_journal,
+        )
         self.providers.append(tf_module_provider)
         return self
 
+    def with_commit_grouping(self, commit_grouping: str) -> Self:
+        log.debug(f"Grouping commits by '{commit_grouping}'.")
+        self.commit_grouping = commit_grouping
+        return self
+
     def with_git_integration(self, git_working_directory: Path) -> Self:
         log.debug("Enabling Git integration.")
         self.git_integration = True
-        self.git_repo = Repo(git_working_directory)
+        self.git = Git(git_working_directory)
         return self
 
     def build(self) -> ProviderHandler:
         if len(self.providers) == 0:
             raise Exception("No providers added to ProviderHandlerBuilder.")
         statistics_file = self.working_directory.joinpath(f"{cs.APP_NAME}_Statistics.json")
+        if self.shard is not None:
+            # the partial statistics of all shards can be collected in one directory and merged
+            statistics_file = self.working_directory.joinpath(f"{cs.APP_NAME}_Statistics.shard-{self.shard.name}.json")
         return ProviderHandler(
-            providers=self.providers, console=Console(width=const.CLI_WIDTH), options_processor=OptionsProcessor(), statistics_file=statistics_file, repo=self.git_repo
+            providers=self.providers,
+            console=Console(width=const.CLI_WIDTH),
+            options_processor=OptionsProcessor(),
+            statistics_file=statistics_file,
+            git=self.git,
+            run_budget=self.run_budget,
+            commit_grouping=self.commit_grouping,
+            show_progress=self.show_progress,
+            checkpoint_journal=self.checkpoint_journal,
         )
@@ -1,4 +1,5 @@
-from typing import Protocol, Sequence, Union
+from pathlib import Path
+from typing import Iterator, Protocol, Sequence, Union
 
 from pytablewriter import MarkdownTableWriter
 from rich.table import Table
@@ -13,6 +14,10 @@ class BaseProviderInterface(Protocol):
 
     def get_resources(self) -> Sequence[VersionedResource]: ...
 
+    def get_resources_from_files(self, files: Sequence[Path]) -> Sequence[VersionedResource]: ...
+
+    def iter_resources(self, chunk_size: int) -> Iterator[Sequence[VersionedResource]]: ...
+
     def patch_resource(self, resource: VersionedResource) -> VersionedResource: ...
 
     def get_rich_table(self, resources: Sequence[VersionedResource]) -> Table: ...
@@ -1,16 +1,27 @@
+import itertools
 import logging as log
+import re
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 from pathlib import Path
-from typing import Any, Sequence, Union
+from typing import Any, Iterator, Optional, Sequence, Union
 
-from github import Github
+import semantic_version
+from github import Github, UnknownObjectException
 from pytablewriter import MarkdownTableWriter
 from rich import progress
 from rich.table import Table
 
+import infrapatch.core.constants as cs
 from infrapatch.core.models.versioned_resource import VersionedResource, VersionedResourceReleaseNotes
-from infrapatch.core.models.versioned_terraform_resources import VersionedTerraformResource
+from infrapatch.core.models.versioned_terraform_resources import TerraformGitModule, VersionedTerraformResource
 from infrapatch.core.providers.base_provider_interface import BaseProviderInterface
+from infrapatch.core.utils.checkpoint import CheckpointJournal
+from infrapatch.core.utils.release_notes_cache import ReleaseNotesCache
+from infrapatch.core.utils.run_budget import BudgetPhase, RunBudget
+from infrapatch.core.utils.shard import Shard, ShardMode
+from infrapatch.core.utils.single_flight import SingleFlight
+from infrapatch.core.utils.terraform.git_source_handler import GitSourceHandlerInterface
 from infrapatch.core.utils.terraform.hcl_edit_cli import HclEditCliInterface
 from infrapatch.core.utils.terraform.hcl_handler import HclHandlerInterface
 from infrapatch.core.utils.terraform.registry_handler import RegistryHandlerInterface
@@ -18,13 +29,40 @@ from infrapatch.core.utils.terraform.registry_handler import RegistryHandlerInte
 
 class TerraformProvider(BaseProviderInterface):
     def __init__(
-        self, hcledit: HclEditCliInterface, registry_handler: RegistryHandlerInterface, hcl_handler: HclHandlerInterface, project_root: Path, github: Union[Github, None]
+        self,
+        hcledit: HclEditCliInterface,
+        registry_handler: RegistryHandlerInterface,
+        hcl_handler: HclHandlerInterface,
+        project_root: Path,
+        github: Union[Github, None],
+        max_workers: int = cs.DEFAULT_RESOLVE_WORKERS,
+        run_budget: Union[RunBudget, None] = None,
+        git_source_handler: Union[GitSourceHandlerInterface, None] = None,
+        release_notes_cache: Union[ReleaseNotesCache, None] = None,
+        changelog_range: bool = False,
+        show_progress: bool = True,
+        roots: Union[Sequence[Path], None] = None,
+        shard: Union[Shard, None] = None,
+        checkpoint_journal: Union[CheckpointJournal, None] = None,
     ) -> None:
         self.hcledit = hcledit
         self.registry_handler = registry_handler
         self.hcl_handler = hcl_handler
         self.project_root = project_root
         self._github = github
+        self.max_workers = max_workers
+        self.run_budget = run_budget if run_budget is not None else RunBudget()
+        self.git_source_handler = git_source_handler
+        self.release_notes_cache = release_notes_cache if release_notes_cache is not None else ReleaseNotesCache()
+        self._release_single_flight = SingleFlight()
+        # add the release notes of all versions between the current and the newest version instead of only the newest one
+        self.changelog_range = changelog_range
+        # rich only supports one progress display at a time, so it is disabled if multiple projects are processed concurrently
+        self.show_progress = show_progress
+        # directories below the project root which are scanned, the whole project root by default
+        self.roots = roots if roots is not None else [project_root]
+        self.shard = shard
+        self.checkpoint_journal = checkpoint_journal
 
     @abstractmethod
     def get_provider_name(self) -> str:
@@ -35,34 +73,159 @@ class TerraformProvider(BaseProviderInterface):
         raise NotImplementedError
 
     def get_resources(self) -> Sequence[VersionedResource]:
-        log.info(f"Searching for .tf files in {self.project_root.absolute().as_posix()} ...")
-        terraform_files = self.hcl_handler.get_all_terraform_files(self.project_root)
+        return self._get_resources_from_selected_files(self._get_files())
+
+    def iter_resources(self, chunk_size: int) -> Iterator[Sequence[VersionedResource]]:
+        # parses and resolves the files in chunks, so only the resources of one chunk have to be kept in memory
+        if self.shard is not None and self.shard.mode == ShardMode.SOURCE:
+            raise Exception("Sharding by source needs the sources of all files, so it can't be combined with processing the files in chunks.")
+        files = self._get_files()
+        for start in range(0, len(files), chunk_size):
+            yield self._get_resources_from_selected_files(files[start : start + chunk_size])
+
+    def get_resources_from_files(self, files: Sequence[Path]) -> Sequence[VersionedResource]:
+        return self._get_resources_from_selected_files(self._select_files(files))
+
+    def _get_files(self) -> list[Path]:
+        terraform_files: dict[Path, Path] = {}
+        for root in self.roots:
+            log.info(f"Searching for .tf files in {root.absolute().as_posix()} ...")
+            # files of nested roots are only parsed once
+            for file in self.hcl_handler.get_all_terraform_files(root):
+                terraform_files.setdefault(file.absolute().resolve(), file)
+        return self._select_files(list(terraform_files.values()))
+
+    def _select_files(self, files: Sequence[Path]) -> list[Path]:
+        # files outside of the project root and its roots are ignored, e.g. changed files of the whole repository
+        project_root = self.project_root.absolute().resolve()
+        roots = [root.absolute().resolve() for root in self.roots]
+        terraform_files = [
+            file
+            for file in files
+            if file.suffix == ".tf" and file.absolute().resolve().is_relative_to(project_root) and any(file.absolute().resolve().is_relative_to(root) for root in roots)
+        ]
+        if self.shard is not None and self.shard.mode == ShardMode.FILE:
+            relative_paths = {file: file.absolute().resolve().relative_to(project_root).as_posix() for file in terraform_files}
+            selected_paths = self.shard.select(relative_paths.values())
+            terraform_files = [file for file in terraform_files if relative_paths[file] in selected_paths]
+            log.debug(f"Shard {self.shard.name} contains {len(terraform_files)} of {len(relative_paths)} .tf files.")
+        return terraform_files
+
+    def _get_resources_from_selected_files(self, terraform_files: Sequence[Path]) -> Sequence[VersionedResource]:
         if len(terraform_files) == 0:
             return []
 
         resources = []
-        for terraform_file in progress.track(terraform_files, description=f"Parsing .tf files for {self.get_provider_display_name()}..."):
-            if self.get_provider_name() == "terraform_modules":
-                resources.extend(self.hcl_handler.get_terraform_resources_from_file(terraform_file, get_modules=True, get_providers=False))
+        with self.run_budget.phase(BudgetPhase.PARSE):
+            for i, terraform_file in enumerate(
+                progress.track(terraform_files, description=f"Parsing .tf files for {self.get_provider_display_name()}...", disable=not self.show_progress)
+            ):
+                if self.run_budget.expired():
+                    log.warning(f"Time budget for parsing exhausted, skipping {len(terraform_files) - i} of {len(terraform_files)} .tf files.")
+                    break
+                if self.get_provider_name() == "terraform_modules":
+                    resources.extend(self.hcl_handler.get_terraform_resources_from_file(terraform_file, get_modules=True, get_providers=False))
 
-            elif self.get_provider_name() == "terraform_providers":
-                resources.extend(self.hcl_handler.get_terraform_resources_from_file(terraform_file, get_modules=False, get_providers=True))
+                elif self.get_provider_name() == "terraform_providers":
+                    resources.extend(self.hcl_handler.get_terraform_resources_from_file(terraform_file, get_modules=False, get_providers=True))
 
-            else:
-                raise Exception(f"Provider name '{self.get_provider_name()}' is not implemented.")
+                else:
+                    raise Exception(f"Provider name '{self.get_provider_name()}' is not implemented.")
 
-        for resource in progress.track(resources, description=f"Getting newest resource versions for Provider {self.get_provider_display_name()}..."):
-            resource.newest_version = self.registry_handler.get_newest_version(resource)
-            source = self.registry_handler.get_source(resource)
-            if source is not None and "github.com" in source:
-                resource.github_repo = source
+        if self.shard is not None and self.shard.mode == ShardMode.SOURCE:
+            selected_sources = self.shard.select(_get_shard_key(resource) for resource in resources)
+            log.debug(f"Shard {self.shard.name} contains {len(selected_sources)} sources.")
+            resources = [resource for resource in resources if _get_shard_key(resource) in selected_sources]
+
+        with self.run_budget.phase(BudgetPhase.RESOLVE):
+            self._resolve_resources(resources)
         return resources
 
+    def _resolve_resources(self, resources: Sequence[VersionedTerraformResource]) -> None:
+        # checkpointed resources don't need to be prefetched
+        self.registry_handler.prefetch([resource for resource in resources if self._get_checkpointed_resolve_result(resource) is None])
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {executor.submit(self._resolve_resource, resource): resource for resource in resources}
+        applied = set()
+        try:
+            for future in progress.track(
+                as_completed(futures, timeout=self.run_budget.remaining()),
+                total=len(futures),
+                description=f"Getting newest resource versions for Provider {self.get_provider_display_name()}...",
+                disable=not self.show_progress,
+            ):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # lookups cut short by the time budget fail with a registry or timeout error, they are timed out instead of failing the run
+                    if not self.run_budget.expired():
+                        raise
+                    log.debug(f"Resolving resource '{futures[future].name}' failed after the time budget was exhausted: {e}")
+                    continue
+                self._apply_resolve_result(futures[future], *result)
+                applied.add(future)
+        except TimeoutError:
+            pass
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        timed_out_resources = []
+        for future, resource in futures.items():
+            if future in applied:
+                continue
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._apply_resolve_result(resource, *future.result())
+                continue
+            resource.set_timed_out()
+            timed_out_resources.append(resource)
+        if len(timed_out_resources) > 0:
+            log.warning(f"Time budget for resolving exhausted, {len(timed_out_resources)} resources of Provider {self.get_provider_display_name()} are marked as timed out.")
+
+    def _resolve_resource(self, resource: VersionedTerraformResource) -> tuple[Optional[str], Optional[str]]:
+        # resolve on a copy and let the caller apply the result, so lookups finishing after the time budget can't change the resource anymore
+        resolved = self._get_checkpointed_resolve_result(resource)
+        if resolved is not None:
+            log.debug(f"Using checkpointed newest version of resource '{resource.name}'.")
+            return resolved
+        handler = self._get_resolve_handler(resource)
+        if handler is None:
+            log.debug(f"No git source handler configured, skipping git module '{resource.name}'.")
+            return None, None
+        newest_version = handler.get_newest_version(resource)
+        resolved_resource = resource.model_copy()
+        resolved_resource.newest_version = newest_version
+        source = handler.get_source(resolved_resource)
+        if self.checkpoint_journal is not None:
+            self.checkpoint_journal.record_resolved(resource, newest_version, source)
+        return newest_version, source
+
+    def _get_checkpointed_resolve_result(self, resource: VersionedTerraformResource) -> Union[tuple[Optional[str], Optional[str]], None]:
+        if self.checkpoint_journal is None:
+            return None
+        patched = self.checkpoint_journal.get_patched(resource)
+        if patched is not None:
+            return patched
+        return self.checkpoint_journal.get_resolved(resource)
+
+    def _get_resolve_handler(self, resource: VersionedTerraformResource) -> Union[RegistryHandlerInterface, GitSourceHandlerInterface, None]:
+        if isinstance(resource, TerraformGitModule):
+            return self.git_source_handler
+        return self.registry_handler
+
+    def _apply_resolve_result(self, resource: VersionedTerraformResource, newest_version: Optional[str], source: Optional[str]) -> None:
+        resource.newest_version = newest_version
+        if source is not None and "github.com" in source:
+            resource.github_repo = source
+        # resources patched by an interrupted run are reported and committed as patched again
+        if self.checkpoint_journal is not None and self.checkpoint_journal.is_patched(resource):
+            resource.set_patched()
+
     def patch_resource(self, resource: VersionedTerraformResource) -> VersionedTerraformResource:
         if resource.check_if_up_to_date() is True:
             log.debug(f"Resource '{resource.name}' is already up to date.")
             return resource
         self.hcl_handler.bump_resource_version(resource)
+        if self.checkpoint_journal is not None:
+            self.checkpoint_journal.record_patched(resource)
         return resource
 
     def get_rich_table(self, resources: Sequence[VersionedTerraformResource]) -> Table:
@@ -104,13 +267,82 @@ class TerraformProvider(BaseProviderInterface):
         if resource.github_repo is None:
             log.debug(f"Resource '{resource.name}' has no github repo set, skipping release notes.")
             return None
+        current_version = _get_current_version_base(resource.current_version)
+        if self.changelog_range and current_version is not None:
+            release_notes = self._get_release_range_body(resource.github_repo, current_version, resource.newest_version_base)
+        else:
+            release_notes = self._get_release_body(resource.github_repo, f"v{resource.newest_version_base}")
+        if release_notes is None:
+            return None
+        return VersionedResourceReleaseNotes(resources=[resource], body=release_notes, name=resource.source, version=resource.newest_version)
+
+    def _get_release_body(self, github_repo: str, tag: str) -> Union[str, None]:
+        cache_entry = self.release_notes_cache.get(github_repo, tag)
+        if cache_entry is not None:
+            log.debug(f"Release notes of '{github_repo}' for tag '{tag}' already cached.")
+            return cache_entry.body
+        return self._release_single_flight.do((github_repo.lower(), tag), lambda: self._fetch_release_body(github_repo, tag))
+
+    def _fetch_release_body(self, github_repo: str, tag: str) -> Union[str, None]:
+        if self._github is None:
+            raise Exception("Github integration is not enabled.")
+        try:
+            # the repository is not fetched, since only its releases are needed
+            body = self._github.get_repo(github_repo, lazy=True).get_release(tag).body or ""
+        except UnknownObjectException:
+            log.debug(f"Release '{tag}' not found in repo '{github_repo}'.")
+            self.release_notes_cache.set(github_repo, tag, None)
+            return None
+        except Exception as e:
+            log.warning(f"Could not get release notes from repo '{github_repo}' for tag '{tag}': {e}")
+            return None
+        self.release_notes_cache.set(github_repo, tag, body)
+        return body
+
+    def _get_release_range_body(self, github_repo: str, current_version: str, newest_version: str) -> Union[str, None]:
+        range_key = f"{current_version}...{newest_version}"
+        cache_entry = self.release_notes_cache.get(github_repo, range_key)
+        if cache_entry is not None:
+            log.debug(f"Release notes of '{github_repo}' for range '{range_key}' already cached.")
+            return cache_entry.body
+        return self._release_single_flight.do((github_repo.lower(), range_key), lambda: self._fetch_release_range_body(github_repo, current_version, newest_version))
+
+    def _fetch_release_range_body(self, github_repo: str, current_version: str, newest_version: str) -> Union[str, None]:
+        if self._github is None:
+            raise Exception("Github integration is not enabled.")
+        current = semantic_version.Version(current_version)
+        newest = semantic_version.Version(newest_version)
+        releases = []
         try:
-            repo = self._github.get_repo(resource.github_repo)
-            release_notes = repo.get_release(f"v{resource.newest_version_base}").body
+            # releases are listed by creation date, so backports of older major versions are interleaved with the releases in range.
+            # The listing stops at the first page without releases newer than the current version.
+            paginated_releases = self._github.get_repo(github_repo, lazy=True).get_releases()
+            for page in itertools.count():
+                page_releases = paginated_releases.get_page(page)
+                if len(page_releases) == 0:
+                    break
+                versions = [_parse_release_version(release.tag_name) for release in page_releases]
+                for release, version in zip(page_releases, versions):
+                    if version is None or version > newest or version <= current:
+                        continue
+                    releases.append((version, release.tag_name, release.body or ""))
+                    # the releases are cached by tag as well, so single release lookups don't request them again
+                    self.release_notes_cache.set(github_repo, release.tag_name, release.body or "")
+                parsed_versions = [version for version in versions if version is not None]
+                if len(parsed_versions) > 0 and all(version <= current for version in parsed_versions):
+                    break
         except Exception as e:
-            log.warning(f"Could not get release notes from repo '{resource.github_repo}' for version '{resource.newest_version}': {e}")
+            log.warning(f"Could not get releases from repo '{github_repo}' between version '{current_version}' and '{newest_version}': {e}")
             return None
-        return VersionedResourceReleaseNotes(resources=[resource], body=release_notes, name=resource.source, version=resource.newest_version)
+
+        range_key = f"{current_version}...{newest_version}"
+        if len(releases) == 0:
+            log.debug(f"No releases found in repo '{github_repo}' between version '{current_version}' and '{newest_version}'.")
+            self.release_notes_cache.set(github_repo, range_key, None)
+            return None
+        body = "\n\n".join(f"### {tag}\n{release_body}" for _, tag, release_body in sorted(releases, key=lambda release: release[0], reverse=True))
+        self.release_notes_cache.set(github_repo, range_key, body)
+        return body
 
     def get_grouped_by_identifier(self, resources: Sequence[VersionedTerraformResource]) -> dict[str, Sequence[VersionedTerraformResource]]:
         identifiers: dict[str, Sequence[VersionedTerraformResource]] = {}
@@ -120,3 +352,22 @@ class TerraformProvider(BaseProviderInterface):
                 continue
             list(identifiers[resource.source]).append(resource)
         return identifiers
+
+
+def _get_current_version_base(current_version: str) -> Union[str, None]:
+    # only exact versions and tilde constraints have a version to start the changelog range from
+    version = current_version.strip().removeprefix("~>").strip()
+    if re.match(r"^[0-9]+\.[0-9]+\.[0-9]+$", version) is None:
+        return None
+    return version
+
+
+def _parse_release_version(tag_name: str) -> Union[semantic_version.Version, None]:
+    version = tag_name.removeprefix("v")
+    if re.match(r"^[0-9]+\.[0-9]+\.[0-9]+$", version) is None:
+        return None
+    return semantic_version.Version(version)
+
+
+def _get_shard_key(resource: VersionedTerraformResource) -> str:
+    return resource.identifier if resource.identifier is not None else resource.source.lower()
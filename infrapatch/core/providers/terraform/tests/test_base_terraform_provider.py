@@ -0,0 +1,219 @@
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from github import UnknownObjectException
+
+from infrapatch.core.models.versioned_resource import ResourceStatus
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.providers.terraform.terraform_module_provider import TerraformModuleProvider
+from infrapatch.core.utils.checkpoint import CheckpointJournal
+from infrapatch.core.utils.release_notes_cache import ReleaseNotesCache
+from infrapatch.core.utils.run_budget import BudgetPhase, RunBudget
+from infrapatch.core.utils.shard import Shard, ShardMode
+from infrapatch.core.utils.terraform.registry_handler import TerraformRegistryException
+
+
+def _get_module(name: str, source: str) -> TerraformModule:
+    return TerraformModule(name=name, current_version="1.0.0", source_file=Path("main.tf"), source_string=source, start_line_number=1)
+
+
+def _get_provider(resources: list[TerraformModule], registry_handler: MagicMock, run_budget: RunBudget) -> TerraformModuleProvider:
+    hcl_handler = MagicMock()
+    hcl_handler.get_all_terraform_files.return_value = [Path("main.tf")]
+    hcl_handler.get_terraform_resources_from_file.return_value = resources
+    return TerraformModuleProvider(MagicMock(), registry_handler, hcl_handler, Path("."), None, run_budget=run_budget)
+
+
+def test_get_resources_resolves_versions():
+    registry_handler = MagicMock()
+    registry_handler.get_newest_version.return_value = "2.0.0"
+    registry_handler.get_source.return_value = "https://github.com/test/test_module"
+    provider = _get_provider([_get_module("module1", "test/test_module/test"), _get_module("module2", "test/test_module/test")], registry_handler, RunBudget())
+
+    resources = provider.get_resources()
+
+    assert [resource.newest_version for resource in resources] == ["2.0.0", "2.0.0"]
+    assert [resource.github_repo for resource in resources] == ["test/test_module", "test/test_module"]
+
+
+def test_get_resources_marks_unresolved_resources_as_timed_out():
+    def get_newest_version(resource):
+        if resource.source == "test/slow_module/test":
+            time.sleep(1)
+        return "2.0.0"
+
+    registry_handler = MagicMock()
+    registry_handler.get_newest_version.side_effect = get_newest_version
+    registry_handler.get_source.return_value = None
+    provider = _get_provider(
+        [_get_module("fast", "test/fast_module/test"), _get_module("slow", "test/slow_module/test")], registry_handler, RunBudget(phase_budgets={BudgetPhase.RESOLVE: 0.3})
+    )
+
+    start = time.monotonic()
+    resources = provider.get_resources()
+
+    assert time.monotonic() - start < 0.9
+    fast, slow = resources
+    assert fast.newest_version == "2.0.0"
+    assert fast.status == ResourceStatus.UNPATCHED
+    assert slow.status == ResourceStatus.TIMED_OUT
+    assert slow.newest_version is None
+    assert slow.check_if_up_to_date() is True
+
+
+def test_lookups_failing_after_the_time_budget_are_timed_out():
+    def get_newest_version(resource):
+        if resource.source == "test/slow_module/test":
+            time.sleep(0.2)
+            raise TerraformRegistryException("Request timed out, no time left for retry.")
+        return "2.0.0"
+
+    registry_handler = MagicMock()
+    registry_handler.get_newest_version.side_effect = get_newest_version
+    registry_handler.get_source.return_value = None
+    provider = _get_provider(
+        [_get_module("fast", "test/fast_module/test"), _get_module("slow", "test/slow_module/test")], registry_handler, RunBudget(phase_budgets={BudgetPhase.RESOLVE: 0.1})
+    )
+
+    fast, slow = provider.get_resources()
+
+    assert fast.newest_version == "2.0.0"
+    assert slow.status == ResourceStatus.TIMED_OUT
+
+
+def test_lookup_errors_within_the_time_budget_are_raised():
+    registry_handler = MagicMock()
+    registry_handler.get_newest_version.side_effect = TerraformRegistryException("Not found.")
+    provider = _get_provider([_get_module("module", "test/test_module/test")], registry_handler, RunBudget(phase_budgets={BudgetPhase.RESOLVE: 10}))
+
+    with pytest.raises(TerraformRegistryException):
+        provider.get_resources()
+
+
+def test_release_notes_are_cached(tmp_path: Path):
+    github = MagicMock()
+    get_release_calls = []
+
+    def get_release(tag: str):
+        get_release_calls.append(tag)
+        if tag == "v3.0.0":
+            raise UnknownObjectException(404, {}, {})
+        return MagicMock(body=f"release notes {tag}")
+
+    github.get_repo.return_value.get_release.side_effect = get_release
+    modules = [_get_module(f"module{index}", "test/test_module/test") for index in range(4)]
+    for module, version in zip(modules, ["2.0.0", "2.0.0", "3.0.0", "3.0.0"]):
+        module.newest_version = version
+        module.github_repo = "https://github.com/test/test_module"
+    provider = TerraformModuleProvider(MagicMock(), MagicMock(), MagicMock(), Path("."), github, release_notes_cache=ReleaseNotesCache(tmp_path))
+
+    release_notes = [provider.get_resource_release_notes(module) for module in modules]
+
+    assert [release_note.body if release_note is not None else None for release_note in release_notes] == ["release notes v2.0.0", "release notes v2.0.0", None, None]
+    # missing releases are cached as well
+    assert get_release_calls == ["v2.0.0", "v3.0.0"]
+
+
+def test_changelog_range():
+    github = MagicMock()
+    # releases are listed by creation date, v1.5.0 was backported after v2.0.0 was released
+    pages = [["v3.0.0", "v2.1.0", "v1.0.1", "v2.0.1-rc1"], ["v2.0.0", "v1.1.0", "v1.5.0"], ["v1.0.0", "v0.9.0"], ["v0.8.0"]]
+    listed_pages = []
+
+    def get_page(page: int):
+        listed_pages.append(page)
+        return [MagicMock(tag_name=tag, body=f"changes {tag}") for tag in pages[page]] if page < len(pages) else []
+
+    github.get_repo.return_value.get_releases.return_value.get_page.side_effect = get_page
+    module = _get_module("module", "test/test_module/test")
+    module.current_version = "1.1.0"
+    module.newest_version = "2.1.0"
+    module.github_repo = "https://github.com/test/test_module"
+    provider = TerraformModuleProvider(MagicMock(), MagicMock(), MagicMock(), Path("."), github, changelog_range=True)
+
+    release_notes = provider.get_resource_release_notes(module)
+
+    assert release_notes is not None
+    assert release_notes.body == "### v2.1.0\nchanges v2.1.0\n\n### v2.0.0\nchanges v2.0.0\n\n### v1.5.0\nchanges v1.5.0"
+    # the listing stops at the first page without releases newer than the current version
+    assert listed_pages == [0, 1, 2]
+    assert provider.get_resource_release_notes(module) is not None
+    assert github.get_repo.return_value.get_releases.call_count == 1
+
+
+def test_get_resources_scans_every_file_of_nested_roots_once(tmp_path: Path):
+    files = {
+        tmp_path.joinpath("prod"): [tmp_path.joinpath("prod", "main.tf"), tmp_path.joinpath("prod", "network", "main.tf")],
+        tmp_path.joinpath("prod", "network"): [tmp_path.joinpath("prod", "network", "main.tf")],
+    }
+    hcl_handler = MagicMock()
+    hcl_handler.get_all_terraform_files.side_effect = lambda root: files[root]
+    hcl_handler.get_terraform_resources_from_file.return_value = []
+    provider = TerraformModuleProvider(MagicMock(), MagicMock(), hcl_handler, tmp_path, None, roots=list(files))
+
+    provider.get_resources()
+
+    assert [call.args[0] for call in hcl_handler.get_terraform_resources_from_file.call_args_list] == [
+        tmp_path.joinpath("prod", "main.tf"),
+        tmp_path.joinpath("prod", "network", "main.tf"),
+    ]
+
+
+def test_get_resources_of_shard(tmp_path: Path):
+    files = [tmp_path.joinpath(f"main{index}.tf") for index in range(4)]
+    hcl_handler = MagicMock()
+    hcl_handler.get_all_terraform_files.return_value = files
+    hcl_handler.get_terraform_resources_from_file.side_effect = lambda file, **_: [
+        TerraformModule(name=file.stem, current_version="1.0.0", source_file=file, source_string=f"test/{source}/aws", start_line_number=1) for source in ["vpc", "dns"]
+    ]
+    registry_handler = MagicMock()
+    registry_handler.get_newest_version.return_value = "2.0.0"
+    registry_handler.get_source.return_value = None
+
+    file_shards = [TerraformModuleProvider(MagicMock(), registry_handler, hcl_handler, tmp_path, None, shard=Shard(index, 2, ShardMode.FILE)).get_resources() for index in [1, 2]]
+    assert [sorted({resource.name for resource in resources}) for resources in file_shards] == [["main0", "main2"], ["main1", "main3"]]
+
+    source_shards = [
+        TerraformModuleProvider(MagicMock(), registry_handler, hcl_handler, tmp_path, None, shard=Shard(index, 2, ShardMode.SOURCE)).get_resources() for index in [1, 2]
+    ]
+    assert [sorted({resource.source for resource in resources}) for resources in source_shards] == [["test/dns/aws"], ["test/vpc/aws"]]
+    assert [len(resources) for resources in source_shards] == [4, 4]
+
+    # the files of a shard are only selected once, not again for every chunk
+    chunks = list(TerraformModuleProvider(MagicMock(), registry_handler, hcl_handler, tmp_path, None, shard=Shard(1, 2, ShardMode.FILE)).iter_resources(1))
+    assert [sorted({resource.name for resource in resources}) for resources in chunks] == [["main0"], ["main2"]]
+    with pytest.raises(Exception):
+        list(TerraformModuleProvider(MagicMock(), registry_handler, hcl_handler, tmp_path, None, shard=Shard(1, 2, ShardMode.SOURCE)).iter_resources(1))
+
+
+def test_get_resources_resumes_from_checkpoint_journal(tmp_path: Path):
+    files = [tmp_path.joinpath("patched.tf"), tmp_path.joinpath("pending.tf")]
+    for file in files:
+        file.write_text("")
+    hcl_handler = MagicMock()
+    hcl_handler.get_all_terraform_files.return_value = files
+    hcl_handler.get_terraform_resources_from_file.side_effect = lambda file, **_: [
+        TerraformModule(name=file.stem, current_version="1.0.0", source_file=file, source_string=f"test/{file.stem}/aws", start_line_number=1)
+    ]
+    registry_handler = MagicMock()
+    registry_handler.get_newest_version.return_value = "2.0.0"
+    registry_handler.get_source.return_value = None
+    journal_file = tmp_path.joinpath("checkpoint.jsonl")
+    provider = TerraformModuleProvider(MagicMock(), registry_handler, hcl_handler, tmp_path, None, checkpoint_journal=CheckpointJournal(journal_file))
+    patched, _ = provider.get_resources()
+    provider.patch_resource(patched)
+    assert registry_handler.get_newest_version.call_count == 2
+
+    # the interrupted run patched the first file, which is parsed with the newest version now
+    hcl_handler.get_terraform_resources_from_file.side_effect = lambda file, **_: [
+        TerraformModule(name=file.stem, current_version="2.0.0" if file == files[0] else "1.0.0", source_file=file, source_string=f"test/{file.stem}/aws", start_line_number=1)
+    ]
+    resumed_provider = TerraformModuleProvider(MagicMock(), registry_handler, hcl_handler, tmp_path, None, checkpoint_journal=CheckpointJournal(journal_file, resume=True))
+    resumed_patched, resumed_pending = resumed_provider.get_resources()
+
+    assert registry_handler.get_newest_version.call_count == 2
+    assert resumed_patched.status == ResourceStatus.PATCHED
+    assert resumed_pending.newest_version == "2.0.0"
+    assert resumed_pending.status == ResourceStatus.UNPATCHED
@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from infrapatch.core.fleet import Fleet, dump_fleet_statistics, read_fleet_manifest
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.provider_handler import ProviderHandler
+
+
+class StandInFleetProvider:
+    def __init__(self, repository: Path):
+        self.repository = repository
+
+    def get_provider_name(self) -> str:
+        return "terraform_modules"
+
+    def get_provider_display_name(self) -> str:
+        return "Terraform Modules"
+
+    def get_resources(self):
+        if self.repository.name == "broken":
+            raise Exception("Could not parse files.")
+        resources = []
+        for file in sorted(self.repository.glob("*.tf")):
+            resource = TerraformModule(name=file.stem, current_version="1.0.0", source_file=file, source_string="test/test_module/test", start_line_number=1)
+            resource.newest_version = "2.0.0"
+            resources.append(resource)
+        return resources
+
+    def patch_resource(self, resource):
+        return resource
+
+
+def _create_provider_handler(repository: Path) -> ProviderHandler:
+    return ProviderHandler([StandInFleetProvider(repository)], MagicMock(), repository.joinpath("statistics.json"), MagicMock(), show_progress=False)  # type: ignore
+
+
+def _create_repositories(tmp_path: Path) -> list[Path]:
+    repositories = []
+    for name, files in [("first", 2), ("broken", 1), ("second", 1)]:
+        repository = tmp_path.joinpath(name)
+        repository.mkdir()
+        for index in range(files):
+            repository.joinpath(f"main{index}.tf").write_text("")
+        repositories.append(repository)
+    return repositories
+
+
+def test_fleet_processes_all_repositories(tmp_path: Path):
+    repositories = _create_repositories(tmp_path)
+    results = Fleet(_create_provider_handler, max_workers=3).run(repositories, update=True)
+
+    assert [result.path for result in results] == repositories
+    assert results[1].statistics is None and results[1].error == "Could not parse files."
+    assert [result.statistics.resources_patched for result in results if result.statistics is not None] == [2, 1]
+
+    statistics_file = tmp_path.joinpath("fleet.json")
+    dump_fleet_statistics(results, statistics_file)
+    statistics = json.loads(statistics_file.read_text())
+    assert statistics["total"] == {
+        "repositories": 3,
+        "failed_repositories": 1,
+        "errors": 0,
+        "resources_patched": 3,
+        "resources_pending_update": 0,
+        "resources_timed_out": 0,
+        "total_resources": 3,
+    }
+    assert [repository["path"] for repository in statistics["repositories"]] == [repository.as_posix() for repository in repositories]
+
+
+def test_read_fleet_manifest(tmp_path: Path):
+    manifest = tmp_path.joinpath("fleet.txt")
+    manifest.write_text("# repositories\nfirst\n\n/absolute/second\n")
+    assert read_fleet_manifest(manifest) == [tmp_path.joinpath("first"), Path("/absolute/second")]
@@ -0,0 +1,205 @@
+import json
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.provider_handler import CommitGrouping, ProviderHandler, ResourceGrouping
+from infrapatch.core.utils.checkpoint import CheckpointJournal
+
+
+class StandInProvider:
+    def __init__(self, files: dict[Path, str], resources_per_file: int = 1):
+        self.files = files
+        self.resources_per_file = resources_per_file
+        self.parsed_files: list[Path] = []
+
+    def get_provider_name(self) -> str:
+        return "terraform_modules"
+
+    def get_provider_display_name(self) -> str:
+        return "Terraform Modules"
+
+    def get_resources(self):
+        return self.get_resources_from_files(list(self.files))
+
+    def get_resources_from_files(self, files: list[Path]):
+        self.parsed_files.extend(files)
+        resources = []
+        for file in files:
+            for index in range(self.resources_per_file):
+                name = file.stem if index == 0 else f"{file.stem}{index}"
+                resource = TerraformModule(name=name, current_version=self.files[file], source_file=file, source_string="test/test_module/test", start_line_number=index + 1)
+                resource.newest_version = "2.0.0"
+                resources.append(resource)
+        return resources
+
+    def iter_resources(self, chunk_size: int):
+        files = list(self.files)
+        for start in range(0, len(files), chunk_size):
+            yield self.get_resources_from_files(files[start : start + chunk_size])
+
+    def patch_resource(self, resource):
+        return resource
+
+
+def test_rescan_changed_files(tmp_path: Path):
+    files = {tmp_path.joinpath(f"{name}.tf"): "1.0.0" for name in ["main", "unchanged", "removed"]}
+    for file in files:
+        file.write_text("")
+    provider = StandInProvider(files)
+    provider_handler = ProviderHandler([provider], MagicMock(), tmp_path.joinpath("statistics.json"), MagicMock())  # type: ignore
+    upgradable_resources = provider_handler.get_upgradable_resources()
+    assert len(upgradable_resources["terraform_modules"]) == 3
+
+    # main.tf was patched on the target branch, removed.tf was deleted and added.tf was added
+    files[tmp_path.joinpath("main.tf")] = "2.0.0"
+    tmp_path.joinpath("removed.tf").unlink()
+    files[tmp_path.joinpath("added.tf")] = "1.0.0"
+    tmp_path.joinpath("added.tf").write_text("")
+    provider.parsed_files.clear()
+    provider_handler.rescan_changed_files([tmp_path.joinpath("main.tf"), tmp_path.joinpath("removed.tf"), tmp_path.joinpath("added.tf"), tmp_path.joinpath("README.md")])
+
+    assert sorted(file.name for file in provider.parsed_files) == ["added.tf", "main.tf"]
+    resources = {resource.name: resource for resource in provider_handler.get_resources()["terraform_modules"]}
+    assert sorted(resources) == ["added", "main", "unchanged"]
+    assert resources["main"].check_if_up_to_date() is True
+    assert resources["unchanged"].check_if_up_to_date() is False
+    # the resources handed out before the rescan are not shared with the rescanned ones
+    assert all(resource is not resources["unchanged"] for resource in upgradable_resources["terraform_modules"])
+
+
+def test_failed_rescan_keeps_previous_resources(tmp_path: Path):
+    files = {tmp_path.joinpath(f"{name}.tf"): "1.0.0" for name in ["main", "other"]}
+    for file in files:
+        file.write_text("")
+    second_provider = StandInProvider(files)
+    second_provider.get_provider_name = lambda: "terraform_providers"  # type: ignore
+    provider_handler = ProviderHandler([StandInProvider(files), second_provider], MagicMock(), tmp_path.joinpath("statistics.json"), MagicMock())  # type: ignore
+    resources = provider_handler.get_resources()
+    previous_resources = {provider_name: list(provider_resources) for provider_name, provider_resources in resources.items()}
+
+    # the file is deleted while the second provider parses it
+    tmp_path.joinpath("other.tf").write_text("")
+    files[tmp_path.joinpath("other.tf")] = "2.0.0"
+    second_provider.get_resources_from_files = MagicMock(side_effect=FileNotFoundError("other.tf"))  # type: ignore
+    with pytest.raises(FileNotFoundError):
+        provider_handler.rescan_changed_files([tmp_path.joinpath("other.tf")])
+
+    assert {provider_name: list(provider_resources) for provider_name, provider_resources in provider_handler.get_resources().items()} == previous_resources
+
+
+@pytest.mark.parametrize(
+    "commit_grouping,expected_commits",
+    [
+        (CommitGrouping.RESOURCE, 4),
+        (CommitGrouping.FILE, 2),
+        (CommitGrouping.PROVIDER, 1),
+        (CommitGrouping.SINGLE, 1),
+    ],
+)
+def test_commit_grouping(tmp_path: Path, commit_grouping: str, expected_commits: int):
+    files = {tmp_path.joinpath("main.tf"): "1.0.0", tmp_path.joinpath("other.tf"): "1.0.0"}
+    provider = StandInProvider(files, resources_per_file=2)
+    git = MagicMock()
+    provider_handler = ProviderHandler([provider], MagicMock(), tmp_path.joinpath("statistics.json"), MagicMock(), git=git, commit_grouping=commit_grouping)  # type: ignore
+
+    assert provider_handler.upgrade_resources() is True
+
+    assert git.commit_files.call_count == expected_commits
+    committed_files = sorted(file for call in git.commit_files.call_args_list for file in call.args[0])
+    assert sorted(set(committed_files)) == sorted(file.absolute() for file in files)
+    # the index file is only written once after all commits
+    git.sync_index.assert_called_once()
+
+
+def test_upgrade_commits_resumed_resources(tmp_path: Path):
+    files = {tmp_path.joinpath("committed.tf"): "1.0.0", tmp_path.joinpath("uncommitted.tf"): "1.0.0", tmp_path.joinpath("pending.tf"): "1.0.0"}
+    for file in files:
+        file.write_text("")
+    journal = CheckpointJournal(tmp_path.joinpath("checkpoint.jsonl"))
+    resources = {resource.name: resource for resource in StandInProvider(files).get_resources()}
+    journal.record_patched(resources["committed"])
+    journal.record_patched(resources["uncommitted"])
+    journal.record_commit("abc", [resources["committed"]])
+    # the interrupted run patched two files, but only committed one of them
+    provider = StandInProvider(files)
+    provider_handler = ProviderHandler([provider], MagicMock(), tmp_path.joinpath("statistics.json"), MagicMock(), git=MagicMock(), checkpoint_journal=journal)  # type: ignore
+    provider_handler.git.contains_commit.side_effect = lambda commit: commit == "abc"
+    provider_handler.git.commit_files.return_value = "def"
+    for resource in provider_handler.get_resources()["terraform_modules"]:
+        if journal.is_patched(resource):
+            resource.set_patched()
+
+    assert provider_handler.upgrade_resources() is True
+
+    committed_files = [call.args[0] for call in provider_handler.git.commit_files.call_args_list]
+    assert committed_files == [[tmp_path.joinpath("uncommitted.tf").absolute()], [tmp_path.joinpath("pending.tf").absolute()]]
+
+
+def test_stream_statistics(tmp_path: Path):
+    files = {tmp_path.joinpath(f"main{index}.tf"): "1.0.0" if index < 3 else "2.0.0" for index in range(5)}
+    provider = StandInProvider(files)
+    options_processor = MagicMock()
+    provider_handler = ProviderHandler([provider], MagicMock(), tmp_path.joinpath("statistics.json"), options_processor)  # type: ignore
+
+    statistics = provider_handler.stream_statistics(tmp_path.joinpath("statistics.ndjson"), only_upgradable=True, chunk_size=2)
+
+    assert statistics.total_resources == 5
+    assert statistics.resources_pending_update == 3
+    records = [json.loads(line) for line in tmp_path.joinpath("statistics.ndjson").read_text().splitlines()]
+    assert [record["resource"]["name"] for record in records if record["type"] == "resource"] == ["main0", "main1", "main2"]
+    assert records[-1]["total_resources"] == 5
+    # the resources are not cached
+    assert provider_handler._resource_cache == {}
+    assert options_processor.process_options_for_resource.call_count == 5
+
+
+def test_unknown_commit_grouping(tmp_path: Path):
+    with pytest.raises(Exception):
+        ProviderHandler([], MagicMock(), tmp_path.joinpath("statistics.json"), MagicMock(), commit_grouping="unknown")  # type: ignore
+
+
+@pytest.mark.parametrize(
+    "grouping,expected_groups",
+    [
+        (ResourceGrouping.PROVIDER, {"terraform_modules": 4}),
+        (ResourceGrouping.SOURCE, {"test-test_module-test": 4}),
+        (ResourceGrouping.DIRECTORY, {"root": 2, "modules-network": 2}),
+    ],
+)
+def test_upgradable_resource_groups(tmp_path: Path, grouping: str, expected_groups: dict[str, int]):
+    files = {tmp_path.joinpath("main.tf"): "1.0.0", tmp_path.joinpath("modules", "Network", "main.tf"): "1.0.0"}
+    provider = StandInProvider(files, resources_per_file=2)
+    git = MagicMock()
+    provider_handler = ProviderHandler([provider], MagicMock(), tmp_path.joinpath("statistics.json"), MagicMock(), git=git)  # type: ignore
+
+    groups = provider_handler.get_upgradable_resource_groups(grouping, tmp_path)
+    assert {group: len(resources["terraform_modules"]) for group, resources in groups.items()} == expected_groups
+
+    # each group is upgraded on its own, the resources are shared with the original handler
+    group, resources = next(iter(groups.items()))
+    assert provider_handler.for_resources(resources).upgrade_resources() is True
+    assert len(provider_handler.get_patched_resources()["terraform_modules"]) == expected_groups[group]
+    assert git.commit_files.call_count == expected_groups[group]
+
+
+def test_split_by_roots(tmp_path: Path):
+    files = {tmp_path.joinpath(path): "1.0.0" for path in ["prod/main.tf", "prod/network/main.tf", "dev/main.tf", "shared/main.tf"]}
+    provider = StandInProvider(files)
+    provider_handler = ProviderHandler([provider], MagicMock(), tmp_path.joinpath("statistics.json"), MagicMock())  # type: ignore
+    roots = [tmp_path.joinpath("prod"), tmp_path.joinpath("prod", "network"), tmp_path.joinpath("dev")]
+
+    root_handlers = provider_handler.split_by_roots(roots)
+
+    # resources of nested roots belong to the innermost root, resources outside of all roots are not reported per root
+    assert list(root_handlers) == sorted(roots)
+    assert {
+        root.relative_to(tmp_path).as_posix(): [resource.source_file for resource in handler.get_resources()["terraform_modules"]] for root, handler in root_handlers.items()
+    } == {
+        "dev": [tmp_path.joinpath("dev/main.tf")],
+        "prod": [tmp_path.joinpath("prod/main.tf")],
+        "prod/network": [tmp_path.joinpath("prod/network/main.tf")],
+    }
+    assert root_handlers[tmp_path.joinpath("dev")].statistics_file == tmp_path.joinpath("dev", "statistics.json")
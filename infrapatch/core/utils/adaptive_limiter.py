@@ -0,0 +1,104 @@
+import logging as log
+import threading
+import time
+from collections import deque
+from typing import Union
+
+
+class RequestOutcome:
+    SUCCESS = "success"
+    THROTTLED = "throttled"
+    ERROR = "error"
+    CANCELLED = "cancelled"  # the request was never sent, the limit is not adjusted
+
+
+# AIMD concurrency limiter: the limit grows additively while latencies stay close to the observed baseline
+# and shrinks multiplicatively when latencies inflate, requests fail or the server throttles.
+# Requests sent before the last decrease saw the same congestion, so the limit shrinks at most once per round trip.
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        max_limit: int,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        latency_tolerance: float = 2.0,
+        backoff_ratio: float = 0.9,
+        error_backoff_ratio: float = 0.5,
+        window_size: int = 100,
+    ):
+        self.max_limit = max(min_limit, max_limit)
+        self.min_limit = min_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.error_backoff_ratio = error_backoff_ratio
+        self._limit = float(min(self.max_limit, max(min_limit, initial_limit)))
+        self._in_flight = 0
+        self._baseline_latency: Union[float, None] = None
+        self._last_decrease = float("-inf")
+        self._latencies: deque[float] = deque(maxlen=window_size)
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self, timeout: Union[float, None] = None) -> bool:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._in_flight < int(self._limit), timeout=timeout):
+                return False
+            self._in_flight += 1
+            return True
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self, latency: float, outcome: str) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            old_limit = int(self._limit)
+            sent_at = time.monotonic() - latency
+            if outcome == RequestOutcome.SUCCESS:
+                self._on_success(latency, sent_at)
+            elif outcome != RequestOutcome.CANCELLED:
+                self._decrease(self.error_backoff_ratio, sent_at)
+            if int(self._limit) != old_limit:
+                log.debug(f"Adjusted concurrency limit from {old_limit} to {int(self._limit)} after {outcome} with latency {latency:.3f}s.")
+            self._condition.notify_all()
+
+    def _decrease(self, ratio: float, sent_at: float) -> None:
+        if sent_at < self._last_decrease:
+            return
+        self._limit = max(self.min_limit, self._limit * ratio)
+        self._last_decrease = time.monotonic()
+
+    def _on_success(self, latency: float, sent_at: float) -> None:
+        self._latencies.append(latency)
+        if self._baseline_latency is None or latency < self._baseline_latency:
+            self._baseline_latency = latency
+        else:
+            # let the baseline slowly follow the observed latencies, so a single fast response does not pin it forever
+            self._baseline_latency = self._baseline_latency * 0.99 + latency * 0.01
+        if latency > self._baseline_latency * self.latency_tolerance:
+            self._decrease(self.backoff_ratio, sent_at)
+            return
+        # additive increase of roughly one request per round trip at the current limit
+        self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def get_latency_percentile(self, percentile: float) -> Union[float, None]:
+        with self._condition:
+            if len(self._latencies) == 0:
+                return None
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile))
+        return latencies[index]
+
+    def sample_count(self) -> int:
+        return len(self._latencies)
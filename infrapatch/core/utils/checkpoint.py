@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging as log
+import threading
+from pathlib import Path
+from typing import IO, Any, Optional, Sequence, Union
+
+from infrapatch.core.models.versioned_resource import VersionedResource
+
+
+class CheckpointException(Exception):
+    pass
+
+
+class CheckpointRecordType:
+    RESOLVED = "resolved"
+    PATCHED = "patched"
+    COMMIT = "commit"
+
+
+# Append only journal of the progress of a run, so an interrupted run can be resumed without repeating the completed work.
+# Every record is written as one json line as soon as the work is done, records of a journal are only used if they still match the files.
+class CheckpointJournal:
+    def __init__(self, journal_file: Path, resume: bool = False):
+        self.journal_file = journal_file
+        self.root = journal_file.parent.absolute()
+        self._lock = threading.Lock()
+        self._file: Union[IO[str], None] = None
+        self._resolved: dict[str, tuple[Optional[str], Optional[str]]] = {}
+        self._patched: dict[str, dict[str, Any]] = {}
+        # hash of each file after the last patch, patches are only valid if the file was not changed since
+        self._file_hashes: dict[str, str] = {}
+        self._commits: dict[str, str] = {}
+        if resume:
+            self._load()
+        elif self.journal_file.exists():
+            # the journal of an interrupted run is never discarded implicitly
+            raise CheckpointException(f"Checkpoint journal '{self.journal_file}' of an interrupted run exists, resume the run with --resume or delete the journal.")
+
+    def get_resolved(self, resource: VersionedResource) -> Union[tuple[Optional[str], Optional[str]], None]:
+        with self._lock:
+            return self._resolved.get(_get_resolve_key(resource))
+
+    def record_resolved(self, resource: VersionedResource, newest_version: Optional[str], source: Optional[str]) -> None:
+        key = _get_resolve_key(resource)
+        with self._lock:
+            self._resolved[key] = (newest_version, source)
+            self._append({"type": CheckpointRecordType.RESOLVED, "key": key, "newest_version": newest_version, "source": source})
+
+    def get_patched(self, resource: VersionedResource) -> Union[tuple[Optional[str], Optional[str]], None]:
+        # returns the resolve result of a patched resource, if its file was not changed since it was patched
+        with self._lock:
+            record = self._patched.get(self._get_resource_key(resource))
+            if record is None:
+                return None
+            recorded_hash = self._file_hashes.get(record["file"])
+        if recorded_hash is None or recorded_hash != _get_file_hash(resource.source_file):
+            return None
+        return record["newest_version"], record["source"]
+
+    def is_patched(self, resource: VersionedResource) -> bool:
+        return self.get_patched(resource) is not None
+
+    def record_patched(self, resource: VersionedResource) -> None:
+        key = self._get_resource_key(resource)
+        file = self._get_relative_path(resource.source_file)
+        file_hash = _get_file_hash(resource.source_file)
+        # the parsed version of a patched resource is the newest version, so it is resolved from the journal instead of its old resolve record
+        source = f"https://github.com/{resource.github_repo}" if resource.github_repo is not None else None
+        record = {"type": CheckpointRecordType.PATCHED, "key": key, "file": file, "hash": file_hash, "newest_version": resource.newest_version_base, "source": source}
+        with self._lock:
+            self._patched[key] = record
+            if file_hash is not None:
+                self._file_hashes[file] = file_hash
+            self._append(record)
+
+    def get_commit(self, resource: VersionedResource) -> Union[str, None]:
+        with self._lock:
+            return self._commits.get(self._get_resource_key(resource))
+
+    def record_commit(self, commit: str, resources: Sequence[VersionedResource]) -> None:
+        keys = [self._get_resource_key(resource) for resource in resources]
+        with self._lock:
+            for key in keys:
+                self._commits[key] = commit
+            self._append({"type": CheckpointRecordType.COMMIT, "commit": commit, "keys": keys})
+
+    def complete(self) -> None:
+        # the run finished, so there is nothing left to resume
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.journal_file.exists():
+                self.journal_file.unlink()
+        log.debug(f"Removed checkpoint journal '{self.journal_file}'.")
+
+    def _append(self, record: dict[str, Any]) -> None:
+        if self._file is None:
+            self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.journal_file, "a")
+        self._file.write(f"{json.dumps(record)}\n")
+        # flushed after every record, so the progress is kept if the process is killed
+        self._file.flush()
+
+    def _load(self) -> None:
+        if not self.journal_file.is_file():
+            log.info(f"No checkpoint journal found at '{self.journal_file}', starting from the beginning.")
+            return
+        try:
+            with open(self.journal_file, "r") as file:
+                lines = file.readlines()
+        except Exception as e:
+            raise CheckpointException(f"Could not read checkpoint journal '{self.journal_file}': {e}")
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line is incomplete if the process was killed while writing it
+                log.debug(f"Skipping incomplete record in checkpoint journal '{self.journal_file}'.")
+                continue
+            if record["type"] == CheckpointRecordType.RESOLVED:
+                self._resolved[record["key"]] = (record["newest_version"], record["source"])
+            elif record["type"] == CheckpointRecordType.PATCHED:
+                self._patched[record["key"]] = record
+                if record["hash"] is not None:
+                    self._file_hashes[record["file"]] = record["hash"]
+            elif record["type"] == CheckpointRecordType.COMMIT:
+                for key in record["keys"]:
+                    self._commits[key] = record["commit"]
+        log.info(f"Resuming from checkpoint journal '{self.journal_file}' with {len(self._resolved)} resolved and {len(self._patched)} patched resources.")
+
+    def _get_resource_key(self, resource: VersionedResource) -> str:
+        # the line of a resource does not change when its version is patched
+        return f"{self._get_relative_path(resource.source_file)}:{resource.start_line_number}:{type(resource).__name__}:{resource.name}"
+
+    def _get_relative_path(self, file: Path) -> str:
+        path = file.absolute()
+        return path.relative_to(self.root).as_posix() if path.is_relative_to(self.root) else path.as_posix()
+
+
+def _get_resolve_key(resource: VersionedResource) -> str:
+    # the newest version only depends on the source and the current version, e.g. the prefix of git tags
+    source = getattr(resource, "source_string", resource.name)
+    return f"{type(resource).__name__}:{source}:{resource.current_version}"
+
+
+def _get_file_hash(file: Path) -> Union[str, None]:
+    try:
+        return hashlib.sha256(file.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,195 @@
+import ctypes
+import ctypes.util
+import logging as log
+import os
+import select
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Protocol, Union
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+INOTIFY_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+
+class FileWatcherException(Exception):
+    pass
+
+
+@dataclass
+class FileChanges:
+    files: set[Path] = field(default_factory=set)
+    # set if single file changes are not known, e.g. if a directory was moved or events were lost
+    rescan_all: bool = False
+
+    def is_empty(self) -> bool:
+        return len(self.files) == 0 and not self.rescan_all
+
+
+class FileWatcherInterface(Protocol):
+    def wait_for_changes(self, timeout: Union[float, None] = None) -> FileChanges: ...
+
+    def close(self) -> None: ...
+
+
+def _is_watched_file(path: Path, suffixes: tuple[str, ...]) -> bool:
+    return path.suffix in suffixes
+
+
+def _is_ignored_directory(name: str) -> bool:
+    # hidden directories like .git or .terraform are not scanned for .tf files either
+    return name.startswith(".")
+
+
+# Watches a directory tree with inotify, which reports changes within milliseconds without scanning the tree.
+# Every directory needs its own watch, new directories are added as they are created.
+class InotifyFileWatcher(FileWatcherInterface):
+    def __init__(self, root: Path, suffixes: tuple[str, ...] = (".tf",), debounce: float = 0.05):
+        self.root = root.absolute()
+        self.suffixes = suffixes
+        # editors often write a file in multiple steps, the events within this time are reported together
+        self.debounce = debounce
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise FileWatcherException(f"Could not initialize inotify: {os.strerror(ctypes.get_errno())}")
+        self._directories: dict[int, Path] = {}
+        try:
+            self._add_watches(self.root)
+        except Exception:
+            self.close()
+            raise
+
+    def wait_for_changes(self, timeout: Union[float, None] = None) -> FileChanges:
+        changes = FileChanges()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if len(readable) == 0:
+            return changes
+        self._read_events(changes)
+        while True:
+            readable, _, _ = select.select([self._fd], [], [], self.debounce)
+            if len(readable) == 0:
+                return changes
+            self._read_events(changes)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watches(self, directory: Path) -> list[Path]:
+        # returns the watched files found in the directory tree, since files created before the watch was added are not reported
+        found_files: list[Path] = []
+        for current, directories, files in os.walk(directory):
+            directories[:] = [name for name in directories if not _is_ignored_directory(name)]
+            watch_descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(current), INOTIFY_WATCH_MASK)
+            if watch_descriptor < 0:
+                raise FileWatcherException(f"Could not watch directory '{current}': {os.strerror(ctypes.get_errno())}")
+            self._directories[watch_descriptor] = Path(current)
+            found_files.extend(Path(current).joinpath(name) for name in files if _is_watched_file(Path(name), self.suffixes))
+        return found_files
+
+    def _read_events(self, changes: FileChanges) -> None:
+        try:
+            buffer = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buffer):
+            watch_descriptor, mask, _, length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+            name = os.fsdecode(buffer[offset + INOTIFY_EVENT_HEADER.size : offset + INOTIFY_EVENT_HEADER.size + length].rstrip(b"\0"))
+            offset += INOTIFY_EVENT_HEADER.size + length
+            self._handle_event(watch_descriptor, mask, name, changes)
+
+    def _handle_event(self, watch_descriptor: int, mask: int, name: str, changes: FileChanges) -> None:
+        if mask & IN_Q_OVERFLOW:
+            log.debug("Inotify event queue overflowed, rescanning all files.")
+            changes.rescan_all = True
+            return
+        if mask & IN_IGNORED:
+            self._directories.pop(watch_descriptor, None)
+            return
+        directory = self._directories.get(watch_descriptor)
+        if directory is None:
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # the files of a moved or deleted directory are not reported one by one
+            if directory != self.root:
+                changes.rescan_all = True
+            return
+        path = directory.joinpath(name)
+        if mask & IN_ISDIR:
+            if _is_ignored_directory(name):
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                changes.files.update(self._add_watches(path))
+            elif mask & IN_MOVED_FROM:
+                changes.rescan_all = True
+            return
+        if _is_watched_file(path, self.suffixes):
+            changes.files.add(path)
+
+
+# Fallback for platforms without inotify, compares the modification times of all watched files in an interval.
+class PollingFileWatcher(FileWatcherInterface):
+    def __init__(self, root: Path, suffixes: tuple[str, ...] = (".tf",), interval: float = 1.0):
+        self.root = root.absolute()
+        self.suffixes = suffixes
+        self.interval = interval
+        self._snapshot = self._get_snapshot()
+
+    def wait_for_changes(self, timeout: Union[float, None] = None) -> FileChanges:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait = self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(wait)
+            snapshot = self._get_snapshot()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys() if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if len(changed) > 0 or (deadline is not None and time.monotonic() >= deadline):
+                return FileChanges(files=changed)
+
+    def close(self) -> None:
+        pass
+
+    def _get_snapshot(self) -> dict[Path, tuple[int, int]]:
+        snapshot = {}
+        for current, directories, files in os.walk(self.root):
+            directories[:] = [name for name in directories if not _is_ignored_directory(name)]
+            for name in files:
+                path = Path(current).joinpath(name)
+                if not _is_watched_file(path, self.suffixes):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+
+def create_file_watcher(root: Path, poll_interval: Union[float, None] = None) -> FileWatcherInterface:
+    if poll_interval is None and sys.platform.startswith("linux"):
+        try:
+            return InotifyFileWatcher(root)
+        except Exception as e:
+            # e.g. if the limit of inotify watches is reached
+            log.warning(f"Could not watch '{root}' with inotify, falling back to polling: {e}")
+    return PollingFileWatcher(root, interval=poll_interval if poll_interval is not None else 1.0)
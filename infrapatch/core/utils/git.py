@@ -1,18 +1,37 @@
 from pathlib import Path
 import subprocess
-from typing import Union
+from typing import Sequence, Union
 import logging as log
 
+import pygit2
+
+import infrapatch.core.constants as cs
+
 
 class GitException(Exception):
     pass
 
 
+# Git operations of the working repository.
+# Commits, branch checkouts and diffs run in-process with pygit2, operations talking to the remote (fetch, push) and rebases use the git cli,
+# since they depend on the credentials, shallow and sparse checkout support of the git cli.
 class Git:
     _repo_path: Path
 
     def __init__(self, repo_path: Path):
         self._repo_path = repo_path
+        self._repository: Union[pygit2.Repository, None] = None
+        # paths committed in-process, which still have to be updated in the index file of the working tree
+        self._unsynced_paths: set[str] = set()
+
+    @property
+    def repository(self) -> pygit2.Repository:
+        if self._repository is None:
+            try:
+                self._repository = pygit2.Repository(self._repo_path.absolute().as_posix())
+            except Exception as e:
+                raise GitException(f"Could not open git repository '{self._repo_path}': {e}")
+        return self._repository
 
     def run_git_command(self, command: list[str]) -> tuple[str, Union[str, None]]:
         command = ["git", *command]
@@ -30,9 +49,171 @@ class Git:
         log.debug("Fetching origin")
         self.run_git_command(["fetch", "origin"])
 
+    def fetch_branches(self, branches: list[str], depth: Union[int, None] = None):
+        # only the given branches are fetched, with a depth the history is limited to the given number of commits
+        log.debug(f"Fetching branches {', '.join(branches)} from origin with depth {depth if depth is not None else 'unlimited'}")
+        arguments = ["fetch", "--no-tags"]
+        if depth is not None:
+            arguments.append(f"--depth={depth}")
+        if self.is_partial_clone():
+            arguments.append("--filter=blob:none")
+        refspecs = [f"+refs/heads/{branch}:refs/remotes/origin/{branch}" for branch in branches]
+        self.run_git_command([*arguments, "origin", *refspecs])
+
+    def is_shallow(self) -> bool:
+        stdout, _ = self.run_git_command(["rev-parse", "--is-shallow-repository"])
+        return stdout.strip() == "true"
+
+    def is_partial_clone(self) -> bool:
+        try:
+            stdout, _ = self.run_git_command(["config", "--get", "remote.origin.promisor"])
+        except GitException:
+            return False
+        return stdout.strip() == "true"
+
+    def ensure_merge_base(self, first: str, second: str, branches: list[str], deepen_by: int = 50, max_attempts: int = 5):
+        # deepens a shallow history until the merge base of both refs is available, which is needed for rebases
+        for attempt in range(max_attempts):
+            if self._has_merge_base(first, second):
+                return
+            if not self.is_shallow():
+                raise GitException(f"'{first}' and '{second}' have no common history.")
+            log.debug(f"No merge base of '{first}' and '{second}' found, deepening history by {deepen_by} commits (attempt {attempt + 1}).")
+            self.run_git_command(["fetch", "--no-tags", f"--deepen={deepen_by}", "origin", *[f"+refs/heads/{branch}:refs/remotes/origin/{branch}" for branch in branches]])
+            deepen_by *= 2
+        if self._has_merge_base(first, second):
+            return
+        log.debug(f"Still no merge base of '{first}' and '{second}' found, fetching the whole history.")
+        self.run_git_command(["fetch", "--no-tags", "--unshallow", "origin", *[f"+refs/heads/{branch}:refs/remotes/origin/{branch}" for branch in branches]])
+
+    def _has_merge_base(self, first: str, second: str) -> bool:
+        try:
+            self.run_git_command(["merge-base", first, second])
+        except GitException:
+            return False
+        return True
+
+    def enable_sparse_checkout(self, patterns: list[str]):
+        # files not matching the patterns are removed from the working tree, they are not needed to patch resources
+        log.debug(f"Enabling sparse checkout with patterns {', '.join(patterns)}")
+        self.run_git_command(["sparse-checkout", "set", "--no-cone", *patterns])
+
     def checkout_branch(self, target: str, origin: str):
         log.debug(f"Checking out branch {target} from {origin}")
-        self.run_git_command(["checkout", "-b", target, origin])
+        self._switch_branch(target, origin, force=False)
+
+    def reset_branch(self, target: str, origin: str):
+        log.debug(f"Resetting branch {target} to {origin}")
+        self._switch_branch(target, origin, force=True)
+
+    def _switch_branch(self, target: str, origin: str, force: bool):
+        if self._is_sparse_or_partial():
+            # libgit2 would check out the files excluded by the sparse checkout and can not fetch missing blobs
+            self.run_git_command(["checkout", "-B" if force else "-b", target, origin])
+            return
+        repository = self.repository
+        try:
+            commit = repository.revparse_single(origin).peel(pygit2.Commit)
+            if not force and target in repository.branches.local:
+                raise GitException(f"Branch '{target}' already exists.")
+            repository.checkout_tree(commit)
+            # HEAD is detached first, since the checked out branch can not be moved
+            repository.set_head(commit.id)
+            repository.branches.local.create(target, commit, force=True)
+            repository.set_head(f"refs/heads/{target}")
+        except GitException:
+            raise
+        except Exception as e:
+            raise GitException(f"Could not check out branch '{target}' from '{origin}': {e}")
+
+    def _is_sparse_or_partial(self) -> bool:
+        config = self.repository.config
+        if "core.sparseCheckout" in config and config.get_bool("core.sparseCheckout"):
+            return True
+        return self.is_partial_clone()
+
+    def get_head_commit(self) -> str:
+        try:
+            return str(self.repository.head.target)
+        except Exception as e:
+            raise GitException(f"Could not get head commit: {e}")
+
+    def contains_commit(self, commit: str) -> bool:
+        # true if the commit is the head commit or one of its ancestors
+        repository = self.repository
+        try:
+            head = repository.head.target
+            return str(head) == commit or repository.descendant_of(head, commit)
+        except Exception:
+            return False
+
+    def get_changed_files(self, from_ref: str, to_ref: str = "HEAD") -> list[Path]:
+        # renames are not detected, so they are reported as deleted and added file and the resources of both paths are updated
+        repository = self.repository
+        try:
+            diff = repository.diff(repository.revparse_single(from_ref).peel(pygit2.Commit), repository.revparse_single(to_ref).peel(pygit2.Commit))
+        except Exception as e:
+            raise GitException(f"Could not diff '{from_ref}' and '{to_ref}': {e}")
+        paths: list[str] = []
+        for delta in diff.deltas:
+            for path in [delta.old_file.path, delta.new_file.path]:
+                if path not in paths:
+                    paths.append(path)
+        return [self._repo_path.joinpath(path) for path in paths]
+
+    def commit_files(self, files: Sequence[Path], message: str) -> Union[str, None]:
+        # the tree is built from the current head tree and the blobs of the given files, without writing the index file of the working tree
+        repository = self.repository
+        try:
+            parent = repository.head.peel(pygit2.Commit)
+            index = pygit2.Index()
+            index.read_tree(parent.tree)
+            paths = []
+            for file in files:
+                path = file.absolute().relative_to(Path(repository.workdir).absolute()).as_posix()
+                paths.append(path)
+                if not file.is_file():
+                    if path in index:
+                        index.remove(path)
+                    continue
+                mode = index[path].mode if path in index else pygit2.GIT_FILEMODE_BLOB
+                index.add(pygit2.IndexEntry(path, repository.create_blob_fromdisk(file.absolute().as_posix()), mode))
+            tree_id = index.write_tree(repository)
+            if tree_id == parent.tree_id:
+                log.debug(f"Files {', '.join(paths)} did not change, skipping commit.")
+                return None
+            signature = self._get_signature()
+            commit_id = repository.create_commit("HEAD", signature, signature, message, tree_id, [parent.id])
+        except Exception as e:
+            raise GitException(f"Could not commit files {', '.join(file.as_posix() for file in files)}: {e}")
+        self._unsynced_paths.update(paths)
+        log.debug(f"Created commit {commit_id} with files {', '.join(paths)}.")
+        return str(commit_id)
+
+    def sync_index(self):
+        # updates the index file once for all files committed in-process, so the working tree is clean afterwards
+        if len(self._unsynced_paths) == 0:
+            return
+        index = self.repository.index
+        try:
+            index.read()
+            for path in sorted(self._unsynced_paths):
+                if Path(self.repository.workdir).joinpath(path).is_file():
+                    index.add(path)
+                elif path in index:
+                    index.remove(path)
+            index.write()
+        except Exception as e:
+            raise GitException(f"Could not update the index: {e}")
+        log.debug(f"Updated {len(self._unsynced_paths)} paths in the index.")
+        self._unsynced_paths.clear()
+
+    def _get_signature(self) -> pygit2.Signature:
+        try:
+            return self.repository.default_signature
+        except Exception:
+            log.debug(f"No git user configured, committing as {cs.APP_NAME}.")
+            return pygit2.Signature(cs.APP_NAME, "infrapatch@users.noreply.github.com")
 
     def push(self, additional_arguments: list[str] = []):
         self.run_git_command(["push", *additional_arguments])
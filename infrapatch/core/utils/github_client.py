@@ -0,0 +1,230 @@
+import json
+import logging as log
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Union
+from urllib import request
+from urllib.parse import quote, urlencode
+
+from infrapatch.core.utils.json_file import write_json_atomically
+from infrapatch.core.utils.request_scheduler import RequestScheduler, RequestSchedulerException, SchedulerResponse
+
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_CACHE_FILE_NAME = "github_cache.json"
+GITHUB_CACHE_FORMAT_VERSION = 1
+
+
+class GithubClientException(Exception):
+    def __init__(self, message: str, status: Union[int, None] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class GithubBranch:
+    name: str
+    sha: str
+
+
+@dataclass
+class GithubPullRequest:
+    number: int
+    head: str
+    base: str
+    body: str
+    url: str
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "GithubPullRequest":
+        return cls(number=values["number"], head=values["head"]["ref"], base=values["base"]["ref"], body=values.get("body") or "", url=values.get("html_url", ""))
+
+
+@dataclass
+class _CachedGithubResponse:
+    etag: Union[str, None]
+    last_modified: Union[str, None]
+    body: str
+
+
+# Thin client for the GitHub REST endpoints used by the action.
+# GET requests are memoized within a run and revalidated with ETags between runs, which does not count against the rate limit when nothing changed.
+# Requests are slowed down when the remaining rate limit runs low, so the quota lasts until it is reset.
+class GithubClient:
+    def __init__(
+        self,
+        token: str,
+        repository_name: str,
+        request_scheduler: Union[RequestScheduler, None] = None,
+        api_url: str = GITHUB_API_URL,
+        cache_directory: Union[Path, None] = None,
+        min_remaining_requests: int = 100,
+        max_throttle_seconds: float = 60,
+    ):
+        self.token = token
+        self.repository_name = repository_name
+        self.request_scheduler = request_scheduler if request_scheduler is not None else RequestScheduler()
+        self.api_url = api_url.rstrip("/")
+        self.cache_file = cache_directory.joinpath(GITHUB_CACHE_FILE_NAME) if cache_directory is not None else None
+        self.min_remaining_requests = min_remaining_requests
+        self.max_throttle_seconds = max_throttle_seconds
+        self.rate_limit_remaining: Union[int, None] = None
+        self.rate_limit_reset: Union[float, None] = None
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._memoized: dict[str, Any] = {}
+        self._conditional_cache: dict[str, _CachedGithubResponse] = {}
+        if self.cache_file is not None:
+            self._load(self.cache_file)
+
+    @property
+    def owner(self) -> str:
+        return self.repository_name.split("/")[0]
+
+    def get_branch(self, branch: str) -> Union[GithubBranch, None]:
+        try:
+            values = self._get(f"/repos/{self.repository_name}/branches/{quote(branch, safe='')}")
+        except GithubClientException as e:
+            if e.status == 404:
+                log.debug(f"Branch '{branch}' does not exist in repository '{self.repository_name}'.")
+                return None
+            raise
+        return GithubBranch(name=values["name"], sha=values["commit"]["sha"])
+
+    def create_branch(self, branch: str, sha: str) -> None:
+        self._send("POST", f"/repos/{self.repository_name}/git/refs", {"ref": f"refs/heads/{branch}", "sha": sha})
+
+    def get_pull_request(self, head: str, base: str) -> Union[GithubPullRequest, None]:
+        # the pull requests are filtered by github instead of listing all open pull requests
+        query = urlencode({"state": "open", "head": f"{self.owner}:{head}", "base": base})
+        pulls = [GithubPullRequest.from_dict(values) for values in self._get(f"/repos/{self.repository_name}/pulls?{query}")]
+        if len(pulls) == 0:
+            log.debug(f"No pull request found from '{head}' to '{base}'.")
+            return None
+        if len(pulls) > 1:
+            raise GithubClientException(f"Multiple pull requests found from '{head}' to '{base}'.")
+        log.debug(f"Pull request found from '{head}' to '{base}'.")
+        return pulls[0]
+
+    def create_pull_request(self, title: str, body: str, head: str, base: str) -> GithubPullRequest:
+        values = self._send("POST", f"/repos/{self.repository_name}/pulls", {"title": title, "body": body, "head": head, "base": base})
+        return GithubPullRequest.from_dict(values)
+
+    def update_pull_request_body(self, pull_request: GithubPullRequest, body: str) -> bool:
+        if pull_request.body.strip() == body.strip():
+            log.info(f"Body of pull request #{pull_request.number} did not change, skipping update.")
+            return False
+        self._send("PATCH", f"/repos/{self.repository_name}/pulls/{pull_request.number}", {"body": body})
+        pull_request.body = body
+        return True
+
+    def get_stats(self) -> dict:
+        return {"requests": self.requests, "not_modified": self.not_modified, "rate_limit_remaining": self.rate_limit_remaining}
+
+    def save(self) -> None:
+        if self.cache_file is None:
+            return
+        with self._lock:
+            content = {
+                "version": GITHUB_CACHE_FORMAT_VERSION,
+                "responses": {url: vars(response) for url, response in self._conditional_cache.items()},
+            }
+        write_json_atomically(self.cache_file, content)
+        log.debug(f"Saved github cache to '{self.cache_file}'.")
+
+    def _get(self, path: str) -> Any:
+        url = f"{self.api_url}{path}"
+        with self._lock:
+            if url in self._memoized:
+                log.debug(f"Using memoized response for '{url}'.")
+                return self._memoized[url]
+            cached_response = self._conditional_cache.get(url)
+        request_object = self._create_request("GET", url)
+        if cached_response is not None:
+            if cached_response.etag is not None:
+                request_object.add_header("If-None-Match", cached_response.etag)
+            if cached_response.last_modified is not None:
+                request_object.add_header("If-Modified-Since", cached_response.last_modified)
+        try:
+            response = self._request(request_object)
+            body = response.body.decode()
+            with self._lock:
+                self._conditional_cache[url] = _CachedGithubResponse(etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"), body=body)
+        except GithubClientException as e:
+            if e.status != 304 or cached_response is None:
+                raise
+            log.debug(f"Response for '{url}' not modified.")
+            with self._lock:
+                self.not_modified += 1
+            body = cached_response.body
+        values = json.loads(body)
+        with self._lock:
+            self._memoized[url] = values
+        return values
+
+    def _send(self, method: str, path: str, values: dict) -> Any:
+        url = f"{self.api_url}{path}"
+        request_object = self._create_request(method, url, json.dumps(values).encode())
+        request_object.add_header("Content-Type", "application/json")
+        response = self._request(request_object)
+        # changes can affect any memoized response, e.g. the branches or pull requests
+        with self._lock:
+            self._memoized.clear()
+        return json.loads(response.body) if len(response.body) > 0 else {}
+
+    def _create_request(self, method: str, url: str, data: Union[bytes, None] = None) -> request.Request:
+        request_object = request.Request(url, data=data, method=method)
+        request_object.add_header("Accept", "application/vnd.github+json")
+        request_object.add_header("X-GitHub-Api-Version", "2022-11-28")
+        request_object.add_header("Authorization", f"Bearer {self.token}")
+        return request_object
+
+    def _request(self, request_object: request.Request) -> SchedulerResponse:
+        self._throttle()
+        with self._lock:
+            self.requests += 1
+        try:
+            response = self.request_scheduler.get_response(request_object)
+        except RequestSchedulerException as e:
+            raise GithubClientException(f"GitHub request {request_object.get_method()} '{request_object.full_url}' failed: {e}", status=e.status)
+        self._update_rate_limit(response.headers)
+        return response
+
+    def _update_rate_limit(self, headers: dict[str, str]) -> None:
+        headers = {key.lower(): value for key, value in headers.items()}
+        if "x-ratelimit-remaining" not in headers:
+            return
+        with self._lock:
+            self.rate_limit_remaining = int(float(headers["x-ratelimit-remaining"]))
+            if "x-ratelimit-reset" in headers:
+                self.rate_limit_reset = float(headers["x-ratelimit-reset"])
+
+    def _throttle(self) -> None:
+        with self._lock:
+            remaining, reset = self.rate_limit_remaining, self.rate_limit_reset
+        if remaining is None or reset is None or remaining >= self.min_remaining_requests:
+            return
+        # spread the remaining requests over the time until the rate limit is reset
+        delay = min(self.max_throttle_seconds, max(0.0, reset - time.time()) / (remaining + 1))
+        if delay <= 0:
+            return
+        log.warning(f"Only {remaining} GitHub API requests remaining, waiting {delay:.1f}s before the next request.")
+        time.sleep(delay)
+
+    def _load(self, cache_file: Path) -> None:
+        if not cache_file.is_file():
+            log.debug(f"No github cache found at '{cache_file}'.")
+            return
+        try:
+            with open(cache_file, "r") as file:
+                content = json.load(file)
+        except Exception as e:
+            raise GithubClientException(f"Could not read github cache '{cache_file}': {e}")
+        if content.get("version") != GITHUB_CACHE_FORMAT_VERSION:
+            log.warning(f"Ignoring github cache '{cache_file}' with unsupported format version '{content.get('version')}'.")
+            return
+        for url, values in content.get("responses", {}).items():
+            self._conditional_cache[url] = _CachedGithubResponse(**values)
+        log.debug(f"Loaded {len(self._conditional_cache)} responses from github cache '{cache_file}'.")
@@ -0,0 +1,18 @@
+import json
+import tempfile
+from pathlib import Path
+from typing import Any
+
+
+def write_json_atomically(file: Path, content: Any) -> None:
+    # every write uses its own temporary file, so concurrent runs sharing a cache directory replace the file as a whole
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=file.parent, prefix=f"{file.name}.", suffix=".tmp", delete=False) as temp:
+        temp_file = Path(temp.name)
+        try:
+            json.dump(content, temp)
+        except Exception:
+            temp.close()
+            temp_file.unlink()
+            raise
+    temp_file.replace(file)
@@ -0,0 +1,84 @@
+import json
+import logging as log
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Union
+
+from infrapatch.core.utils.json_file import write_json_atomically
+
+RELEASE_NOTES_CACHE_FILE_NAME = "release_notes_cache.json"
+RELEASE_NOTES_CACHE_FORMAT_VERSION = 1
+
+
+class ReleaseNotesCacheException(Exception):
+    pass
+
+
+@dataclass
+class ReleaseNotesCacheEntry:
+    body: Union[str, None] = None  # None if the release does not exist
+    fetched_at: float = 0
+
+
+# Caches the bodies of github releases by repository and tag, including releases which don't exist.
+# Without a cache directory, the entries are only kept for the current run.
+class ReleaseNotesCache:
+    def __init__(self, cache_directory: Union[Path, None] = None, ttl: float = 604800, missing_ttl: float = 86400):
+        self.cache_file = cache_directory.joinpath(RELEASE_NOTES_CACHE_FILE_NAME) if cache_directory is not None else None
+        self.ttl = ttl
+        # missing releases might be published later on, so they are looked up again sooner
+        self.missing_ttl = missing_ttl
+        self._lock = threading.Lock()
+        self._entries: dict[str, ReleaseNotesCacheEntry] = {}
+        if self.cache_file is not None:
+            self._load(self.cache_file)
+
+    def get(self, repo: str, tag: str) -> Union[ReleaseNotesCacheEntry, None]:
+        with self._lock:
+            entry = self._entries.get(_get_key(repo, tag))
+        if entry is None or self._is_expired(entry):
+            return None
+        return entry
+
+    def set(self, repo: str, tag: str, body: Union[str, None]) -> None:
+        with self._lock:
+            self._entries[_get_key(repo, tag)] = ReleaseNotesCacheEntry(body=body, fetched_at=time.time())
+
+    def save(self) -> None:
+        if self.cache_file is None:
+            return
+        with self._lock:
+            # expired entries are dropped, so the file does not grow with every release ever looked up
+            content = {
+                "version": RELEASE_NOTES_CACHE_FORMAT_VERSION,
+                "releases": {key: asdict(entry) for key, entry in self._entries.items() if not self._is_expired(entry)},
+            }
+        write_json_atomically(self.cache_file, content)
+        log.debug(f"Saved release notes cache to '{self.cache_file}'.")
+
+    def _is_expired(self, entry: ReleaseNotesCacheEntry) -> bool:
+        ttl = self.ttl if entry.body is not None else self.missing_ttl
+        return time.time() - entry.fetched_at > ttl
+
+    def _load(self, cache_file: Path) -> None:
+        if not cache_file.is_file():
+            log.debug(f"No release notes cache found at '{cache_file}'.")
+            return
+        try:
+            with open(cache_file, "r") as file:
+                content = json.load(file)
+        except Exception as e:
+            raise ReleaseNotesCacheException(f"Could not read release notes cache '{cache_file}': {e}")
+        if content.get("version") != RELEASE_NOTES_CACHE_FORMAT_VERSION:
+            log.warning(f"Ignoring release notes cache '{cache_file}' with unsupported format version '{content.get('version')}'.")
+            return
+        for key, values in content.get("releases", {}).items():
+            self._entries[key] = ReleaseNotesCacheEntry(**values)
+        log.debug(f"Loaded {len(self._entries)} entries from release notes cache '{cache_file}'.")
+
+
+def _get_key(repo: str, tag: str) -> str:
+    # repository names are case insensitive on github, tags are not
+    return f"{repo.lower()}@{tag}"
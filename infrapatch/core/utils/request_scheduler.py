@@ -0,0 +1,278 @@
+import logging as log
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Union
+from urllib import request
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+
+from infrapatch.core.utils.adaptive_limiter import AdaptiveLimiter, RequestOutcome
+
+
+class RequestSchedulerException(Exception):
+    def __init__(self, message: str, status: Union[int, None] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class SchedulerResponse:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+@dataclass
+class HostLimits:
+    max_concurrency: int = 32  # upper bound for the adaptive concurrency limit
+    initial_concurrency: int = 4
+    requests_per_second: float = 0  # 0 disables rate limiting
+    burst: int = 1
+    max_retries: int = 4
+    hedge: bool = False  # send a second request when the first one is slower than the observed p95 latency
+
+    @classmethod
+    def from_dict(cls, values: dict[str, Any]) -> "HostLimits":
+        known_fields = {field.name: field.type for field in fields(cls)}
+        limits = cls()
+        for key, value in values.items():
+            if key not in known_fields:
+                raise Exception(f"Unknown registry limit '{key}', supported limits are: {', '.join(known_fields)}.")
+            if known_fields[key] is bool:
+                value = value if isinstance(value, bool) else str(value).lower() in ["true", "1", "yes", "y", "t"]
+            setattr(limits, key, known_fields[key](value))
+        if limits.max_concurrency < 1:
+            raise Exception("Registry limit 'max_concurrency' must be at least 1.")
+        return limits
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                    self._last_refill = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return False
+            if self.rate <= 0:
+                return True
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class _HostState:
+    def __init__(self, limits: HostLimits):
+        self.limits = limits
+        self.limiter = AdaptiveLimiter(max_limit=limits.max_concurrency, initial_limit=limits.initial_concurrency)
+        self.bucket = TokenBucket(limits.requests_per_second, limits.burst)
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        host_limits: Union[dict[str, HostLimits], None] = None,
+        default_limits: Union[HostLimits, None] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30,
+        hedge_min_samples: int = 20,
+        request_timeout: float = 30,
+    ):
+        self.host_limits = host_limits if host_limits is not None else {}
+        self.default_limits = default_limits if default_limits is not None else HostLimits()
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_min_samples = hedge_min_samples
+        self.request_timeout = request_timeout
+        self._hosts: dict[str, _HostState] = {}
+        self._hosts_lock = threading.Lock()
+        self._hedge_executor: Union[ThreadPoolExecutor, None] = None
+
+    def _get_host_state(self, host: str) -> _HostState:
+        with self._hosts_lock:
+            if host not in self._hosts:
+                limits = self.host_limits.get(host, self.default_limits)
+                log.debug(f"Using limits {limits} for host '{host}'.")
+                self._hosts[host] = _HostState(limits)
+            return self._hosts[host]
+
+    def get(self, request_object: request.Request, timeout: Union[float, None] = None) -> bytes:
+        return self.get_response(request_object, timeout).body
+
+    def get_response(self, request_object: request.Request, timeout: Union[float, None] = None) -> SchedulerResponse:
+        host = urlparse(request_object.full_url).hostname or ""
+        state = self._get_host_state(host)
+        # the timeout limits the whole request including retries, single attempts are additionally limited by the request timeout
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if state.limits.hedge and request_object.get_method() == "GET":
+            return self._get_hedged(request_object, state, deadline)
+        return self._get_with_retries(request_object, state, deadline)
+
+    def get_concurrency_limit(self, host: str) -> int:
+        return self._get_host_state(host).limiter.limit
+
+    def _get_hedged(self, request_object: request.Request, state: _HostState, deadline: Union[float, None]) -> SchedulerResponse:
+        hedge_delay = state.limiter.get_latency_percentile(0.95)
+        if hedge_delay is None or state.limiter.sample_count() < self.hedge_min_samples:
+            return self._get_with_retries(request_object, state, deadline)
+
+        executor = self._get_hedge_executor()
+        primary = executor.submit(self._get_with_retries, request_object, state, deadline)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if len(done) > 0:
+            return primary.result()
+
+        # only hedge if the host has spare capacity and the rate limit allows another request, otherwise the hedged request would add to the congestion
+        if not state.limiter.try_acquire():
+            return primary.result()
+        if not state.bucket.try_acquire():
+            state.limiter.release(0, RequestOutcome.CANCELLED)
+            return primary.result()
+        log.debug(f"Request '{request_object.full_url}' is slower than {hedge_delay:.3f}s, sending hedged request.")
+        hedged = executor.submit(self._attempt_hedged, request_object, state, deadline)
+        pending: set[Future] = {primary, hedged}
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+        # both requests failed, the error of the primary request includes its retries
+        return primary.result()
+
+    def _attempt_hedged(self, request_object: request.Request, state: _HostState, deadline: Union[float, None]) -> SchedulerResponse:
+        # errors are raised like the ones of the primary request, so callers only have to handle RequestSchedulerException
+        url = request_object.full_url
+        try:
+            return self._attempt(request_object, state, deadline, acquired=True)
+        except HTTPError as e:
+            raise RequestSchedulerException(f"Request '{url}' failed with status {e.code}: {e.reason}", status=e.code)
+        except (URLError, TimeoutError, ConnectionError) as e:
+            raise RequestSchedulerException(f"Request '{url}' failed: {e}")
+
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        with self._hosts_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(thread_name_prefix="infrapatch-hedge")
+            return self._hedge_executor
+
+    def close(self) -> None:
+        # hedged requests still running are not waited for, their results are not needed anymore
+        with self._hosts_lock:
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False, cancel_futures=True)
+                self._hedge_executor = None
+
+    def _get_with_retries(self, request_object: request.Request, state: _HostState, deadline: Union[float, None]) -> SchedulerResponse:
+        url = request_object.full_url
+        # only idempotent requests are safe to retry
+        max_retries = state.limits.max_retries if request_object.get_method() in ("GET", "HEAD") else 0
+        attempt = 0
+        while True:
+            state.bucket.acquire()
+            try:
+                return self._attempt(request_object, state, deadline)
+            except HTTPError as e:
+                if e.code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                    raise RequestSchedulerException(f"Request '{url}' failed with status {e.code}: {e.reason}", status=e.code)
+                wait_time = self._get_backoff(attempt)
+                retry_after = _parse_retry_after(e.headers.get("Retry-After") if e.headers is not None else None)
+                if retry_after is not None:
+                    # the registry is only requested again once it asks for it, the deadline ends the retries if it is asking for too long
+                    wait_time = retry_after
+                    state.bucket.pause(wait_time)
+                log.debug(f"Request '{url}' returned retryable status {e.code}, retrying in {wait_time:.2f}s.")
+            except (URLError, TimeoutError, ConnectionError) as e:
+                if attempt >= max_retries:
+                    raise RequestSchedulerException(f"Request '{url}' failed: {e}")
+                wait_time = self._get_backoff(attempt)
+                log.debug(f"Request '{url}' failed with '{e}', retrying in {wait_time:.2f}s.")
+            if deadline is not None and time.monotonic() + wait_time >= deadline:
+                raise RequestSchedulerException(f"Request '{url}' failed, no time left for retry attempt {attempt + 1}.")
+            attempt += 1
+            time.sleep(wait_time)
+
+    def _attempt(self, request_object: request.Request, state: _HostState, deadline: Union[float, None], acquired: bool = False) -> SchedulerResponse:
+        timeout = self.request_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                if acquired:
+                    state.limiter.release(0, RequestOutcome.CANCELLED)
+                raise TimeoutError(f"Deadline for request '{request_object.full_url}' exceeded.")
+        if not acquired and not state.limiter.acquire(timeout=timeout if deadline is not None else None):
+            raise TimeoutError(f"Deadline for request '{request_object.full_url}' exceeded while waiting for a free request slot.")
+        start = time.monotonic()
+        outcome = RequestOutcome.ERROR
+        try:
+            with request.urlopen(request_object, timeout=timeout) as response:
+                scheduler_response = SchedulerResponse(status=response.status, headers=dict(response.headers.items()), body=response.read())
+            outcome = RequestOutcome.SUCCESS
+            return scheduler_response
+        except HTTPError as e:
+            if e.code in THROTTLE_STATUS_CODES:
+                outcome = RequestOutcome.THROTTLED
+            elif e.code < 500:
+                # client errors like 404 are regular answers of a healthy registry
+                outcome = RequestOutcome.SUCCESS
+            raise
+        finally:
+            state.limiter.release(time.monotonic() - start, outcome)
+
+    def _get_backoff(self, attempt: int) -> float:
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+
+def _parse_retry_after(value: Union[str, None]) -> Union[float, None]:
+    if value is None or value.strip() == "":
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        log.debug(f"Could not parse Retry-After header value '{value}'.")
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,100 @@
+import logging as log
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+
+class BudgetPhase:
+    PARSE = "parse"
+    RESOLVE = "resolve"
+    RELEASE_NOTES = "release_notes"
+    PATCH = "patch"
+
+    @classmethod
+    def all(cls) -> list[str]:
+        return [cls.PARSE, cls.RESOLVE, cls.RELEASE_NOTES, cls.PATCH]
+
+
+# The time of a phase is counted across all its entries, e.g. the resolve phases of all providers share one phase budget.
+# The budget is shared by the threads of a run, so the phase state is guarded by a lock.
+class RunBudget:
+    def __init__(self, deadline: Union[float, None] = None, phase_budgets: Union[dict[str, float], None] = None, request_timeout: float = 30):
+        self.phase_budgets = phase_budgets if phase_budgets is not None else {}
+        for phase in self.phase_budgets:
+            if phase not in BudgetPhase.all():
+                raise Exception(f"Unknown phase '{phase}', supported phases are: {', '.join(BudgetPhase.all())}.")
+        self.request_timeout = request_timeout
+        self._run_deadline = time.monotonic() + deadline if deadline is not None else None
+        self._lock = threading.Lock()
+        # seconds spent in finished entries of a phase, and start time and number of entries of the running phases
+        self._phase_elapsed: dict[str, float] = {}
+        self._running_phases: dict[str, tuple[float, int]] = {}
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        with self._lock:
+            started, entries = self._running_phases.get(phase, (time.monotonic(), 0))
+            self._running_phases[phase] = (started, entries + 1)
+        log.debug(f"Starting phase '{phase}' with {self._format_remaining()} remaining.")
+        try:
+            yield
+        finally:
+            with self._lock:
+                started, entries = self._running_phases[phase]
+                if entries > 1:
+                    self._running_phases[phase] = (started, entries - 1)
+                else:
+                    del self._running_phases[phase]
+                    self._phase_elapsed[phase] = self._phase_elapsed.get(phase, 0.0) + time.monotonic() - started
+
+    def get_phase_elapsed(self, phase: str) -> float:
+        with self._lock:
+            elapsed = self._phase_elapsed.get(phase, 0.0)
+            if phase in self._running_phases:
+                elapsed += time.monotonic() - self._running_phases[phase][0]
+        return elapsed
+
+    def remaining(self) -> Union[float, None]:
+        with self._lock:
+            deadlines = [self._run_deadline] if self._run_deadline is not None else []
+            for phase, (started, _) in self._running_phases.items():
+                if phase in self.phase_budgets:
+                    deadlines.append(started + self.phase_budgets[phase] - self._phase_elapsed.get(phase, 0.0))
+        if len(deadlines) == 0:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            with self._lock:
+                running_phases = ", ".join(self._running_phases)
+            log.debug(f"Time budget for phases '{running_phases}' is exhausted.")
+            return True
+        return False
+
+    def get_request_timeout(self) -> float:
+        remaining = self.remaining()
+        if remaining is None:
+            return self.request_timeout
+        return min(self.request_timeout, remaining)
+
+    def _format_remaining(self) -> str:
+        remaining = self.remaining()
+        if remaining is None:
+            return "unlimited time"
+        return f"{remaining:.1f}s"
+
+
+def parse_phase_budgets(phase_budgets_string: str) -> dict[str, float]:
+    phase_budgets = {}
+    for phase_budget in phase_budgets_string.split(","):
+        if phase_budget.strip() == "":
+            continue
+        try:
+            phase, seconds = phase_budget.split("=", 1)
+            phase_budgets[phase.strip()] = float(seconds)
+        except ValueError as e:
+            raise Exception(f"Invalid phase budget '{phase_budget}', expected format '<phase>=<seconds>': {e}")
+    return phase_budgets
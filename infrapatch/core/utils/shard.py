@@ -0,0 +1,109 @@
+import json
+import logging as log
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+from pytablewriter import MarkdownTableWriter
+
+from infrapatch.core.models.statistics import Statistics
+from infrapatch.core.models.versioned_resource import ResourceStatus, VersionedResource
+
+STATISTICS_COUNTERS = ["errors", "resources_patched", "resources_pending_update", "resources_timed_out", "total_resources"]
+
+
+class ShardException(Exception):
+    pass
+
+
+class ShardMode:
+    FILE = "file"  # every shard parses and resolves a part of the .tf files
+    SOURCE = "source"  # every shard parses all .tf files, but only resolves a part of the distinct sources
+
+    @classmethod
+    def all(cls) -> list[str]:
+        return [cls.FILE, cls.SOURCE]
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int  # starts at 1, like the shard options of most test runners
+    count: int
+    mode: str = ShardMode.FILE
+
+    @property
+    def name(self) -> str:
+        return f"{self.index}-of-{self.count}"
+
+    def select(self, keys: Iterable[str]) -> set[str]:
+        # every shard sees the same keys, so distributing the sorted keys round robin is deterministic and balanced
+        return set(sorted(set(keys))[self.index - 1 :: self.count])
+
+
+def parse_shard(value: str, mode: str = ShardMode.FILE) -> Shard:
+    try:
+        index, count = [int(part) for part in value.split("/")]
+    except ValueError:
+        raise ShardException(f"Invalid shard '{value}', expected format '<index>/<count>', e.g. '1/4'.")
+    if count < 1 or index < 1 or index > count:
+        raise ShardException(f"Invalid shard '{value}', the index has to be between 1 and {max(count, 1)}.")
+    if mode not in ShardMode.all():
+        raise ShardException(f"Unknown shard mode '{mode}', supported modes are: {', '.join(ShardMode.all())}.")
+    return Shard(index, count, mode)
+
+
+def merge_statistics_files(statistics_files: Sequence[Path]) -> dict[str, Any]:
+    # resources are identified by their file, line and name, so a shard which was run twice is only counted once
+    providers: dict[str, dict[str, dict[str, Any]]] = {}
+    for statistics_file in statistics_files:
+        try:
+            with open(statistics_file, "r") as file:
+                partial = json.load(file)
+        except Exception as e:
+            raise ShardException(f"Could not read statistics file '{statistics_file}': {e}")
+        for provider_name, provider_statistics in partial.get("providers", {}).items():
+            resources = providers.setdefault(provider_name, {})
+            for resource in provider_statistics.get("resources", []):
+                resources[f"{resource['source_file']}:{resource['start_line_number']}:{resource['name']}"] = resource
+        log.debug(f"Merged statistics file '{statistics_file}'.")
+
+    merged: dict[str, Any] = {counter: 0 for counter in STATISTICS_COUNTERS}
+    merged["providers"] = {}
+    for provider_name, resources in providers.items():
+        provider_statistics = _get_provider_statistics(sorted(resources.values(), key=lambda resource: (resource["source_file"], resource["start_line_number"])))
+        merged["providers"][provider_name] = provider_statistics
+        for counter in STATISTICS_COUNTERS:
+            merged[counter] += provider_statistics[counter]
+    return merged
+
+
+def _get_provider_statistics(resources: list[dict[str, Any]]) -> dict[str, Any]:
+    models = [VersionedResource.model_validate(resource) for resource in resources]
+    return {
+        "errors": len([resource for resource in models if resource.status == ResourceStatus.PATCH_ERROR]),
+        "resources_patched": len([resource for resource in models if resource.status == ResourceStatus.PATCHED]),
+        "resources_pending_update": len([resource for resource in models if resource.check_if_up_to_date() is False]),
+        "resources_timed_out": len([resource for resource in models if resource.status == ResourceStatus.TIMED_OUT]),
+        "total_resources": len(models),
+        "resources": resources,
+    }
+
+
+def get_merged_markdown_report(merged: dict[str, Any]) -> str:
+    # tables of the pending and changed resources per provider followed by the statistics, like the pull request body of the action
+    body = ""
+    for provider_name, provider_statistics in merged["providers"].items():
+        rows = []
+        for resource in provider_statistics["resources"]:
+            model = VersionedResource.model_validate(resource)
+            if model.check_if_up_to_date() and model.status not in [ResourceStatus.PATCHED, ResourceStatus.PATCH_ERROR]:
+                continue
+            rows.append([resource["name"], resource.get("source_string", ""), resource["current_version"], resource.get("newest_version_string"), resource["status"]])
+        if len(rows) == 0:
+            continue
+        table = MarkdownTableWriter(table_name=provider_name.replace("_", " ").title(), headers=["Name", "Source", "Current", "Newest", "Status"], value_matrix=rows)
+        body += table.dumps()
+        body += "\n"
+    body += Statistics.model_validate(merged).get_markdown_table().dumps()
+    body += "\n"
+    return body
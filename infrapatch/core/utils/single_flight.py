@@ -0,0 +1,40 @@
+import logging as log
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+# Coalesces concurrent calls for the same key: the first caller executes the function, later callers wait for its result or error.
+class SingleFlight:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            log.debug(f"Waiting for in-flight call with key '{key}'.")
+            return future.result()  # type: ignore
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)  # type: ignore
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        future.set_result(result)  # type: ignore
+        return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
@@ -0,0 +1,75 @@
+import gzip
+import json
+import logging as log
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Union
+
+from infrapatch.core.models.statistics import ProviderStatistics, Statistics
+from infrapatch.core.models.versioned_resource import ResourceStatus, VersionedResource
+
+
+class StatisticsStreamRecordType:
+    RESOURCE = "resource"
+    PROVIDER_STATISTICS = "provider_statistics"
+    STATISTICS = "statistics"
+
+
+@dataclass
+class StatisticsCounter:
+    errors: int = 0
+    resources_patched: int = 0
+    resources_pending_update: int = 0
+    resources_timed_out: int = 0
+    total_resources: int = 0
+
+    def add(self, resource: VersionedResource) -> None:
+        # counts like the statistics of the provider handler, without keeping the resource
+        self.errors += resource.status == ResourceStatus.PATCH_ERROR
+        self.resources_patched += resource.status == ResourceStatus.PATCHED
+        self.resources_pending_update += resource.check_if_up_to_date() is False
+        self.resources_timed_out += resource.status == ResourceStatus.TIMED_OUT
+        self.total_resources += 1
+
+    def get_provider_statistics(self) -> ProviderStatistics:
+        return ProviderStatistics(**vars(self), resources=[])
+
+
+# Writes the statistics as NDJSON, one line per resource followed by one line per provider and one for all providers.
+# Files ending with .gz are compressed with gzip.
+class StatisticsStreamWriter:
+    def __init__(self, statistics_file: Path):
+        self.statistics_file = statistics_file
+        self._file: Union[IO[str], None] = None
+
+    def __enter__(self) -> "StatisticsStreamWriter":
+        log.debug(f"Streaming statistics to {self.statistics_file.absolute().as_posix()}.")
+        if self.statistics_file.suffix == ".gz":
+            self._file = gzip.open(self.statistics_file, "wt")
+        else:
+            self._file = open(self.statistics_file, "w")
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write_resource(self, provider_name: str, resource: VersionedResource) -> None:
+        # the resource is serialized by pydantic and embedded as is, instead of parsing it into a dict first
+        self._write_line(f'{{"type": "{StatisticsStreamRecordType.RESOURCE}", "provider": {json.dumps(provider_name)}, "resource": {resource.model_dump_json()}}}')
+
+    def write_statistics(self, statistics: Statistics) -> None:
+        for provider_name, provider_statistics in statistics.providers.items():
+            self._write_record(
+                {"type": StatisticsStreamRecordType.PROVIDER_STATISTICS, "provider": provider_name, **provider_statistics.model_dump(mode="json", exclude={"resources"})}
+            )
+        self._write_record({"type": StatisticsStreamRecordType.STATISTICS, **statistics.model_dump(mode="json", exclude={"providers"})})
+
+    def _write_record(self, record: dict[str, Any]) -> None:
+        self._write_line(json.dumps(record))
+
+    def _write_line(self, line: str) -> None:
+        if self._file is None:
+            raise Exception("Statistics stream is not open.")
+        self._file.write(f"{line}\n")
@@ -0,0 +1,115 @@
+import json
+import logging as log
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import infrapatch.core.constants as cs
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule, TerraformProvider, VersionedTerraformResource
+from infrapatch.core.utils.terraform.registry_handler import RegistryHandlerInterface
+
+
+class BulkResolverException(Exception):
+    pass
+
+
+class ResolveResourceType:
+    MODULE = "module"
+    PROVIDER = "provider"
+
+
+@dataclass
+class ResolveRequest:
+    source: str
+    resource_type: Optional[str] = None  # detected from the source if not set
+    index: int = 0
+
+
+@dataclass
+class ResolveResult:
+    index: int
+    source: str
+    resource_type: Optional[str] = None
+    newest_version: Optional[str] = None
+    source_url: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+
+# Resolves the newest version and source url of registry sources without scanning terraform files.
+# Results are yielded as soon as they are available, so the order of the results does not match the order of the requests.
+class BulkResolver:
+    def __init__(self, registry_handler: RegistryHandlerInterface, max_workers: int = cs.DEFAULT_RESOLVE_WORKERS):
+        self.registry_handler = registry_handler
+        self.max_workers = max_workers
+
+    def resolve(self, requests: Iterable[Union[str, ResolveRequest]]) -> Iterator[ResolveResult]:
+        # the number of pending lookups is bounded, so large or streamed inputs are not read into memory at once
+        max_pending = self.max_workers * 4
+        pending: dict[Future, ResolveRequest] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="infrapatch-resolve") as executor:
+            for index, resolve_request in enumerate(requests):
+                if isinstance(resolve_request, str):
+                    resolve_request = ResolveRequest(source=resolve_request, index=index)
+                pending[executor.submit(self._resolve, resolve_request)] = resolve_request
+                if len(pending) >= max_pending:
+                    yield from self._collect(pending, wait_for_all=False)
+            yield from self._collect(pending, wait_for_all=True)
+
+    def _collect(self, pending: dict[Future, ResolveRequest], wait_for_all: bool) -> Iterator[ResolveResult]:
+        while len(pending) > 0:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                yield future.result()
+            if not wait_for_all:
+                return
+
+    def _resolve(self, resolve_request: ResolveRequest) -> ResolveResult:
+        result = ResolveResult(index=resolve_request.index, source=resolve_request.source, resource_type=resolve_request.resource_type)
+        try:
+            resource = _create_resource(resolve_request)
+            result.resource_type = ResolveResourceType.MODULE if isinstance(resource, TerraformModule) else ResolveResourceType.PROVIDER
+            resource.newest_version = self.registry_handler.get_newest_version(resource)
+            result.newest_version = resource.newest_version
+            if result.newest_version is not None:
+                result.source_url = self.registry_handler.get_source(resource)
+        except Exception as e:
+            log.debug(f"Could not resolve source '{resolve_request.source}': {e}")
+            result.error = str(e)
+        return result
+
+
+def _create_resource(resolve_request: ResolveRequest) -> VersionedTerraformResource:
+    resource_types = [TerraformProvider, TerraformModule]
+    if resolve_request.resource_type == ResolveResourceType.MODULE:
+        resource_types = [TerraformModule]
+    elif resolve_request.resource_type == ResolveResourceType.PROVIDER:
+        resource_types = [TerraformProvider]
+    elif resolve_request.resource_type is not None:
+        raise BulkResolverException(f"Unknown resource type '{resolve_request.resource_type}', supported types are module and provider.")
+    for resource_type in resource_types:
+        try:
+            return resource_type(name=resolve_request.source, current_version="0.0.0", source_file=Path("-"), start_line_number=0, source_string=resolve_request.source)
+        except Exception:
+            continue
+    raise BulkResolverException(f"Source '{resolve_request.source}' is not a valid terraform module or provider source.")
+
+
+def parse_resolve_requests(lines: Iterable[str]) -> Iterator[ResolveRequest]:
+    # every line is either a plain source or a json object with the keys "source" and optionally "type"
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        if not line.startswith("{"):
+            yield ResolveRequest(source=line, index=index)
+            continue
+        try:
+            values = json.loads(line)
+            yield ResolveRequest(source=values["source"], resource_type=values.get("type"), index=index)
+        except (ValueError, KeyError) as e:
+            raise BulkResolverException(f"Invalid resolve request in line {index + 1}: {e}")
@@ -0,0 +1,131 @@
+import logging as log
+import os
+import re
+import subprocess
+import threading
+from typing import Protocol, Sequence, Union
+
+import semantic_version
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformGitModule, VersionedTerraformResource
+from infrapatch.core.utils.run_budget import RunBudget
+from infrapatch.core.utils.single_flight import SingleFlight
+from infrapatch.core.utils.terraform.registry_cache import PersistentRegistryCache, RegistryCacheResourceType
+
+
+# protocols of the repositories which are listed, local paths or transports like ext:: could run commands of an untrusted .tf file
+DEFAULT_ALLOWED_PROTOCOLS = ("https", "ssh")
+
+
+class GitSourceException(Exception):
+    pass
+
+
+class GitSourceHandlerInterface(Protocol):
+    def get_newest_version(self, resource: VersionedTerraformResource) -> Union[str, None]: ...
+
+    def get_source(self, resource: VersionedTerraformResource) -> Union[str, None]: ...
+
+
+# Resolves the newest version of git module sources from the tags of their repositories.
+# Each repository is listed once with "git ls-remote", concurrent lookups of the same repository are coalesced.
+class GitSourceHandler(GitSourceHandlerInterface):
+    def __init__(
+        self,
+        run_budget: Union[RunBudget, None] = None,
+        persistent_cache: Union[PersistentRegistryCache, None] = None,
+        max_concurrency: int = 8,
+        allowed_protocols: Sequence[str] = DEFAULT_ALLOWED_PROTOCOLS,
+    ):
+        self.run_budget = run_budget if run_budget is not None else RunBudget()
+        self.allowed_protocols = list(allowed_protocols)
+        self.persistent_cache = persistent_cache
+        self.tag_cache: dict[str, list[str]] = {}
+        self._cache_lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        # limits the number of git processes running at the same time
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        if self.persistent_cache is not None:
+            for repository_url, entry in self.persistent_cache.get_resources(RegistryCacheResourceType.GIT_REPOSITORY).items():
+                self.tag_cache[repository_url] = entry.versions
+
+    def get_newest_version(self, resource: VersionedTerraformResource) -> Union[str, None]:
+        if not isinstance(resource, TerraformGitModule):
+            raise Exception(f"Resource type '{type(resource)}' is not supported.")
+        if resource.repository_url is None:
+            raise Exception(f"Repository of resource '{resource.name}' is not set.")
+        if not self.is_allowed_repository_url(resource.repository_url):
+            log.warning(f"Skipping git module '{resource.name}', since the protocol of repository '{resource.repository_url}' is not allowed.")
+            return None
+        versions = []
+        for tag in self.get_tags(resource.repository_url):
+            # only tags with the same prefix as the current ref are considered, so "v1.2.3" is not replaced with "1.3.0"
+            if tag.startswith("v") != (resource.ref_prefix == "v"):
+                continue
+            version = tag.removeprefix(resource.ref_prefix)
+            if re.match(r"^[0-9]+\.[0-9]+\.[0-9]+$", version) is None:
+                continue
+            versions.append(version)
+        if len(versions) == 0:
+            log.debug(f"No version tags found in repository '{resource.repository_url}'.")
+            return None
+        return str(max(versions, key=semantic_version.Version))
+
+    def get_source(self, resource: VersionedTerraformResource) -> Union[str, None]:
+        if not isinstance(resource, TerraformGitModule) or resource.repository_url is None:
+            return None
+        # only github repositories are returned, since they are used to look up release notes
+        match = re.search(r"github\.com[:/]([^/]+)/([^/]+?)(\.git)?$", resource.repository_url)
+        if match is None:
+            return None
+        return f"https://github.com/{match.group(1)}/{match.group(2)}"
+
+    def is_allowed_repository_url(self, repository_url: str) -> bool:
+        # scp like urls "git@host:path" use ssh, a host starting with a dash would be read as an option of ssh
+        if "ssh" in self.allowed_protocols and re.match(r"^git@[^-:/][^:/]*:", repository_url) is not None:
+            return True
+        match = re.match(r"^([a-z][a-z0-9+.-]*)://(.*)$", repository_url)
+        return match is not None and match.group(1) in self.allowed_protocols and not match.group(2).startswith("-")
+
+    def get_tags(self, repository_url: str) -> list[str]:
+        with self._cache_lock:
+            if repository_url in self.tag_cache:
+                log.debug(f"Tags of repository '{repository_url}' already cached.")
+                return self.tag_cache[repository_url]
+        return self._single_flight.do(repository_url, lambda: self._fetch_tags(repository_url))
+
+    def _fetch_tags(self, repository_url: str) -> list[str]:
+        with self._cache_lock:
+            if repository_url in self.tag_cache:
+                return self.tag_cache[repository_url]
+        with self._semaphore:
+            tags = self._list_remote_tags(repository_url)
+        with self._cache_lock:
+            self.tag_cache[repository_url] = tags
+        if self.persistent_cache is not None:
+            self.persistent_cache.update_versions(RegistryCacheResourceType.GIT_REPOSITORY, repository_url, tags)
+        return tags
+
+    def _list_remote_tags(self, repository_url: str) -> list[str]:
+        if not self.is_allowed_repository_url(repository_url):
+            raise GitSourceException(f"Protocol of repository '{repository_url}' is not allowed.")
+        # the url comes from a .tf file, so it must never be read as an option
+        command = ["git", "ls-remote", "--tags", "--refs", "--", repository_url]
+        log.debug(f"Executing command: {' '.join(command)}")
+        # never prompt for credentials, the lookups run concurrently and unattended
+        env = {**os.environ, "GIT_TERMINAL_PROMPT": "0", "GIT_ALLOW_PROTOCOL": ":".join(self.allowed_protocols)}
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=self.run_budget.get_request_timeout(), env=env)
+        except subprocess.TimeoutExpired:
+            raise GitSourceException(f"Listing the tags of repository '{repository_url}' timed out.")
+        except Exception as e:
+            raise GitSourceException(f"Could not execute command '{' '.join(command)}': {e}")
+        if result.returncode != 0:
+            raise GitSourceException(f"Could not list tags of repository '{repository_url}': {result.stderr.strip()}")
+        tags = []
+        for line in result.stdout.splitlines():
+            _, _, ref = line.partition("\t")
+            if ref.startswith("refs/tags/"):
+                tags.append(ref.removeprefix("refs/tags/"))
+        log.debug(f"Found {len(tags)} tags in repository '{repository_url}'.")
+        return tags
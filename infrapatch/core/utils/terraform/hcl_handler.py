@@ -3,11 +3,12 @@ import logging as log
 import platform
 from pathlib import Path
 import re
-from typing import Protocol, Sequence
+from dataclasses import dataclass, field
+from typing import Protocol, Sequence, Union
 
 import pygohcl
 
-from infrapatch.core.models.versioned_terraform_resources import TerraformModule, TerraformProvider, VersionedTerraformResource
+from infrapatch.core.models.versioned_terraform_resources import TerraformGitModule, TerraformModule, TerraformProvider, VersionedTerraformResource, is_git_source, parse_git_source
 from infrapatch.core.utils.terraform.hcl_edit_cli import HclEditCliInterface
 
 
@@ -15,6 +16,13 @@ class HclParserException(Exception):
     pass
 
 
+@dataclass
+class NetworkMirrorConfig:
+    url: str
+    include: list[str] = field(default_factory=list)
+    exclude: list[str] = field(default_factory=list)
+
+
 class HclHandlerInterface(Protocol):
     def bump_resource_version(self, resource: VersionedTerraformResource): ...
 
@@ -24,6 +32,8 @@ class HclHandlerInterface(Protocol):
 
     def get_credentials_form_user_rc_file(self) -> dict[str, str]: ...
 
+    def get_network_mirrors_from_user_rc_file(self) -> Sequence[NetworkMirrorConfig]: ...
+
 
 class HclHandler(HclHandlerInterface):
     def __init__(self, hcl_edit_cli: HclEditCliInterface):
@@ -31,7 +41,7 @@ class HclHandler(HclHandlerInterface):
         pass
 
     def bump_resource_version(self, resource: VersionedTerraformResource):
-        if not isinstance(resource, TerraformModule) and not isinstance(resource, TerraformProvider):
+        if not isinstance(resource, (TerraformModule, TerraformProvider, TerraformGitModule)):
             raise Exception(f"Resource type '{type(resource)}' is not supported.")
         if resource.newest_version is None:
             raise Exception(f"Newest version of resource '{resource.name}' is not set.")
@@ -40,6 +50,11 @@ class HclHandler(HclHandlerInterface):
             return
 
         log.debug(f"Updating resource '{resource.resource_name}' with name '{resource.name}' from version '{resource.current_version}' to '{resource.newest_version}'.")
+        if isinstance(resource, TerraformGitModule):
+            # git modules are pinned with the ref in the source, which is replaced in place
+            new_source = resource.get_source_with_ref(f"{resource.ref_prefix}{resource.newest_version}")
+            self.hcl_edit_cli.update_hcl_value(f"module.{resource.name}.source", resource.source_file, new_source)
+            return
         if isinstance(resource, TerraformProvider):
             resource_name = f"terraform.required_providers.{resource.name}.version"
         elif isinstance(resource, TerraformModule):
@@ -94,7 +109,7 @@ class HclHandler(HclHandlerInterface):
                     )
         return found_resources
 
-    def _get_terraform_modules_from_dict(self, terraform_file_dict: dict, tf_file: Path, content: str) -> Sequence[TerraformProvider]:
+    def _get_terraform_modules_from_dict(self, terraform_file_dict: dict, tf_file: Path, content: str) -> Sequence[VersionedTerraformResource]:
         found_resources = []
         if "module" in terraform_file_dict:
             modules = terraform_file_dict["module"]
@@ -103,7 +118,11 @@ class HclHandler(HclHandlerInterface):
                     log.debug(f"Skipping module '{module_name}' because it has no source attribute.")
                     continue
                 if "version" not in value:
-                    log.debug(f"Skipping module '{module_name}' because it has no version attribute.")
+                    git_module = self._get_git_module(module_name, value["source"], tf_file, content)
+                    if git_module is None:
+                        log.debug(f"Skipping module '{module_name}' because it has no version attribute.")
+                        continue
+                    found_resources.append(git_module)
                     continue
                 start_line_number = self._get_start_line_number(content, file=tf_file, search_regex=f'module\s+"{module_name}"\s+\{{')
                 found_resources.append(
@@ -111,6 +130,17 @@ class HclHandler(HclHandlerInterface):
                 )
         return found_resources
 
+    def _get_git_module(self, module_name: str, source: str, tf_file: Path, content: str) -> Union[TerraformGitModule, None]:
+        if not is_git_source(source):
+            return None
+        _, _, ref = parse_git_source(source)
+        # only modules pinned to a version tag can be updated, refs like branches or commits are skipped
+        if ref is None or re.match(r"^v?[0-9]+\.[0-9]+\.[0-9]+$", ref) is None:
+            log.debug(f"Skipping git module '{module_name}' because its ref '{ref}' is not a version.")
+            return None
+        start_line_number = self._get_start_line_number(content, file=tf_file, search_regex=f'module\s+"{module_name}"\s+\{{')
+        return TerraformGitModule(name=module_name, source_string=source, current_version=ref.removeprefix("v"), source_file=tf_file, start_line_number=start_line_number)
+
     def _get_start_line_number(self, content: str, file: Path, search_regex: str) -> int:
         result = re.search(search_regex, content, re.DOTALL)
         if result is None:
@@ -130,11 +160,38 @@ class HclHandler(HclHandlerInterface):
         return files
 
     def get_credentials_form_user_rc_file(self) -> dict[str, str]:
+        credentials: dict[str, str] = {}
+        terraform_rc_file_dict = self._get_user_rc_file_dict()
+        if terraform_rc_file_dict is None:
+            return credentials
+        if "credentials" not in terraform_rc_file_dict:
+            log.debug("No credentials found in terraformrc file.")
+            return credentials
+        for name, value in terraform_rc_file_dict["credentials"].items():
+            token = value["token"]
+            log.debug(f"Found the following credentials in terraformrc file: {name}={token[0:5]}...")
+            credentials[name] = value["token"]
+        return credentials
+
+    def get_network_mirrors_from_user_rc_file(self) -> Sequence[NetworkMirrorConfig]:
+        network_mirrors: list[NetworkMirrorConfig] = []
+        terraform_rc_file_dict = self._get_user_rc_file_dict()
+        if terraform_rc_file_dict is None or "provider_installation" not in terraform_rc_file_dict:
+            log.debug("No provider_installation block found in terraformrc file.")
+            return network_mirrors
+        for provider_installation in _as_list(terraform_rc_file_dict["provider_installation"]):
+            for network_mirror in _as_list(provider_installation.get("network_mirror", [])):
+                if "url" not in network_mirror:
+                    log.debug("Skipping network_mirror block without url in terraformrc file.")
+                    continue
+                log.debug(f"Found network mirror '{network_mirror['url']}' in terraformrc file.")
+                network_mirrors.append(NetworkMirrorConfig(url=network_mirror["url"], include=network_mirror.get("include", []), exclude=network_mirror.get("exclude", [])))
+        return network_mirrors
+
+    def _get_user_rc_file_dict(self) -> Union[dict, None]:
         # get the home of the user
         user_home = Path.home()
 
-        credentials: dict[str, str] = {}
-
         # check if on windows
         if platform.system() == "Windows":
             terraform_rc_file = user_home.joinpath("AppData/Roaming/terraform.rc")
@@ -142,22 +199,21 @@ class HclHandler(HclHandlerInterface):
             terraform_rc_file = user_home.joinpath(".terraformrc")
         if not terraform_rc_file.exists() or not terraform_rc_file.is_file():
             log.debug("No terraformrc file found for the current user.")
-            return credentials
+            return None
         try:
             with open(terraform_rc_file.absolute(), "r") as file:
                 try:
-                    terraform_rc_file_dict = pygohcl.loads(file.read())
+                    return pygohcl.loads(file.read())
                 except Exception as e:
                     log.error(f"Could not parse terraformrc file: {e}")
-                    return credentials
-                if "credentials" not in terraform_rc_file_dict:
-                    log.debug("No credentials found in terraformrc file.")
-                    return credentials
-                for name, value in terraform_rc_file_dict["credentials"].items():
-                    token = value["token"]
-                    log.debug(f"Found the following credentials in terraformrc file: {name}={token[0:5]}...")
-                    credentials[name] = value["token"]
-                return credentials
+                    return None
         except Exception as e:
             log.error(f"Could not read terraformrc file: {e}")
-            return credentials
+            return None
+
+
+def _as_list(value: Union[dict, list]) -> list:
+    # pygohcl returns a dict for a single block and a list of dicts for repeated blocks
+    if isinstance(value, list):
+        return value
+    return [value]
@@ -0,0 +1,202 @@
+import gzip
+import json
+import logging as log
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Union
+
+from infrapatch.core.utils.json_file import write_json_atomically
+
+REGISTRY_CACHE_FILE_NAME = "registry_cache.json"
+REGISTRY_CACHE_FORMAT_VERSION = 1
+
+# upper bounds in seconds of the age buckets reported by get_stats
+AGE_BUCKETS = [("< 1h", 3600), ("< 1d", 86400), ("< 7d", 604800), (">= 7d", None)]
+
+
+class RegistryCacheException(Exception):
+    pass
+
+
+class RegistryCacheResourceType:
+    MODULE = "modules"
+    PROVIDER = "providers"
+    GIT_REPOSITORY = "git_repositories"
+
+
+@dataclass
+class RegistryCacheEntry:
+    newest_version: Union[str, None] = None
+    source: Union[str, None] = None
+    fetched_at: float = 0
+    versions: list[str] = field(default_factory=list)  # tags of git repositories
+
+
+# Persists the newest versions, sources and registry metadata looked up by the RegistryHandler between runs.
+# Entries older than the ttl are not handed out, but are kept until they are pruned.
+class PersistentRegistryCache:
+    def __init__(self, cache_directory: Path, ttl: float = 3600):
+        self.cache_file = cache_directory.joinpath(REGISTRY_CACHE_FILE_NAME)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._resources: dict[str, dict[str, RegistryCacheEntry]] = {
+            RegistryCacheResourceType.MODULE: {},
+            RegistryCacheResourceType.PROVIDER: {},
+            RegistryCacheResourceType.GIT_REPOSITORY: {},
+        }
+        self._registry_metadata: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load(self.cache_file)
+
+    def get_resources(self, resource_type: str) -> dict[str, RegistryCacheEntry]:
+        with self._lock:
+            return {address: entry for address, entry in self._resources[resource_type].items() if not self._is_expired(entry.fetched_at)}
+
+    def get_registry_metadata(self) -> dict[str, dict]:
+        # keyed by the base url the metadata was discovered from, which differs from the registry domain if the registry is overridden
+        with self._lock:
+            return {base_url: value["metadata"] for base_url, value in self._registry_metadata.items() if not self._is_expired(value["fetched_at"])}
+
+    def update_resource(self, resource_type: str, address: str, newest_version: Union[str, None] = None, source: Union[str, None] = None) -> None:
+        with self._lock:
+            entry = self._resources[resource_type].setdefault(address, RegistryCacheEntry(fetched_at=time.time()))
+            if newest_version is not None:
+                if entry.newest_version != newest_version:
+                    # the source belongs to the newest version and has to be looked up again
+                    entry.source = None
+                entry.newest_version = newest_version
+                entry.fetched_at = time.time()
+            if source is not None:
+                entry.source = source
+
+    def update_versions(self, resource_type: str, address: str, versions: list[str]) -> None:
+        with self._lock:
+            self._resources[resource_type][address] = RegistryCacheEntry(versions=versions, fetched_at=time.time())
+
+    def update_registry_metadata(self, base_url: str, metadata: dict) -> None:
+        with self._lock:
+            self._registry_metadata[base_url] = {"metadata": metadata, "fetched_at": time.time()}
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def save(self) -> None:
+        with self._lock:
+            content = self._to_dict()
+        write_json_atomically(self.cache_file, content)
+        log.debug(f"Saved registry cache to '{self.cache_file}'.")
+
+    def prune(self, max_age: Union[float, None] = None) -> int:
+        max_age = max_age if max_age is not None else self.ttl
+        oldest = time.time() - max_age
+        pruned = 0
+        with self._lock:
+            for entries in self._resources.values():
+                for address in [address for address, entry in entries.items() if entry.fetched_at < oldest]:
+                    del entries[address]
+                    pruned += 1
+            for base_url in [base_url for base_url, value in self._registry_metadata.items() if value["fetched_at"] < oldest]:
+                del self._registry_metadata[base_url]
+                pruned += 1
+        return pruned
+
+    def export_cache(self, archive: Path) -> None:
+        with self._lock:
+            content = json.dumps(self._to_dict()).encode()
+        with _open_archive(archive, "wb") as file:
+            file.write(content)
+
+    def import_cache(self, archive: Path) -> int:
+        if not archive.is_file():
+            raise RegistryCacheException(f"Registry cache archive '{archive}' does not exist.")
+        return self._load(archive, include_stats=False)
+
+    def get_stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "file": self.cache_file.as_posix(),
+                "size_bytes": self.cache_file.stat().st_size if self.cache_file.is_file() else 0,
+                "modules": len(self._resources[RegistryCacheResourceType.MODULE]),
+                "providers": len(self._resources[RegistryCacheResourceType.PROVIDER]),
+                "git_repositories": len(self._resources[RegistryCacheResourceType.GIT_REPOSITORY]),
+                "registries": len(self._registry_metadata),
+                "expired": sum(1 for entries in self._resources.values() for entry in entries.values() if self._is_expired(entry.fetched_at)),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups > 0 else None,
+                "age": {name: 0 for name, _ in AGE_BUCKETS},
+            }
+            for entries in self._resources.values():
+                for entry in entries.values():
+                    age = now - entry.fetched_at
+                    bucket = next(name for name, upper_bound in AGE_BUCKETS if upper_bound is None or age < upper_bound)
+                    stats["age"][bucket] += 1
+        return stats
+
+    def _is_expired(self, fetched_at: float) -> bool:
+        return time.time() - fetched_at > self.ttl
+
+    def _to_dict(self) -> dict:
+        return {
+            "version": REGISTRY_CACHE_FORMAT_VERSION,
+            "stats": {"hits": self.hits, "misses": self.misses},
+            "registry_metadata": dict(self._registry_metadata),
+            **{resource_type: {address: asdict(entry) for address, entry in entries.items()} for resource_type, entries in self._resources.items()},
+        }
+
+    def _load(self, cache_file: Path, include_stats: bool = True) -> int:
+        # merges the entries of the file into the cache, newer entries win
+        if not cache_file.is_file():
+            log.debug(f"No registry cache found at '{cache_file}'.")
+            return 0
+        try:
+            with _open_archive(cache_file, "rb") as file:
+                content = json.loads(file.read())
+        except Exception as e:
+            raise RegistryCacheException(f"Could not read registry cache '{cache_file}': {e}")
+        if content.get("version") != REGISTRY_CACHE_FORMAT_VERSION:
+            log.warning(f"Ignoring registry cache '{cache_file}' with unsupported format version '{content.get('version')}'.")
+            return 0
+        merged = 0
+        with self._lock:
+            for resource_type, entries in self._resources.items():
+                for address, values in content.get(resource_type, {}).items():
+                    # entries written by another version can have unknown or missing fields, they are looked up again instead
+                    try:
+                        entry = RegistryCacheEntry(**values)
+                        entry.fetched_at = float(entry.fetched_at)
+                    except (TypeError, ValueError) as e:
+                        log.warning(f"Skipping invalid entry '{address}' of registry cache '{cache_file}': {e}")
+                        continue
+                    if address not in entries or entries[address].fetched_at < entry.fetched_at:
+                        entries[address] = entry
+                        merged += 1
+            for base_url, value in content.get("registry_metadata", {}).items():
+                try:
+                    value = {"metadata": value["metadata"], "fetched_at": float(value["fetched_at"])}
+                except (TypeError, KeyError, ValueError) as e:
+                    log.warning(f"Skipping invalid registry metadata of '{base_url}' in registry cache '{cache_file}': {e}")
+                    continue
+                if base_url not in self._registry_metadata or self._registry_metadata[base_url]["fetched_at"] < value["fetched_at"]:
+                    self._registry_metadata[base_url] = value
+            if include_stats:
+                self.hits += content.get("stats", {}).get("hits", 0)
+                self.misses += content.get("stats", {}).get("misses", 0)
+        log.debug(f"Loaded {merged} entries from registry cache '{cache_file}'.")
+        return merged
+
+
+def _open_archive(path: Path, mode: str):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode)
+    return open(path, mode)
@@ -3,11 +3,18 @@ import logging as log
 from dataclasses import dataclass
 from distutils.version import StrictVersion
 import re
-from typing import Protocol, Union
+import threading
+from typing import Protocol, Sequence, Union
 from urllib import request
-from urllib.parse import urlparse
+from urllib.parse import urljoin, urlparse
 
 from infrapatch.core.models.versioned_terraform_resources import TerraformModule, TerraformProvider, VersionedTerraformResource
+from infrapatch.core.utils.request_scheduler import RequestScheduler, RequestSchedulerException
+from infrapatch.core.utils.run_budget import RunBudget
+from infrapatch.core.utils.single_flight import SingleFlight
+from infrapatch.core.utils.terraform.registry_cache import PersistentRegistryCache, RegistryCacheResourceType
+from infrapatch.core.utils.terraform.registry_module_listing import TFE_API_METADATA_KEY, RegistryModuleLister
+from infrapatch.core.utils.terraform.registry_snapshot import RegistrySnapshotEntry, RegistrySnapshotInterface, SnapshotResourceType
 
 
 class TerraformRegistryException(Exception):
@@ -19,6 +26,8 @@ class RegistryHandlerInterface(Protocol):
 
     def get_source(self, resource: VersionedTerraformResource): ...
 
+    def prefetch(self, resources: Sequence[VersionedTerraformResource]) -> None: ...
+
 
 @dataclass
 class TerraformRegistryResourceCache:
@@ -27,12 +36,88 @@ class TerraformRegistryResourceCache:
 
 
 class RegistryHandler(RegistryHandlerInterface):
-    def __init__(self, default_registry_domain: str, credentials: dict):
+    def __init__(
+        self,
+        default_registry_domain: str,
+        credentials: dict,
+        request_scheduler: Union[RequestScheduler, None] = None,
+        run_budget: Union[RunBudget, None] = None,
+        snapshot: Union[RegistrySnapshotInterface, None] = None,
+        offline: bool = False,
+        registry_overrides: Union[dict[str, str], None] = None,
+        persistent_cache: Union[PersistentRegistryCache, None] = None,
+        bulk_listing: bool = False,
+    ):
+        if offline and snapshot is None:
+            raise Exception("Offline mode requires a registry snapshot.")
         self.default_registry_domain = default_registry_domain
+        self.snapshot = snapshot
+        self.offline = offline
+        # maps registry domains to base urls which are used instead of https://<domain>, e.g. an infrapatch registry proxy
+        self.registry_overrides = {domain: url.rstrip("/") for domain, url in (registry_overrides or {}).items()}
+        self.request_scheduler = request_scheduler if request_scheduler is not None else RequestScheduler()
+        self.run_budget = run_budget if run_budget is not None else RunBudget()
         self.cached_registry_metadata = {}
+        # persisted metadata by base url, so the metadata of a registry is not used for its override and the other way round
+        self._persisted_registry_metadata: dict[str, dict] = {}
         self.module_cache: dict[str, TerraformRegistryResourceCache] = {}
         self.provider_cache: dict[str, TerraformRegistryResourceCache] = {}
         self.credentials = credentials
+        self._cache_lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        self.persistent_cache = persistent_cache
+        if self.persistent_cache is not None:
+            self._load_persistent_cache(self.persistent_cache)
+        # private modules are listed once per organization instead of being looked up one by one
+        self.bulk_listing = bulk_listing
+        self.module_lister = RegistryModuleLister(lambda url, registry_base_domain: self._send_request(url, registry_base_domain))
+
+    def _load_persistent_cache(self, persistent_cache: PersistentRegistryCache) -> None:
+        for cache, resource_type in [(self.module_cache, RegistryCacheResourceType.MODULE), (self.provider_cache, RegistryCacheResourceType.PROVIDER)]:
+            for address, entry in persistent_cache.get_resources(resource_type).items():
+                cache[address] = TerraformRegistryResourceCache(newest_version=entry.newest_version, source=entry.source)
+        self._persisted_registry_metadata = persistent_cache.get_registry_metadata()
+        log.debug(f"Loaded {len(self.module_cache)} modules and {len(self.provider_cache)} providers from the persistent registry cache.")
+
+    def prefetch(self, resources: Sequence[VersionedTerraformResource]) -> None:
+        if not self.bulk_listing or self.offline:
+            return
+        organizations = set()
+        for resource in resources:
+            # modules of the public registry have no organization level listing
+            if not isinstance(resource, TerraformModule) or resource.base_domain is None or resource.identifier is None:
+                continue
+            with self._cache_lock:
+                cache = self.module_cache.get(self._get_address(resource))
+            if cache is not None and cache.newest_version is not None:
+                continue
+            organizations.add((resource.base_domain, resource.identifier.split("/")[0]))
+
+        for registry_base_domain, organization in sorted(organizations):
+            try:
+                self._prefetch_organization(registry_base_domain, organization)
+            except Exception as e:
+                log.warning(f"Could not list the modules of organization '{organization}' on '{registry_base_domain}', falling back to single lookups: {e}")
+
+    def _prefetch_organization(self, registry_base_domain: str, organization: str) -> None:
+        registry_metadata = self.get_registry_metadata(registry_base_domain)
+        if TFE_API_METADATA_KEY not in registry_metadata:
+            log.debug(f"Registry '{registry_base_domain}' does not support listing the modules of an organization.")
+            return
+        api_base_url = urljoin(self._get_discovery_url(registry_base_domain), registry_metadata[TFE_API_METADATA_KEY])
+        listed_modules = self.module_lister.list_organization_modules(api_base_url, registry_base_domain, organization)
+        for address, listed_module in listed_modules.items():
+            newest_version = self._get_newest_valid_version(listed_module.versions)
+            if newest_version is None:
+                continue
+            with self._cache_lock:
+                cache = self.module_cache.setdefault(address, TerraformRegistryResourceCache())
+                cache.newest_version = newest_version
+                if listed_module.source is not None:
+                    cache.source = listed_module.source
+            if self.persistent_cache is not None:
+                self.persistent_cache.update_resource(RegistryCacheResourceType.MODULE, address, newest_version=newest_version, source=listed_module.source)
+        log.info(f"Listed {len(listed_modules)} modules of organization '{organization}' on '{registry_base_domain}'.")
 
     def get_newest_version(self, resource: VersionedTerraformResource) -> Union[str, None]:
         if not isinstance(resource, TerraformModule) and not isinstance(resource, TerraformProvider):
@@ -40,41 +125,91 @@ class RegistryHandler(RegistryHandlerInterface):
 
         cache = self._get_from_cache(resource)
         if cache.newest_version is not None:
+            self._record_cache_lookup(hit=True)
             return cache.newest_version
+        return self._single_flight.do(("versions", resource.resource_name, self._get_address(resource)), lambda: self._fetch_newest_version(resource, cache))
 
+    def _fetch_newest_version(self, resource: VersionedTerraformResource, cache: TerraformRegistryResourceCache) -> Union[str, None]:
+        # another caller might have completed the lookup between the cache check and acquiring the flight
+        if cache.newest_version is not None:
+            return cache.newest_version
+
+        snapshot_entry = self._get_snapshot_entry(resource)
+        if snapshot_entry is not None:
+            versions = snapshot_entry.versions
+            if snapshot_entry.source is not None:
+                cache.source = snapshot_entry.source
+        elif self.offline:
+            log.debug(f"Resource '{resource.source}' not found in registry snapshot, skipping lookup since offline mode is enabled.")
+            return None
+        else:
+            self._record_cache_lookup(hit=False)
+            versions = self._get_versions_from_registry(resource)
+
+        if len(versions) == 0:
+            log.debug(f"No versions found for resource '{resource.source}'.")
+            return None
+
+        newest_version = self._get_newest_valid_version(versions)
+        cache.newest_version = newest_version
+        if self.persistent_cache is not None and snapshot_entry is None:
+            self.persistent_cache.update_resource(self._get_cache_resource_type(resource), self._get_address(resource), newest_version=newest_version)
+        return newest_version
+
+    def _get_versions_from_registry(self, resource: VersionedTerraformResource) -> list[str]:
         registry_api_base_endpoint, registry_base_domain = self._compose_base_url(resource)
         version_endpoint = f"{registry_api_base_endpoint}/versions"
         log.debug(f"Getting versions from {version_endpoint}")
 
         response = self._send_request(version_endpoint, registry_base_domain)
-        response_data = json.loads(response.read())
+        response_data = json.loads(response)
         if isinstance(resource, TerraformModule):
             versions = response_data["modules"][0]["versions"]
         elif isinstance(resource, TerraformProvider):
             versions = response_data["versions"]
         else:
             raise Exception(f"Resource type '{type(resource)}' is not supported.")
-        if len(versions) == 0:
-            log.debug(f"No versions found for resource '{resource.source}'.")
-            return None
+        return [version["version"] for version in versions if version["version"] is not None]
 
+    def _get_newest_valid_version(self, versions: list[str]) -> Union[str, None]:
         valid_versions = []
         version_re = re.compile(r"^(\d+) \. (\d+) (\. (\d+))? ([ab](\d+))?$", re.VERBOSE | re.ASCII)
         for version in versions:
-            if version["version"] is None:
-                continue
-            match = version_re.match(version["version"])
+            match = version_re.match(version)
             if not match:
-                log.debug(f"Version '{version['version']}' does not match the expected format, ignoring it.")
+                log.debug(f"Version '{version}' does not match the expected format, ignoring it.")
                 continue
-            valid_versions.append(version["version"])
+            valid_versions.append(version)
+        if len(valid_versions) == 0:
+            return None
 
         sorted_versions = sorted(valid_versions, key=lambda k: StrictVersion(k), reverse=True)
-        newest_version = sorted_versions[0]
-
-        cache.newest_version = newest_version
+        return sorted_versions[0]
 
-        return newest_version
+    def _get_snapshot_entry(self, resource: VersionedTerraformResource) -> Union[RegistrySnapshotEntry, None]:
+        if self.snapshot is None:
+            return None
+        resource_type = SnapshotResourceType.MODULE if isinstance(resource, TerraformModule) else SnapshotResourceType.PROVIDER
+        entry = self.snapshot.get_entry(resource_type, self._get_address(resource))
+        if entry is not None:
+            log.debug(f"Found resource '{resource.source}' in registry snapshot.")
+        return entry
+
+    def _get_address(self, resource: VersionedTerraformResource) -> str:
+        # fully qualified address of the resource, so resources with and without the default registry domain share their cache entries
+        registry_base_domain = resource.base_domain if resource.base_domain is not None else self.default_registry_domain
+        return f"{registry_base_domain}/{resource.identifier}".lower()
+
+    def _get_cache_resource_type(self, resource: VersionedTerraformResource) -> str:
+        return RegistryCacheResourceType.MODULE if isinstance(resource, TerraformModule) else RegistryCacheResourceType.PROVIDER
+
+    def _record_cache_lookup(self, hit: bool) -> None:
+        if self.persistent_cache is None:
+            return
+        if hit:
+            self.persistent_cache.record_hit()
+        else:
+            self.persistent_cache.record_miss()
 
     def _get_from_cache(self, resource: VersionedTerraformResource) -> TerraformRegistryResourceCache:
         if isinstance(resource, TerraformModule):
@@ -84,14 +219,16 @@ class RegistryHandler(RegistryHandlerInterface):
         else:
             raise Exception(f"Resource type '{type(resource)}' is not supported.")
 
-        if resource.source in cache:
-            log.debug(f"Cache found for resource {resource.source}.")
-            return cache[resource.source]
+        address = self._get_address(resource)
+        with self._cache_lock:
+            if address in cache:
+                log.debug(f"Cache found for resource {resource.source}.")
+                return cache[address]
 
-        log.debug(f"No cache found for resource {resource.source}.")
-        new_cache = TerraformRegistryResourceCache()
-        cache[resource.source] = new_cache
-        return new_cache
+            log.debug(f"No cache found for resource {resource.source}.")
+            new_cache = TerraformRegistryResourceCache()
+            cache[address] = new_cache
+            return new_cache
 
     def _compose_base_url(self, resource) -> tuple[str, str]:
         registry_base_domain = self.default_registry_domain
@@ -106,15 +243,18 @@ class RegistryHandler(RegistryHandlerInterface):
         else:
             raise Exception(f"Resource type '{type(resource)}' is not supported.")
 
-        url_from_meta = urlparse(registry_metadata[metadata_key])
+        # service urls in the discovery document are relative to the discovery document itself
+        service_url = urljoin(self._get_discovery_url(registry_base_domain), registry_metadata[metadata_key])
+        if not service_url.endswith("/"):
+            service_url = f"{service_url}/"
+        endpoint = f"{service_url}{resource.identifier}"
+        return endpoint, registry_base_domain
 
-        if url_from_meta.hostname is not None:
-            endpoint = f"https://{url_from_meta.hostname}"
-        else:
-            endpoint = f"https://{registry_base_domain}"
+    def _get_base_url(self, registry_base_domain: str) -> str:
+        return self.registry_overrides.get(registry_base_domain, f"https://{registry_base_domain}")
 
-        endpoint = f"{endpoint}{url_from_meta.path}{resource.identifier}"
-        return endpoint, registry_base_domain
+    def _get_discovery_url(self, registry_base_domain: str) -> str:
+        return f"{self._get_base_url(registry_base_domain)}/.well-known/terraform.json"
 
     def get_source(self, resource: VersionedTerraformResource) -> Union[str, None]:
         if not isinstance(resource, TerraformModule) and not isinstance(resource, TerraformProvider):
@@ -123,6 +263,14 @@ class RegistryHandler(RegistryHandlerInterface):
         cache = self._get_from_cache(resource)
         if cache.source is not None:
             return cache.source
+        return self._single_flight.do(("source", resource.resource_name, self._get_address(resource)), lambda: self._fetch_source(resource, cache))
+
+    def _fetch_source(self, resource: VersionedTerraformResource, cache: TerraformRegistryResourceCache) -> Union[str, None]:
+        if cache.source is not None:
+            return cache.source
+        if self.offline:
+            log.debug(f"Source of resource '{resource.source}' not found in registry snapshot, skipping lookup since offline mode is enabled.")
+            return None
 
         base_endpoint, registry_base_domain = self._compose_base_url(resource)
         version_info_endpoint = f"{base_endpoint}/{resource.newest_version_base}"
@@ -131,40 +279,58 @@ class RegistryHandler(RegistryHandlerInterface):
         except TerraformRegistryException as e:
             log.debug(f"Could not get source for resource '{resource.source}': {e}")
             return None
-        response_data = json.loads(response.read())
+        response_data = json.loads(response)
         if "source" not in response_data:
             log.debug(f"Source not found in response data: {response_data}")
             return None
         source = response_data["source"]
         log.debug(f"Source for '{resource.source}' is '{source}'")
         cache.source = source
+        if self.persistent_cache is not None:
+            self.persistent_cache.update_resource(self._get_cache_resource_type(resource), self._get_address(resource), source=source)
         return source
 
-    def _send_request(self, url: str, registry_base_domain: str):
+    def close(self) -> None:
+        self.request_scheduler.close()
+
+    def _send_request(self, url: str, registry_base_domain: str) -> bytes:
         request_object = request.Request(url)
 
-        if registry_base_domain in self.credentials:
-            token = self.credentials[registry_base_domain]
-            log.debug(f"Found credentials for registry '{registry_base_domain}', using token: {token[0:5]}...")
+        # the token of a registry is never sent to another base url, e.g. a proxy over plain http, which uses the credentials of its own host instead
+        credentials_key = urlparse(self.registry_overrides[registry_base_domain]).netloc if registry_base_domain in self.registry_overrides else registry_base_domain
+        if credentials_key in self.credentials:
+            token = self.credentials[credentials_key]
+            log.debug(f"Found credentials for '{credentials_key}', using token: {token[0:5]}...")
             request_object.add_header("Authorization", f"Bearer {token}")
         else:
-            log.debug(f"No credentials found for registry '{registry_base_domain}', using unauthenticated request.")
+            log.debug(f"No credentials found for '{credentials_key}', using unauthenticated request.")
         try:
-            response = request.urlopen(request_object)
+            return self.request_scheduler.get(request_object, timeout=self.run_budget.remaining())
+        except RequestSchedulerException as e:
+            if e.status == 404:
+                raise TerraformRegistryException(f"Registry resource '{url}' not found.")
+            raise TerraformRegistryException(f"Registry request returned an error '{url}': {e}")
         except Exception as e:
             raise TerraformRegistryException(f"Registry request returned an error '{url}': {e}")
-        if response.status == 404:
-            raise TerraformRegistryException(f"Registry resource '{url}' not found.")
-        elif response.status >= 400:
-            raise TerraformRegistryException(f"Registry request '{url}' returned error code '{response.status}'.")
-        return response
 
     def get_registry_metadata(self, registry_base_domain: str) -> dict:
         if registry_base_domain in self.cached_registry_metadata:
             log.debug(f"Registry metadata for '{registry_base_domain}' already cached.")
             return self.cached_registry_metadata[registry_base_domain]
-        discovery_url = f"https://{registry_base_domain}/.well-known/terraform.json"
-        response = self._send_request(discovery_url, registry_base_domain)
-        metadata = json.loads(response.read())
+        return self._single_flight.do(("metadata", registry_base_domain), lambda: self._fetch_registry_metadata(registry_base_domain))
+
+    def _fetch_registry_metadata(self, registry_base_domain: str) -> dict:
+        if registry_base_domain in self.cached_registry_metadata:
+            return self.cached_registry_metadata[registry_base_domain]
+        base_url = self._get_base_url(registry_base_domain)
+        if base_url in self._persisted_registry_metadata:
+            log.debug(f"Using persisted registry metadata of '{base_url}'.")
+            metadata = self._persisted_registry_metadata[base_url]
+            self.cached_registry_metadata[registry_base_domain] = metadata
+            return metadata
+        response = self._send_request(self._get_discovery_url(registry_base_domain), registry_base_domain)
+        metadata = json.loads(response)
         self.cached_registry_metadata[registry_base_domain] = metadata
+        if self.persistent_cache is not None:
+            self.persistent_cache.update_registry_metadata(base_url, metadata)
         return metadata
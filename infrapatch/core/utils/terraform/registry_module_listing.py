@@ -0,0 +1,65 @@
+import json
+import logging as log
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Union
+from urllib.parse import urlencode
+
+# key of the terraform cloud / enterprise api in the discovery document of a registry
+TFE_API_METADATA_KEY = "tfe.v2"
+DEFAULT_PAGE_SIZE = 100
+
+
+class RegistryModuleListingException(Exception):
+    pass
+
+
+@dataclass
+class ListedModule:
+    versions: list[str]
+    source: Union[str, None] = None
+
+
+# Lists all private modules of an organization with the organization level module listing of terraform cloud / enterprise.
+# The first page is requested alone to get the number of pages, the remaining pages are requested concurrently.
+class RegistryModuleLister:
+    def __init__(self, send_request: Callable[[str, str], bytes], max_workers: int = 8, page_size: int = DEFAULT_PAGE_SIZE):
+        self.send_request = send_request
+        self.max_workers = max_workers
+        self.page_size = page_size
+
+    def list_organization_modules(self, api_base_url: str, registry_base_domain: str, organization: str) -> dict[str, ListedModule]:
+        # returns the versions and sources of all private modules by their address <registry_domain>/<organization>/<name>/<provider>
+        if not api_base_url.endswith("/"):
+            api_base_url = f"{api_base_url}/"
+        endpoint = f"{api_base_url}organizations/{organization}/registry-modules"
+        first_page = self._get_page(endpoint, registry_base_domain, 1)
+        pagination = first_page.get("meta", {}).get("pagination", {})
+        total_pages = pagination.get("total-pages") or 1
+        log.debug(f"Listing private modules of organization '{organization}' on '{registry_base_domain}' with {total_pages} pages.")
+
+        pages = [first_page]
+        if total_pages > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, total_pages - 1), thread_name_prefix="infrapatch-module-listing") as executor:
+                pages.extend(executor.map(lambda page_number: self._get_page(endpoint, registry_base_domain, page_number), range(2, total_pages + 1)))
+
+        modules: dict[str, ListedModule] = {}
+        for page in pages:
+            for module in page.get("data", []):
+                attributes = module.get("attributes", {})
+                # modules with the registry name "public" are proxied from the public registry and are looked up there
+                if attributes.get("registry-name", "private") != "private":
+                    continue
+                address = f"{registry_base_domain}/{attributes['namespace']}/{attributes['name']}/{attributes['provider']}".lower()
+                versions = [version["version"] for version in attributes.get("version-statuses", []) if version.get("status", "ok") == "ok"]
+                vcs_repo = attributes.get("vcs-repo") or {}
+                modules[address] = ListedModule(versions=versions, source=vcs_repo.get("repository-http-url"))
+        log.debug(f"Found {len(modules)} private modules of organization '{organization}' on '{registry_base_domain}'.")
+        return modules
+
+    def _get_page(self, endpoint: str, registry_base_domain: str, page_number: int) -> dict:
+        url = f"{endpoint}?{urlencode({'page[number]': page_number, 'page[size]': self.page_size})}"
+        try:
+            return json.loads(self.send_request(url, registry_base_domain))
+        except Exception as e:
+            raise RegistryModuleListingException(f"Could not list modules from '{url}': {e}")
@@ -0,0 +1,342 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging as log
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Union
+from urllib import request
+from urllib.parse import parse_qs, urljoin, urlparse
+
+from infrapatch.core.utils.json_file import write_json_atomically
+from infrapatch.core.utils.request_scheduler import RequestScheduler, RequestSchedulerException
+from infrapatch.core.utils.single_flight import SingleFlight
+
+PROXY_API_PREFIX = "/_infrapatch"
+REGISTRY_SERVICES = ["modules.v1", "providers.v1"]
+# revalidated prefixes are kept until all responses fetched before are stale anyway, but never more than this
+MAX_INVALIDATIONS = 1000
+
+
+class RegistryProxyException(Exception):
+    def __init__(self, message: str, status: int = 502):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    status: int
+    body: bytes
+    content_type: str = "application/json"
+    etag: Union[str, None] = None
+    last_modified: Union[str, None] = None
+    fetched_at: float = 0
+
+    def to_dict(self) -> dict:
+        values = asdict(self)
+        values["body"] = base64.b64encode(self.body).decode()
+        return values
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "CachedResponse":
+        values = dict(values)
+        values["body"] = base64.b64decode(values["body"])
+        return cls(**values)
+
+
+# Bounded in-memory LRU backed by an optional unbounded disk tier, entries evicted from memory are still served from disk.
+class ResponseCache:
+    def __init__(self, max_entries: int = 10000, cache_directory: Union[Path, None] = None):
+        self.max_entries = max(1, max_entries)
+        self.cache_directory = cache_directory
+        if self.cache_directory is not None:
+            self.cache_directory.mkdir(parents=True, exist_ok=True)
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Union[CachedResponse, None]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                self.memory_hits += 1
+                return entry
+        entry = self._read_from_disk(url)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_in_memory(entry)
+        return entry
+
+    def put(self, entry: CachedResponse) -> None:
+        with self._lock:
+            self._put_in_memory(entry)
+        self._write_to_disk(entry)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _put_in_memory(self, entry: CachedResponse) -> None:
+        self._entries[entry.url] = entry
+        self._entries.move_to_end(entry.url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_cache_file(self, url: str) -> Path:
+        return self.cache_directory.joinpath(f"{hashlib.sha256(url.encode()).hexdigest()}.json")  # type: ignore
+
+    def _read_from_disk(self, url: str) -> Union[CachedResponse, None]:
+        if self.cache_directory is None:
+            return None
+        cache_file = self._get_cache_file(url)
+        if not cache_file.is_file():
+            return None
+        try:
+            with open(cache_file, "r") as file:
+                return CachedResponse.from_dict(json.load(file))
+        except Exception as e:
+            log.warning(f"Could not read cache file '{cache_file}', ignoring it: {e}")
+            return None
+
+    def _write_to_disk(self, entry: CachedResponse) -> None:
+        if self.cache_directory is None:
+            return
+        cache_file = self._get_cache_file(entry.url)
+        try:
+            write_json_atomically(cache_file, entry.to_dict())
+        except Exception as e:
+            log.warning(f"Could not write cache file '{cache_file}': {e}")
+
+
+# Caching proxy for the registry discovery, versions and version detail endpoints.
+# Requests are routed by the first path segment, e.g. /registry.terraform.io/v1/modules/<namespace>/<name>/<provider>/versions.
+class RegistryProxy:
+    def __init__(
+        self,
+        upstreams: dict[str, str],
+        credentials: Union[dict[str, str], None] = None,
+        request_scheduler: Union[RequestScheduler, None] = None,
+        cache: Union[ResponseCache, None] = None,
+        ttl: float = 300,
+        access_token: Union[str, None] = None,
+    ):
+        # maps the name used in the proxy path to the base url of the upstream registry
+        self.upstreams = {name: url.rstrip("/") for name, url in upstreams.items()}
+        self.credentials = {name: token for name, token in (credentials if credentials is not None else {}).items() if name in self.upstreams}
+        # clients have to send this token, responses fetched with the credentials of a private registry must not be served to anyone
+        self.access_token = access_token
+        if len(self.credentials) > 0 and self.access_token is None:
+            raise RegistryProxyException(f"Proxying the private registries {', '.join(self.credentials)} requires an access token for the clients of the proxy.")
+        self.request_scheduler = request_scheduler if request_scheduler is not None else RequestScheduler()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.ttl = ttl
+        self._service_paths: dict[str, list[str]] = {}
+        self._invalidations: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        self.requests = 0
+        self.upstream_requests = 0
+        self.upstream_errors = 0
+        self.not_modified = 0
+        self.stale_served = 0
+
+    def is_authorized(self, authorization: Union[str, None]) -> bool:
+        if self.access_token is None:
+            return True
+        return authorization is not None and hmac.compare_digest(authorization.encode(), f"Bearer {self.access_token}".encode())
+
+    def handle(self, path: str) -> CachedResponse:
+        with self._lock:
+            self.requests += 1
+        path = urlparse(path).path
+        name, _, upstream_path = path.lstrip("/").partition("/")
+        if name not in self.upstreams:
+            raise RegistryProxyException(f"Unknown upstream registry '{name}'.", status=404)
+        if upstream_path == ".well-known/terraform.json":
+            return self._get_discovery(name)
+        if name not in self._service_paths:
+            self._get_discovery(name)
+        if not any(f"/{upstream_path}".startswith(service_path) for service_path in self._service_paths.get(name, [])):
+            raise RegistryProxyException(f"Path '/{upstream_path}' is not a registry endpoint of '{name}'.", status=404)
+        return self._get_cached(name, f"{self.upstreams[name]}/{upstream_path}")
+
+    def revalidate(self, prefix: str = "/") -> None:
+        # cached entries below the prefix which were fetched before now are revalidated on their next request
+        now = time.time()
+        with self._lock:
+            # responses fetched before an invalidation older than the ttl are stale anyway
+            self._invalidations = {invalidated_prefix: invalidated_at for invalidated_prefix, invalidated_at in self._invalidations.items() if now - invalidated_at <= self.ttl}
+            self._invalidations.pop(prefix, None)
+            while len(self._invalidations) >= MAX_INVALIDATIONS:
+                # the oldest invalidation is replaced by one for the whole registry, so no revalidation is lost
+                oldest_prefix = min(self._invalidations, key=lambda invalidated_prefix: self._invalidations[invalidated_prefix])
+                self._invalidations.pop(oldest_prefix)
+                prefix = "/"
+            self._invalidations[prefix] = now
+        log.info(f"Marked cached responses below '{prefix}' for revalidation.")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "memory_hits": self.cache.memory_hits,
+                "disk_hits": self.cache.disk_hits,
+                "misses": self.cache.misses,
+                "memory_entries": len(self.cache),
+                "upstream_requests": self.upstream_requests,
+                "upstream_errors": self.upstream_errors,
+                "not_modified": self.not_modified,
+                "stale_served": self.stale_served,
+                "in_flight": self._single_flight.in_flight(),
+            }
+
+    def _get_discovery(self, name: str) -> CachedResponse:
+        discovery_url = f"{self.upstreams[name]}/.well-known/terraform.json"
+        response = self._get_cached(name, discovery_url)
+        if response.status != 200:
+            return response
+        try:
+            discovery = json.loads(response.body)
+        except ValueError as e:
+            raise RegistryProxyException(f"Invalid discovery document from upstream '{name}': {e}")
+        rewritten = {}
+        service_paths = []
+        for service in REGISTRY_SERVICES:
+            if service not in discovery:
+                continue
+            service_url = urlparse(urljoin(discovery_url, discovery[service]))
+            upstream_url = urlparse(self.upstreams[name])
+            if (service_url.scheme, service_url.netloc) != (upstream_url.scheme, upstream_url.netloc):
+                log.debug(f"Service '{service}' of upstream '{name}' is hosted on '{service_url.netloc}', which is not proxied.")
+                rewritten[service] = discovery[service]
+                continue
+            service_path = service_url.path.removeprefix(upstream_url.path)
+            service_paths.append(service_path)
+            rewritten[service] = f"/{name}{service_path}"
+        with self._lock:
+            self._service_paths[name] = service_paths
+        return CachedResponse(url=discovery_url, status=200, body=json.dumps(rewritten).encode(), fetched_at=response.fetched_at)
+
+    def _get_cached(self, name: str, url: str) -> CachedResponse:
+        cached = self.cache.get(url)
+        if cached is not None and not self._is_stale(name, url, cached):
+            return cached
+        return self._single_flight.do(url, lambda: self._fetch(name, url, cached))
+
+    def _is_stale(self, name: str, url: str, cached: CachedResponse) -> bool:
+        if time.time() - cached.fetched_at > self.ttl:
+            return True
+        proxy_path = f"/{name}{url.removeprefix(self.upstreams[name])}"
+        with self._lock:
+            return any(proxy_path.startswith(prefix) and cached.fetched_at < invalidated_at for prefix, invalidated_at in self._invalidations.items())
+
+    def _fetch(self, name: str, url: str, cached: Union[CachedResponse, None]) -> CachedResponse:
+        request_object = request.Request(url)
+        if name in self.credentials:
+            request_object.add_header("Authorization", f"Bearer {self.credentials[name]}")
+        if cached is not None and cached.etag is not None:
+            request_object.add_header("If-None-Match", cached.etag)
+        if cached is not None and cached.last_modified is not None:
+            request_object.add_header("If-Modified-Since", cached.last_modified)
+        with self._lock:
+            self.upstream_requests += 1
+        log.debug(f"Fetching '{url}' from upstream registry.")
+        try:
+            response = self.request_scheduler.get_response(request_object)
+            headers = {key.lower(): value for key, value in response.headers.items()}
+            entry = CachedResponse(
+                url=url,
+                status=response.status,
+                body=response.body,
+                content_type=headers.get("content-type", "application/json"),
+                etag=headers.get("etag"),
+                last_modified=headers.get("last-modified"),
+                fetched_at=time.time(),
+            )
+        except RequestSchedulerException as e:
+            if e.status == 304 and cached is not None:
+                with self._lock:
+                    self.not_modified += 1
+                entry = CachedResponse(**{**asdict(cached), "fetched_at": time.time()})
+            elif e.status == 404:
+                # cache misses as well, resources which do not exist are requested by every job
+                entry = CachedResponse(url=url, status=404, body=b'{"errors": ["Not Found"]}', fetched_at=time.time())
+            else:
+                return self._on_upstream_error(url, cached, e)
+        self.cache.put(entry)
+        return entry
+
+    def _on_upstream_error(self, url: str, cached: Union[CachedResponse, None], error: Exception) -> CachedResponse:
+        with self._lock:
+            self.upstream_errors += 1
+            if cached is not None:
+                self.stale_served += 1
+        if cached is None:
+            raise RegistryProxyException(f"Upstream request '{url}' failed: {error}")
+        log.warning(f"Upstream request '{url}' failed, serving stale response: {error}")
+        return cached
+
+
+class RegistryProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, proxy: RegistryProxy, host: str = "127.0.0.1", port: int = 8080):
+        super().__init__((host, port), RegistryProxyRequestHandler)
+        self.proxy = proxy
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class RegistryProxyRequestHandler(BaseHTTPRequestHandler):
+    server: RegistryProxyServer
+
+    def do_GET(self):
+        if not self.server.proxy.is_authorized(self.headers.get("Authorization")):
+            self._send(401, "application/json", json.dumps({"errors": ["Unauthorized"]}).encode())
+            return
+        if self.path.startswith(f"{PROXY_API_PREFIX}/stats"):
+            self._send(200, "application/json", json.dumps(self.server.proxy.get_stats()).encode())
+            return
+        try:
+            response = self.server.proxy.handle(self.path)
+        except RegistryProxyException as e:
+            self._send(e.status, "application/json", json.dumps({"errors": [str(e)]}).encode())
+            return
+        self._send(response.status, response.content_type, response.body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != f"{PROXY_API_PREFIX}/revalidate":
+            self._send(404, "application/json", json.dumps({"errors": ["Not Found"]}).encode())
+            return
+        # revalidations make the proxy request the upstream registries, so they are only accepted from clients with the access token
+        if self.server.proxy.access_token is None or not self.server.proxy.is_authorized(self.headers.get("Authorization")):
+            self._send(401, "application/json", json.dumps({"errors": ["Revalidation requires the access token of the proxy."]}).encode())
+            return
+        prefix = parse_qs(url.query).get("prefix", ["/"])[0]
+        self.server.proxy.revalidate(prefix)
+        self._send(202, "application/json", json.dumps({"prefix": prefix}).encode())
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(f"{self.address_string()} - {format % args}")
@@ -0,0 +1,139 @@
+import fnmatch
+import json
+import logging as log
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Protocol, Sequence, Union
+from urllib import request
+
+from infrapatch.core.utils.request_scheduler import RequestScheduler, RequestSchedulerException
+
+
+class RegistrySnapshotException(Exception):
+    pass
+
+
+class SnapshotResourceType:
+    MODULE = "module"
+    PROVIDER = "provider"
+
+
+@dataclass
+class RegistrySnapshotEntry:
+    versions: list[str] = field(default_factory=list)
+    source: Optional[str] = None
+
+
+class RegistrySnapshotInterface(Protocol):
+    def get_entry(self, resource_type: str, address: str) -> Union[RegistrySnapshotEntry, None]: ...
+
+
+# JSON snapshot file with the following structure, addresses always include the registry domain:
+# {"modules": {"registry.terraform.io/<namespace>/<name>/<provider>": {"versions": ["1.0.0"], "source": "https://github.com/..."}},
+#  "providers": {"registry.terraform.io/<namespace>/<type>": {"versions": ["1.0.0"], "source": "https://github.com/..."}}}
+class JsonRegistrySnapshot(RegistrySnapshotInterface):
+    def __init__(self, snapshot_file: Path):
+        try:
+            with open(snapshot_file, "r") as file:
+                snapshot = json.load(file)
+        except Exception as e:
+            raise RegistrySnapshotException(f"Could not read registry snapshot '{snapshot_file}': {e}")
+        self._entries: dict[str, dict[str, RegistrySnapshotEntry]] = {}
+        for resource_type, key in [(SnapshotResourceType.MODULE, "modules"), (SnapshotResourceType.PROVIDER, "providers")]:
+            self._entries[resource_type] = {
+                address.lower(): RegistrySnapshotEntry(versions=entry.get("versions", []), source=entry.get("source")) for address, entry in snapshot.get(key, {}).items()
+            }
+        log.debug(f"Loaded registry snapshot '{snapshot_file}' with {sum(len(entries) for entries in self._entries.values())} entries.")
+
+    def get_entry(self, resource_type: str, address: str) -> Union[RegistrySnapshotEntry, None]:
+        return self._entries[resource_type].get(address.lower())
+
+
+# SQLite snapshot file with the table: resources(resource_type TEXT, address TEXT, versions TEXT, source TEXT, PRIMARY KEY (resource_type, address)),
+# where versions is a JSON encoded list of version strings.
+class SqliteRegistrySnapshot(RegistrySnapshotInterface):
+    def __init__(self, snapshot_file: Path):
+        if not snapshot_file.is_file():
+            raise RegistrySnapshotException(f"Registry snapshot '{snapshot_file}' does not exist.")
+        self._connection = sqlite3.connect(f"file:{snapshot_file.absolute().as_posix()}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def get_entry(self, resource_type: str, address: str) -> Union[RegistrySnapshotEntry, None]:
+        try:
+            with self._lock:
+                row = self._connection.execute("SELECT versions, source FROM resources WHERE resource_type = ? AND address = ?", (resource_type, address.lower())).fetchone()
+        except sqlite3.Error as e:
+            raise RegistrySnapshotException(f"Could not query registry snapshot: {e}")
+        if row is None:
+            return None
+        return RegistrySnapshotEntry(versions=json.loads(row[0]), source=row[1])
+
+
+# Provider mirror in the layout of the terraform provider network mirror protocol (<hostname>/<namespace>/<type>/index.json).
+# The mirror can either be a local directory or a http(s) url. Modules are not part of provider mirrors.
+class ProviderMirrorSnapshot(RegistrySnapshotInterface):
+    def __init__(self, mirror: str, request_scheduler: Union[RequestScheduler, None] = None, include: Sequence[str] = [], exclude: Sequence[str] = []):
+        self.mirror = mirror.rstrip("/")
+        self.is_remote = self.mirror.startswith("https://") or self.mirror.startswith("http://")
+        self.request_scheduler = request_scheduler if request_scheduler is not None else RequestScheduler()
+        self.include = [pattern.lower() for pattern in include]
+        self.exclude = [pattern.lower() for pattern in exclude]
+
+    def get_entry(self, resource_type: str, address: str) -> Union[RegistrySnapshotEntry, None]:
+        if resource_type != SnapshotResourceType.PROVIDER:
+            return None
+        address = address.lower()
+        if len(self.include) > 0 and not any(fnmatch.fnmatch(address, pattern) for pattern in self.include):
+            return None
+        if any(fnmatch.fnmatch(address, pattern) for pattern in self.exclude):
+            return None
+        index = self._read_index(address)
+        if index is None:
+            return None
+        return RegistrySnapshotEntry(versions=list(index.get("versions", {}).keys()))
+
+    def _read_index(self, address: str) -> Union[dict, None]:
+        if self.is_remote:
+            try:
+                return json.loads(self.request_scheduler.get(request.Request(f"{self.mirror}/{address}/index.json")))
+            except RequestSchedulerException as e:
+                log.debug(f"Provider '{address}' not found in network mirror '{self.mirror}': {e}")
+                return None
+            except json.JSONDecodeError as e:
+                # e.g. an html error page of a proxy in front of the mirror, the provider is looked up in the registry instead
+                log.warning(f"Network mirror '{self.mirror}' returned an invalid index for provider '{address}': {e}")
+                return None
+        index_file = Path(self.mirror.removeprefix("file://")).joinpath(address, "index.json")
+        if not index_file.is_file():
+            log.debug(f"Provider '{address}' not found in mirror directory '{self.mirror}'.")
+            return None
+        try:
+            with open(index_file, "r") as file:
+                return json.load(file)
+        except json.JSONDecodeError as e:
+            log.warning(f"Mirror directory '{self.mirror}' contains an invalid index for provider '{address}': {e}")
+            return None
+
+
+class CompositeRegistrySnapshot(RegistrySnapshotInterface):
+    def __init__(self, snapshots: Sequence[RegistrySnapshotInterface]):
+        self.snapshots = snapshots
+
+    def get_entry(self, resource_type: str, address: str) -> Union[RegistrySnapshotEntry, None]:
+        for snapshot in self.snapshots:
+            entry = snapshot.get_entry(resource_type, address)
+            if entry is not None:
+                return entry
+        return None
+
+
+def load_registry_snapshot(snapshot_path: Path) -> RegistrySnapshotInterface:
+    if snapshot_path.is_dir():
+        return ProviderMirrorSnapshot(snapshot_path.absolute().as_posix())
+    if snapshot_path.suffix in [".sqlite", ".sqlite3", ".db"]:
+        return SqliteRegistrySnapshot(snapshot_path)
+    if snapshot_path.suffix == ".json":
+        return JsonRegistrySnapshot(snapshot_path)
+    raise RegistrySnapshotException(f"Unsupported registry snapshot '{snapshot_path}', expected a mirror directory, a .json or a .sqlite file.")
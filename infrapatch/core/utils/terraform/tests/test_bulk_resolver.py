@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule, VersionedTerraformResource
+from infrapatch.core.utils.terraform.bulk_resolver import BulkResolver, BulkResolverException, ResolveRequest, parse_resolve_requests
+
+
+class StandInRegistryHandler:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_newest_version(self, resource: VersionedTerraformResource):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if "missing" in resource.source:
+            return None
+        return "2.0.0" if isinstance(resource, TerraformModule) else "5.0.0"
+
+    def get_source(self, resource: VersionedTerraformResource):
+        return f"https://github.com/{resource.identifier}"
+
+
+def test_resolve():
+    resolver = BulkResolver(StandInRegistryHandler())  # type: ignore
+    results = {result.source: result for result in resolver.resolve(["test/test_module/test_provider", "spacelift.io/hashicorp/aws", "test/missing", "invalid"])}
+    assert results["test/test_module/test_provider"].resource_type == "module"
+    assert results["test/test_module/test_provider"].newest_version == "2.0.0"
+    assert results["test/test_module/test_provider"].source_url == "https://github.com/test/test_module/test_provider"
+    assert results["spacelift.io/hashicorp/aws"].resource_type == "provider"
+    assert results["spacelift.io/hashicorp/aws"].newest_version == "5.0.0"
+    assert results["test/missing"].newest_version is None
+    assert results["test/missing"].source_url is None
+    assert results["invalid"].error is not None
+
+
+def test_resolve_is_concurrent_and_streaming():
+    registry_handler = StandInRegistryHandler(delay=0.05)
+    resolver = BulkResolver(registry_handler, max_workers=8)  # type: ignore
+    sources = (f"test/module{index}/test_provider" for index in range(40))
+    start = time.monotonic()
+    results = list(resolver.resolve(sources))
+    assert len(results) == 40
+    assert sorted(result.index for result in results) == list(range(40))
+    assert registry_handler.max_in_flight == 8
+    assert time.monotonic() - start < 1
+
+
+def test_explicit_resource_type():
+    resolver = BulkResolver(StandInRegistryHandler())  # type: ignore
+    result = next(resolver.resolve([ResolveRequest(source="spacelift.io/hashicorp/aws", resource_type="module")]))
+    assert result.error is not None
+    result = next(resolver.resolve([ResolveRequest(source="hashicorp/aws", resource_type="unknown")]))
+    assert result.error is not None
+
+
+def test_parse_resolve_requests():
+    lines = ["hashicorp/aws\n", "\n", "# comment\n", '{"source": "test/test_module/test_provider", "type": "module"}\n']
+    requests = list(parse_resolve_requests(lines))
+    assert requests == [ResolveRequest(source="hashicorp/aws", index=0), ResolveRequest(source="test/test_module/test_provider", resource_type="module", index=3)]
+    with pytest.raises(BulkResolverException):
+        list(parse_resolve_requests(['{"type": "module"}']))
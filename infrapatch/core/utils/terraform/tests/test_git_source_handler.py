@@ -0,0 +1,115 @@
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformGitModule
+from infrapatch.core.utils.terraform.git_source_handler import GitSourceException, GitSourceHandler
+from infrapatch.core.utils.terraform.registry_cache import PersistentRegistryCache
+
+
+# the test repositories are local bare repositories
+LOCAL_PROTOCOLS = ["file"]
+
+
+def _git(*args: str, cwd: Path):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def bare_repository(tmp_path: Path) -> Path:
+    work_tree = tmp_path.joinpath("work")
+    work_tree.mkdir()
+    _git("init", "-q", cwd=work_tree)
+    _git("-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-q", "--allow-empty", "-m", "initial", cwd=work_tree)
+    for tag in ["v1.0.0", "v1.10.0", "v1.2.0", "v2.0.0-rc1", "2.1.0", "latest"]:
+        _git("tag", tag, cwd=work_tree)
+    bare_repository = tmp_path.joinpath("repository.git")
+    _git("clone", "-q", "--bare", work_tree.as_posix(), bare_repository.as_posix(), cwd=tmp_path)
+    return bare_repository
+
+
+def _get_module(repository: Path, ref: str = "v1.0.0") -> TerraformGitModule:
+    return TerraformGitModule(
+        name="test_module",
+        current_version=ref.removeprefix("v"),
+        source_file=Path("test_file.tf"),
+        source_string=f"git::file://{repository.as_posix()}?ref={ref}",
+        start_line_number=1,
+    )
+
+
+def test_get_newest_version(bare_repository: Path):
+    git_source_handler = GitSourceHandler(allowed_protocols=LOCAL_PROTOCOLS)
+    # pre-releases and tags with another prefix are ignored
+    assert git_source_handler.get_newest_version(_get_module(bare_repository)) == "1.10.0"
+    assert git_source_handler.get_newest_version(_get_module(bare_repository, "1.0.0")) == "2.1.0"
+
+
+def test_repositories_are_listed_once(bare_repository: Path):
+    git_source_handler = GitSourceHandler(allowed_protocols=LOCAL_PROTOCOLS)
+    list_remote_tags = git_source_handler._list_remote_tags
+    listed_repositories: list[str] = []
+    lock = threading.Lock()
+
+    def count_list_remote_tags(repository_url: str):
+        with lock:
+            listed_repositories.append(repository_url)
+        return list_remote_tags(repository_url)
+
+    git_source_handler._list_remote_tags = count_list_remote_tags  # type: ignore
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        versions = list(executor.map(lambda _: git_source_handler.get_newest_version(_get_module(bare_repository)), range(16)))
+    assert versions == ["1.10.0"] * 16
+    assert len(listed_repositories) == 1
+
+
+def test_tags_are_persisted(bare_repository: Path, tmp_path: Path):
+    registry_cache = PersistentRegistryCache(tmp_path.joinpath("cache"))
+    GitSourceHandler(allowed_protocols=LOCAL_PROTOCOLS, persistent_cache=registry_cache).get_newest_version(_get_module(bare_repository))
+    registry_cache.save()
+
+    git_source_handler = GitSourceHandler(allowed_protocols=LOCAL_PROTOCOLS, persistent_cache=PersistentRegistryCache(tmp_path.joinpath("cache")))
+
+    def fail(repository_url: str):
+        raise AssertionError(f"Repository '{repository_url}' should be served from the cache.")
+
+    git_source_handler._list_remote_tags = fail  # type: ignore
+    assert git_source_handler.get_newest_version(_get_module(bare_repository)) == "1.10.0"
+
+
+def test_missing_repository(tmp_path: Path):
+    with pytest.raises(GitSourceException):
+        GitSourceHandler(allowed_protocols=LOCAL_PROTOCOLS).get_newest_version(_get_module(tmp_path.joinpath("missing.git")))
+
+
+def test_get_source(bare_repository: Path):
+    git_source_handler = GitSourceHandler(allowed_protocols=LOCAL_PROTOCOLS)
+    assert git_source_handler.get_source(_get_module(bare_repository)) is None
+    module = TerraformGitModule(
+        name="test_module", current_version="1.0.0", source_file=Path("test_file.tf"), source_string="git@github.com:test/test_module.git?ref=v1.0.0", start_line_number=1
+    )
+    assert git_source_handler.get_source(module) == "https://github.com/test/test_module"
+
+
+def test_repository_urls_are_not_read_as_options(tmp_path: Path):
+    marker = tmp_path.joinpath("marker")
+    module = TerraformGitModule(
+        name="test_module",
+        current_version="1.0.0",
+        source_file=Path("test_file.tf"),
+        source_string=f"git::--upload-pack=touch {marker.as_posix()};git-upload-pack?ref=v1.0.0",
+        start_line_number=1,
+    )
+    git_source_handler = GitSourceHandler()
+
+    assert git_source_handler.get_newest_version(module) is None
+    with pytest.raises(GitSourceException):
+        git_source_handler._list_remote_tags(f"--upload-pack=touch {marker.as_posix()};git-upload-pack")
+    assert not marker.exists()
+    for repository_url in ["ssh://-oProxyCommand=touch/repo", "git@-oProxyCommand=touch:repo", "file:///tmp/repo", "ext::sh -c touch"]:
+        assert git_source_handler.is_allowed_repository_url(repository_url) is False
+    for repository_url in ["https://github.com/test/repo.git", "ssh://git@example.com/repo.git", "git@github.com:test/repo.git"]:
+        assert git_source_handler.is_allowed_repository_url(repository_url) is True
@@ -3,7 +3,7 @@ from unittest.mock import patch
 
 import pytest
 
-from infrapatch.core.models.versioned_terraform_resources import TerraformModule, TerraformProvider
+from infrapatch.core.models.versioned_terraform_resources import TerraformGitModule, TerraformModule, TerraformProvider
 from infrapatch.core.utils.terraform.hcl_edit_cli import HclEditCli
 from infrapatch.core.utils.terraform.hcl_handler import HclHandler, HclParserException
 
@@ -220,3 +220,58 @@ def test_get_credentials_form_user_rc_file(hcl_handler, tmp_user_home: Path):
 
         # Clean up the temporary file
         terraform_rc_file.unlink()
+
+
+def test_get_network_mirrors_from_user_rc_file(hcl_handler, tmp_user_home: Path):
+    with patch("pathlib.Path.home", return_value=tmp_user_home):
+        assert len(hcl_handler.get_network_mirrors_from_user_rc_file()) == 0
+
+        tmp_user_home.joinpath(".terraformrc").write_text(
+            """
+            provider_installation {
+                network_mirror {
+                    url = "https://mirror1.example.com/"
+                    include = ["registry.terraform.io/hashicorp/*"]
+                }
+                network_mirror {
+                    url = "https://mirror2.example.com/"
+                    exclude = ["registry.terraform.io/hashicorp/*"]
+                }
+                direct {}
+            }
+            """
+        )
+        network_mirrors = hcl_handler.get_network_mirrors_from_user_rc_file()
+        assert len(network_mirrors) == 2
+        assert network_mirrors[0].url == "https://mirror1.example.com/"
+        assert network_mirrors[0].include == ["registry.terraform.io/hashicorp/*"]
+        assert network_mirrors[1].url == "https://mirror2.example.com/"
+        assert network_mirrors[1].exclude == ["registry.terraform.io/hashicorp/*"]
+
+
+def test_git_modules(hcl_handler: HclHandler, tmp_path: Path):
+    tf_file = tmp_path.joinpath("test_file.tf")
+    tf_file.write_text(
+        """
+        module "git_module" {
+            source = "git::https://example.com/test/test_module.git//modules/test?ref=v1.0.0"
+        }
+        module "github_module" {
+            source = "github.com/test/test_module?ref=1.0.0"
+        }
+        module "branch_module" {
+            source = "git::https://example.com/test/test_module.git?ref=main"
+        }
+        """
+    )
+    resources = hcl_handler.get_terraform_resources_from_file(tf_file, get_modules=True, get_providers=False)
+    assert len(resources) == 2
+    for resource in resources:
+        assert isinstance(resource, TerraformGitModule)
+        assert resource.current_version == "1.0.0"
+        resource.newest_version = "1.1.0"
+        hcl_handler.bump_resource_version(resource)
+
+    resources = hcl_handler.get_terraform_resources_from_file(tf_file, get_modules=True, get_providers=False)
+    sources = sorted(resource.source for resource in resources)
+    assert sources == ["git::https://example.com/test/test_module.git//modules/test?ref=v1.1.0", "github.com/test/test_module?ref=1.1.0"]
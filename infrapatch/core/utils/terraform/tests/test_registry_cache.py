@@ -0,0 +1,148 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Union
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.utils.terraform.registry_cache import PersistentRegistryCache, RegistryCacheException, RegistryCacheResourceType
+from infrapatch.core.utils.terraform.registry_handler import RegistryHandler
+
+
+@pytest.fixture
+def registry_responses():
+    return {
+        "https://registry.terraform.io/.well-known/terraform.json": {"modules.v1": "/v1/modules/", "providers.v1": "/v1/providers/"},
+        "https://registry.terraform.io/v1/modules/test/test_module/test_provider/versions": {"modules": [{"versions": [{"version": "1.0.0"}, {"version": "2.1.0"}]}]},
+        "https://registry.terraform.io/v1/modules/test/test_module/test_provider/2.1.0": {"source": "https://github.com/test/test_module"},
+    }
+
+
+def _get_module() -> TerraformModule:
+    return TerraformModule(name="test_module", current_version="1.0.0", source_file=Path("test_file.tf"), source_string="test/test_module/test_provider", start_line_number=1)
+
+
+def _resolve(registry_cache: PersistentRegistryCache, registry_responses: dict, requested_urls: list[str], registry_overrides: Union[dict[str, str], None] = None) -> tuple:
+    registry_handler = RegistryHandler("registry.terraform.io", {}, persistent_cache=registry_cache, registry_overrides=registry_overrides)
+
+    def send_request(url: str, registry_base_domain: str):
+        requested_urls.append(url)
+        return json.dumps(registry_responses[url]).encode()
+
+    registry_handler._send_request = send_request  # type: ignore
+    module = _get_module()
+    module.newest_version = registry_handler.get_newest_version(module)
+    return module.newest_version, registry_handler.get_source(module)
+
+
+def test_lookups_are_persisted(registry_responses: dict, tmp_path: Path):
+    requested_urls: list[str] = []
+    registry_cache = PersistentRegistryCache(tmp_path)
+    assert _resolve(registry_cache, registry_responses, requested_urls) == ("2.1.0", "https://github.com/test/test_module")
+    registry_cache.save()
+    assert len(requested_urls) == 3
+
+    # the next run is answered from the cache file
+    registry_cache = PersistentRegistryCache(tmp_path)
+    assert _resolve(registry_cache, registry_responses, requested_urls) == ("2.1.0", "https://github.com/test/test_module")
+    assert len(requested_urls) == 3
+    stats = registry_cache.get_stats()
+    assert stats["modules"] == 1
+    assert stats["registries"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["age"]["< 1h"] == 1
+
+
+def test_expired_entries_are_looked_up_again(registry_responses: dict, tmp_path: Path):
+    requested_urls: list[str] = []
+    registry_cache = PersistentRegistryCache(tmp_path, ttl=0)
+    _resolve(registry_cache, registry_responses, requested_urls)
+    time.sleep(0.01)
+    _resolve(registry_cache, registry_responses, requested_urls)
+    assert len(requested_urls) == 6
+    assert registry_cache.get_stats()["expired"] == 1
+
+
+def test_registry_metadata_is_persisted_per_base_url(registry_responses: dict, tmp_path: Path):
+    requested_urls: list[str] = []
+    registry_cache = PersistentRegistryCache(tmp_path)
+    _resolve(registry_cache, registry_responses, requested_urls)
+    registry_cache.save()
+
+    # the metadata of the registry is not used for the proxy overriding it
+    proxy_url = "http://proxy:8080/registry.terraform.io"
+    registry_responses[f"{proxy_url}/.well-known/terraform.json"] = {"modules.v1": "/registry.terraform.io/v1/modules/"}
+    registry_cache = PersistentRegistryCache(tmp_path)
+    registry_cache.update_resource(RegistryCacheResourceType.MODULE, "registry.terraform.io/test/test_module/test_provider", newest_version="3.0.0")
+    registry_responses["http://proxy:8080/registry.terraform.io/v1/modules/test/test_module/test_provider/3.0.0"] = {"source": "https://github.com/test/test_module"}
+    requested_urls.clear()
+    assert _resolve(registry_cache, registry_responses, requested_urls, {"registry.terraform.io": proxy_url}) == ("3.0.0", "https://github.com/test/test_module")
+    assert requested_urls == [f"{proxy_url}/.well-known/terraform.json", "http://proxy:8080/registry.terraform.io/v1/modules/test/test_module/test_provider/3.0.0"]
+    assert set(registry_cache.get_registry_metadata()) == {"https://registry.terraform.io", proxy_url}
+
+
+def test_new_entries_with_only_a_source_are_not_expired(tmp_path: Path):
+    registry_cache = PersistentRegistryCache(tmp_path)
+    registry_cache.update_resource(RegistryCacheResourceType.MODULE, "registry.terraform.io/test/test_module/test_provider", source="https://github.com/test/test_module")
+    assert registry_cache.get_resources(RegistryCacheResourceType.MODULE)["registry.terraform.io/test/test_module/test_provider"].source == "https://github.com/test/test_module"
+
+
+def test_concurrent_saves(tmp_path: Path):
+    registry_caches = [PersistentRegistryCache(tmp_path) for _ in range(4)]
+    for index, registry_cache in enumerate(registry_caches):
+        registry_cache.update_resource(RegistryCacheResourceType.PROVIDER, f"registry.terraform.io/hashicorp/provider{index}", newest_version="1.0.0")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda registry_cache: registry_cache.save(), registry_caches * 5))
+    # the cache file is one of the complete saves and no temporary files are left
+    assert PersistentRegistryCache(tmp_path).get_stats()["providers"] == 1
+    assert [file.name for file in tmp_path.iterdir()] == ["registry_cache.json"]
+
+
+def test_invalid_entries_are_skipped(tmp_path: Path):
+    now = time.time()
+    content = {
+        "version": 1,
+        "modules": {
+            "registry.terraform.io/test/valid/aws": {"newest_version": "1.0.0", "fetched_at": now},
+            "registry.terraform.io/test/unknown_field/aws": {"newest_version": "1.0.0", "fetched_at": now, "etag": "abc"},
+            "registry.terraform.io/test/invalid_fetched_at/aws": {"newest_version": "1.0.0", "fetched_at": "yesterday"},
+        },
+        "registry_metadata": {"https://registry.terraform.io": {"metadata": {}}, "https://example.com": {"metadata": {"modules.v1": "/v1/modules/"}, "fetched_at": now}},
+    }
+    tmp_path.joinpath("registry_cache.json").write_text(json.dumps(content))
+
+    registry_cache = PersistentRegistryCache(tmp_path)
+
+    assert list(registry_cache.get_resources(RegistryCacheResourceType.MODULE)) == ["registry.terraform.io/test/valid/aws"]
+    assert list(registry_cache.get_registry_metadata()) == ["https://example.com"]
+
+
+def test_prune(tmp_path: Path):
+    registry_cache = PersistentRegistryCache(tmp_path)
+    registry_cache.update_resource(RegistryCacheResourceType.PROVIDER, "registry.terraform.io/hashicorp/aws", newest_version="5.0.0")
+    assert registry_cache.prune(max_age=3600) == 0
+    time.sleep(0.01)
+    assert registry_cache.prune(max_age=0) == 1
+    assert registry_cache.get_stats()["providers"] == 0
+
+
+def test_export_and_import(tmp_path: Path):
+    registry_cache = PersistentRegistryCache(tmp_path.joinpath("source"))
+    registry_cache.update_resource(RegistryCacheResourceType.PROVIDER, "registry.terraform.io/hashicorp/aws", newest_version="5.0.0", source="https://github.com/hashicorp/aws")
+    archive = tmp_path.joinpath("registry_cache.json.gz")
+    registry_cache.export_cache(archive)
+
+    imported_cache = PersistentRegistryCache(tmp_path.joinpath("target"))
+    assert imported_cache.import_cache(archive) == 1
+    entry = imported_cache.get_resources(RegistryCacheResourceType.PROVIDER)["registry.terraform.io/hashicorp/aws"]
+    assert entry.newest_version == "5.0.0"
+    assert entry.source == "https://github.com/hashicorp/aws"
+    # entries which are not newer than the existing ones are not imported again
+    assert imported_cache.import_cache(archive) == 0
+
+    with pytest.raises(RegistryCacheException):
+        imported_cache.import_cache(tmp_path.joinpath("missing.json"))
@@ -0,0 +1,48 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.utils.terraform.registry_handler import RegistryHandler
+
+
+@pytest.fixture
+def registry_responses():
+    return {
+        "https://registry.terraform.io/.well-known/terraform.json": {"modules.v1": "/v1/modules/", "providers.v1": "/v1/providers/"},
+        "https://registry.terraform.io/v1/modules/test/test_module/test_provider/versions": {"modules": [{"versions": [{"version": "1.0.0"}, {"version": "2.1.0"}]}]},
+        "https://registry.terraform.io/v1/modules/test/test_module/test_provider/2.1.0": {"source": "https://github.com/test/test_module"},
+    }
+
+
+def _get_module(name: str) -> TerraformModule:
+    return TerraformModule(name=name, current_version="1.0.0", source_file=Path("test_file.tf"), source_string="test/test_module/test_provider", start_line_number=1)
+
+
+def test_concurrent_lookups_are_coalesced(registry_responses: dict):
+    registry_handler = RegistryHandler("registry.terraform.io", {})
+    requested_urls: list[str] = []
+    lock = threading.Lock()
+
+    def send_request(url: str, registry_base_domain: str):
+        with lock:
+            requested_urls.append(url)
+        time.sleep(0.1)
+        return json.dumps(registry_responses[url]).encode()
+
+    registry_handler._send_request = send_request  # type: ignore
+
+    def resolve(name: str):
+        resource = _get_module(name)
+        resource.newest_version = registry_handler.get_newest_version(resource)
+        return resource.newest_version, registry_handler.get_source(resource)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(resolve, [f"module_{i}" for i in range(8)]))
+
+    assert results == [("2.1.0", "https://github.com/test/test_module")] * 8
+    assert sorted(requested_urls) == sorted(registry_responses.keys())
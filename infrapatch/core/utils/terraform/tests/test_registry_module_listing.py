@@ -0,0 +1,126 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.utils.terraform.registry_handler import RegistryHandler, TerraformRegistryException
+
+
+class StandInTerraformCloud(ThreadingHTTPServer):
+    def __init__(self, module_count: int, page_size: int = 100):
+        super().__init__(("127.0.0.1", 0), StandInTerraformCloudRequestHandler)
+        self.requests: list[str] = []
+        self.lock = threading.Lock()
+        self.page_size = page_size
+        self.fail_listing = False
+        self.modules = [
+            {
+                "attributes": {
+                    "name": f"module{index}",
+                    "namespace": "test-org",
+                    "provider": "aws",
+                    "registry-name": "private",
+                    "version-statuses": [{"version": "1.0.0", "status": "ok"}, {"version": f"1.{index}.0", "status": "ok"}, {"version": "9.0.0", "status": "errored"}],
+                }
+            }
+            for index in range(module_count)
+        ]
+        self.modules.append({"attributes": {"name": "vpc", "namespace": "test-org", "provider": "aws", "registry-name": "public", "version-statuses": [{"version": "5.0.0"}]}})
+        self.documents = {
+            "/.well-known/terraform.json": {"modules.v1": "/api/registry/v1/modules/", "tfe.v2": "/api/v2/"},
+            "/api/registry/v1/modules/test-org/unlisted/aws/versions": {"modules": [{"versions": [{"version": "3.0.0"}]}]},
+        }
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInTerraformCloudRequestHandler(BaseHTTPRequestHandler):
+    server: StandInTerraformCloud
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        url = urlparse(self.path)
+        if url.path == "/api/v2/organizations/test-org/registry-modules" and not self.server.fail_listing:
+            query = parse_qs(url.query)
+            page_size = min(int(query["page[size]"][0]), self.server.page_size)
+            page_number = int(query["page[number]"][0])
+            total_pages = (len(self.server.modules) + page_size - 1) // page_size
+            data = self.server.modules[(page_number - 1) * page_size : page_number * page_size]
+            document = {"data": data, "meta": {"pagination": {"current-page": page_number, "total-pages": total_pages}}}
+        elif url.path in self.server.documents:
+            document = self.server.documents[url.path]
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(document).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def terraform_cloud():
+    server = StandInTerraformCloud(module_count=250, page_size=20)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get_module(source: str) -> TerraformModule:
+    return TerraformModule(name=source, current_version="1.0.0", source_file=Path("main.tf"), source_string=source, start_line_number=1)
+
+
+def _get_registry_handler(terraform_cloud: StandInTerraformCloud, bulk_listing: bool = True) -> RegistryHandler:
+    return RegistryHandler("registry.terraform.io", {}, registry_overrides={"app.terraform.io": terraform_cloud.url}, bulk_listing=bulk_listing)
+
+
+def test_private_modules_are_listed_once(terraform_cloud: StandInTerraformCloud):
+    registry_handler = _get_registry_handler(terraform_cloud)
+    modules = [_get_module(f"app.terraform.io/test-org/module{index}/aws") for index in range(200)]
+    registry_handler.prefetch(modules)
+
+    assert [registry_handler.get_newest_version(module) for module in modules] == [f"1.{index}.0" if index > 0 else "1.0.0" for index in range(200)]
+    listing_requests = [path for path in terraform_cloud.requests if "/registry-modules" in path]
+    # 251 modules with 20 modules per page
+    assert len(listing_requests) == 13
+    assert not any(path.endswith("/versions") for path in terraform_cloud.requests)
+
+
+def test_missing_modules_fall_back_to_single_lookups(terraform_cloud: StandInTerraformCloud):
+    registry_handler = _get_registry_handler(terraform_cloud)
+    unlisted = _get_module("app.terraform.io/test-org/unlisted/aws")
+    public = _get_module("app.terraform.io/test-org/vpc/aws")
+    registry_handler.prefetch([unlisted, public])
+
+    assert registry_handler.get_newest_version(unlisted) == "3.0.0"
+    assert "/api/registry/v1/modules/test-org/unlisted/aws/versions" in terraform_cloud.requests
+    # modules proxied from the public registry are not taken from the listing, but looked up one by one
+    with pytest.raises(TerraformRegistryException):
+        registry_handler.get_newest_version(public)
+
+
+def test_failed_listing_falls_back_to_single_lookups(terraform_cloud: StandInTerraformCloud):
+    terraform_cloud.fail_listing = True
+    registry_handler = _get_registry_handler(terraform_cloud)
+    unlisted = _get_module("app.terraform.io/test-org/unlisted/aws")
+    registry_handler.prefetch([unlisted])
+    assert registry_handler.get_newest_version(unlisted) == "3.0.0"
+
+
+def test_listing_is_disabled_by_default(terraform_cloud: StandInTerraformCloud):
+    registry_handler = _get_registry_handler(terraform_cloud, bulk_listing=False)
+    registry_handler.prefetch([_get_module("app.terraform.io/test-org/module1/aws")])
+    assert terraform_cloud.requests == []
@@ -0,0 +1,217 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Union
+from urllib import request
+from urllib.error import HTTPError
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.utils.terraform.registry_handler import RegistryHandler
+from infrapatch.core.utils.terraform.registry_proxy import CachedResponse, RegistryProxy, RegistryProxyException, RegistryProxyServer, ResponseCache
+
+
+class StandInUpstream(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInUpstreamRequestHandler)
+        self.requests: list[str] = []
+        self.authorizations: list[Union[str, None]] = []
+        self.fail = False
+        self.lock = threading.Lock()
+        self.documents = {
+            "/.well-known/terraform.json": {"modules.v1": "/v1/modules/", "providers.v1": "/v1/providers/"},
+            "/v1/modules/test/test_module/test_provider/versions": {"modules": [{"versions": [{"version": "1.0.0"}, {"version": "2.1.0"}]}]},
+            "/v1/modules/test/test_module/test_provider/2.1.0": {"source": "https://github.com/test/test_module"},
+        }
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInUpstreamRequestHandler(BaseHTTPRequestHandler):
+    server: StandInUpstream
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            self.server.authorizations.append(self.headers.get("Authorization"))
+        if self.server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if self.path not in self.server.documents:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(self.server.documents[self.path]).encode()
+        etag = f'"{hash(body)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start(server: ThreadingHTTPServer):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+
+@pytest.fixture
+def upstream():
+    server = StandInUpstream()
+    _start(server)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _create_proxy_server(
+    upstream: StandInUpstream, cache: ResponseCache, ttl: float = 300, credentials: Union[dict[str, str], None] = None, access_token: Union[str, None] = None
+) -> RegistryProxyServer:
+    proxy = RegistryProxy({"registry.terraform.io": upstream.url}, credentials, cache=cache, ttl=ttl, access_token=access_token)
+    server = RegistryProxyServer(proxy, port=0)
+    _start(server)
+    return server
+
+
+@pytest.fixture
+def proxy_server(upstream: StandInUpstream):
+    server = _create_proxy_server(upstream, ResponseCache())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get_module() -> TerraformModule:
+    return TerraformModule(name="test_module", current_version="1.0.0", source_file=Path("test_file.tf"), source_string="test/test_module/test_provider", start_line_number=1)
+
+
+def _resolve(proxy_server: RegistryProxyServer, credentials: Union[dict[str, str], None] = None) -> tuple:
+    registry_handler = RegistryHandler("registry.terraform.io", credentials or {}, registry_overrides={"registry.terraform.io": f"{proxy_server.url}/registry.terraform.io"})
+    module = _get_module()
+    module.newest_version = registry_handler.get_newest_version(module)
+    return module.newest_version, registry_handler.get_source(module)
+
+
+def _get_json(url: str, method: str = "GET", token: Union[str, None] = None) -> dict:
+    request_object = request.Request(url, method=method)
+    if token is not None:
+        request_object.add_header("Authorization", f"Bearer {token}")
+    with request.urlopen(request_object) as response:
+        return json.loads(response.read())
+
+
+def test_registry_handler_through_proxy(upstream: StandInUpstream, proxy_server: RegistryProxyServer):
+    assert _resolve(proxy_server) == ("2.1.0", "https://github.com/test/test_module")
+    assert len(upstream.requests) == 3
+
+    # a second job is served from the cache of the proxy
+    assert _resolve(proxy_server) == ("2.1.0", "https://github.com/test/test_module")
+    assert len(upstream.requests) == 3
+
+    discovery = _get_json(f"{proxy_server.url}/registry.terraform.io/.well-known/terraform.json")
+    assert discovery == {"modules.v1": "/registry.terraform.io/v1/modules/", "providers.v1": "/registry.terraform.io/v1/providers/"}
+
+    stats = _get_json(f"{proxy_server.url}/_infrapatch/stats")
+    assert stats["upstream_requests"] == 3
+    assert stats["memory_hits"] > 0
+
+
+def test_unknown_paths_are_rejected(proxy_server: RegistryProxyServer):
+    for path in ["/unknown.registry.io/.well-known/terraform.json", "/registry.terraform.io/api/v2/organizations"]:
+        with pytest.raises(HTTPError) as e:
+            _get_json(f"{proxy_server.url}{path}")
+        assert e.value.code == 404
+
+
+def test_revalidation(upstream: StandInUpstream):
+    proxy_server = _create_proxy_server(upstream, ResponseCache(), access_token="secret")
+    credentials = {proxy_server.url.removeprefix("http://"): "secret"}
+    try:
+        _resolve(proxy_server, credentials)
+        # revalidations are only accepted with the access token
+        with pytest.raises(HTTPError) as e:
+            _get_json(f"{proxy_server.url}/_infrapatch/revalidate", method="POST")
+        assert e.value.code == 401
+        assert _get_json(f"{proxy_server.url}/_infrapatch/revalidate?prefix=/registry.terraform.io/v1/modules/test", method="POST", token="secret") == {
+            "prefix": "/registry.terraform.io/v1/modules/test"
+        }
+        upstream.requests.clear()
+        assert _resolve(proxy_server, credentials) == ("2.1.0", "https://github.com/test/test_module")
+        # only the module endpoints are revalidated, both are answered with 304 since the documents did not change
+        assert len(upstream.requests) == 2
+        assert _get_json(f"{proxy_server.url}/_infrapatch/stats", token="secret")["not_modified"] == 2
+    finally:
+        proxy_server.shutdown()
+        proxy_server.server_close()
+
+
+def test_private_registries_require_an_access_token(upstream: StandInUpstream):
+    with pytest.raises(RegistryProxyException):
+        RegistryProxy({"registry.terraform.io": upstream.url}, {"registry.terraform.io": "upstream-token"})
+
+    proxy_server = _create_proxy_server(upstream, ResponseCache(), credentials={"registry.terraform.io": "upstream-token"}, access_token="secret")
+    try:
+        with pytest.raises(HTTPError) as e:
+            _get_json(f"{proxy_server.url}/registry.terraform.io/.well-known/terraform.json")
+        assert e.value.code == 401
+        # the token of the registry is not sent to the proxy, the token of the proxy host is
+        credentials = {"registry.terraform.io": "upstream-token", proxy_server.url.removeprefix("http://"): "secret"}
+        assert _resolve(proxy_server, credentials) == ("2.1.0", "https://github.com/test/test_module")
+        assert set(upstream.authorizations) == {"Bearer upstream-token"}
+    finally:
+        proxy_server.shutdown()
+        proxy_server.server_close()
+
+
+def test_invalidations_are_bounded():
+    proxy = RegistryProxy({"registry.terraform.io": "https://registry.terraform.io"}, ttl=300)
+    for index in range(1500):
+        proxy.revalidate(f"/registry.terraform.io/v1/modules/test/module{index}")
+    assert len(proxy._invalidations) <= 1000
+    # dropped invalidations are replaced by one for all responses
+    assert "/" in proxy._invalidations
+
+
+def test_stale_responses_are_served_on_upstream_errors(upstream: StandInUpstream):
+    proxy_server = _create_proxy_server(upstream, ResponseCache(), ttl=0)
+    try:
+        _resolve(proxy_server)
+        upstream.fail = True
+        proxy_server.proxy.request_scheduler.backoff_base = 0
+        assert _resolve(proxy_server) == ("2.1.0", "https://github.com/test/test_module")
+        assert proxy_server.proxy.get_stats()["stale_served"] == 3
+    finally:
+        proxy_server.shutdown()
+        proxy_server.server_close()
+
+
+def test_disk_tier_survives_restarts(upstream: StandInUpstream, tmp_path: Path):
+    for _ in range(2):
+        proxy_server = _create_proxy_server(upstream, ResponseCache(max_entries=1, cache_directory=tmp_path))
+        try:
+            assert _resolve(proxy_server) == ("2.1.0", "https://github.com/test/test_module")
+        finally:
+            proxy_server.shutdown()
+            proxy_server.server_close()
+    assert len(upstream.requests) == 3
+
+
+def test_response_cache_is_bounded():
+    cache = ResponseCache(max_entries=2)
+    for index in range(3):
+        cache.put(CachedResponse(url=f"https://registry/{index}", status=200, body=b"{}"))
+    assert len(cache) == 2
+    assert cache.get("https://registry/0") is None
+    assert cache.get("https://registry/2") is not None
@@ -0,0 +1,132 @@
+import json
+import sqlite3
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule, TerraformProvider
+from infrapatch.core.utils.terraform.registry_handler import RegistryHandler
+from infrapatch.core.utils.terraform.registry_snapshot import (
+    CompositeRegistrySnapshot,
+    JsonRegistrySnapshot,
+    ProviderMirrorSnapshot,
+    RegistrySnapshotException,
+    SnapshotResourceType,
+    SqliteRegistrySnapshot,
+    load_registry_snapshot,
+)
+
+
+@pytest.fixture
+def json_snapshot(tmp_path: Path) -> Path:
+    snapshot_file = tmp_path.joinpath("snapshot.json")
+    snapshot = {
+        "modules": {"registry.terraform.io/test/test_module/test_provider": {"versions": ["1.0.0", "2.1.0", "3.0.0-beta"], "source": "https://github.com/test/test_module"}},
+        "providers": {"registry.terraform.io/hashicorp/aws": {"versions": ["5.0.0", "5.20.0"]}},
+    }
+    snapshot_file.write_text(json.dumps(snapshot))
+    return snapshot_file
+
+
+@pytest.fixture
+def sqlite_snapshot(tmp_path: Path) -> Path:
+    snapshot_file = tmp_path.joinpath("snapshot.sqlite")
+    connection = sqlite3.connect(snapshot_file)
+    connection.execute("CREATE TABLE resources (resource_type TEXT, address TEXT, versions TEXT, source TEXT, PRIMARY KEY (resource_type, address))")
+    connection.execute("INSERT INTO resources VALUES (?, ?, ?, ?)", ("provider", "registry.terraform.io/hashicorp/aws", json.dumps(["5.0.0", "5.20.0"]), None))
+    connection.commit()
+    connection.close()
+    return snapshot_file
+
+
+@pytest.fixture
+def mirror_directory(tmp_path: Path) -> Path:
+    mirror = tmp_path.joinpath("mirror")
+    index_file = mirror.joinpath("registry.terraform.io", "hashicorp", "aws", "index.json")
+    index_file.parent.mkdir(parents=True)
+    index_file.write_text(json.dumps({"versions": {"5.0.0": {}, "5.20.0": {}}}))
+    return mirror
+
+
+def _get_module() -> TerraformModule:
+    return TerraformModule(name="test_module", current_version="1.0.0", source_file=Path("test_file.tf"), source_string="test/test_module/test_provider", start_line_number=1)
+
+
+def _get_provider(source: str = "hashicorp/aws") -> TerraformProvider:
+    return TerraformProvider(name="aws", current_version="5.0.0", source_file=Path("test_file.tf"), source_string=source, start_line_number=1)
+
+
+def test_json_snapshot(json_snapshot: Path):
+    snapshot = JsonRegistrySnapshot(json_snapshot)
+    entry = snapshot.get_entry(SnapshotResourceType.MODULE, "Registry.Terraform.io/test/test_module/test_provider")
+    assert entry is not None
+    assert entry.source == "https://github.com/test/test_module"
+    assert snapshot.get_entry(SnapshotResourceType.PROVIDER, "registry.terraform.io/test/test_module/test_provider") is None
+
+
+def test_sqlite_snapshot(sqlite_snapshot: Path):
+    snapshot = SqliteRegistrySnapshot(sqlite_snapshot)
+    entry = snapshot.get_entry(SnapshotResourceType.PROVIDER, "registry.terraform.io/hashicorp/aws")
+    assert entry is not None
+    assert entry.versions == ["5.0.0", "5.20.0"]
+    assert entry.source is None
+    assert snapshot.get_entry(SnapshotResourceType.PROVIDER, "registry.terraform.io/hashicorp/azurerm") is None
+
+
+def test_mirror_snapshot(mirror_directory: Path):
+    snapshot = ProviderMirrorSnapshot(mirror_directory.as_posix())
+    entry = snapshot.get_entry(SnapshotResourceType.PROVIDER, "registry.terraform.io/hashicorp/aws")
+    assert entry is not None
+    assert entry.versions == ["5.0.0", "5.20.0"]
+    assert snapshot.get_entry(SnapshotResourceType.MODULE, "registry.terraform.io/hashicorp/aws") is None
+
+    excluded = ProviderMirrorSnapshot(mirror_directory.as_posix(), exclude=["registry.terraform.io/hashicorp/*"])
+    assert excluded.get_entry(SnapshotResourceType.PROVIDER, "registry.terraform.io/hashicorp/aws") is None
+    not_included = ProviderMirrorSnapshot(mirror_directory.as_posix(), include=["registry.terraform.io/integrations/*"])
+    assert not_included.get_entry(SnapshotResourceType.PROVIDER, "registry.terraform.io/hashicorp/aws") is None
+
+
+def test_invalid_mirror_indexes_are_misses(mirror_directory: Path):
+    request_scheduler = MagicMock()
+    request_scheduler.get.return_value = b"<html>Bad Gateway</html>"
+    assert ProviderMirrorSnapshot("https://mirror.example.com", request_scheduler).get_entry(SnapshotResourceType.PROVIDER, "registry.terraform.io/hashicorp/aws") is None
+
+    mirror_directory.joinpath("registry.terraform.io", "hashicorp", "aws", "index.json").write_text("{")
+    assert ProviderMirrorSnapshot(mirror_directory.as_posix()).get_entry(SnapshotResourceType.PROVIDER, "registry.terraform.io/hashicorp/aws") is None
+
+
+def test_load_registry_snapshot(json_snapshot: Path, sqlite_snapshot: Path, mirror_directory: Path, tmp_path: Path):
+    assert isinstance(load_registry_snapshot(json_snapshot), JsonRegistrySnapshot)
+    assert isinstance(load_registry_snapshot(sqlite_snapshot), SqliteRegistrySnapshot)
+    assert isinstance(load_registry_snapshot(mirror_directory), ProviderMirrorSnapshot)
+    with pytest.raises(RegistrySnapshotException):
+        load_registry_snapshot(tmp_path.joinpath("snapshot.txt"))
+
+
+def test_offline_registry_handler(json_snapshot: Path, mirror_directory: Path):
+    snapshot = CompositeRegistrySnapshot([JsonRegistrySnapshot(json_snapshot), ProviderMirrorSnapshot(mirror_directory.as_posix())])
+    registry_handler = RegistryHandler("registry.terraform.io", {}, snapshot=snapshot, offline=True)
+
+    def send_request(url: str, registry_base_domain: str):
+        raise AssertionError(f"Unexpected request to '{url}' in offline mode.")
+
+    registry_handler._send_request = send_request  # type: ignore
+
+    module = _get_module()
+    # pre-release versions are ignored
+    assert registry_handler.get_newest_version(module) == "2.1.0"
+    module.newest_version = "2.1.0"
+    assert registry_handler.get_source(module) == "https://github.com/test/test_module"
+
+    provider = _get_provider()
+    assert registry_handler.get_newest_version(provider) == "5.20.0"
+    provider.newest_version = "5.20.0"
+    assert registry_handler.get_source(provider) is None
+
+    assert registry_handler.get_newest_version(_get_provider("hashicorp/azurerm")) is None
+
+
+def test_offline_requires_snapshot():
+    with pytest.raises(Exception):
+        RegistryHandler("registry.terraform.io", {}, offline=True)
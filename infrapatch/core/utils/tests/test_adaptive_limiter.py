@@ -0,0 +1,60 @@
+from infrapatch.core.utils.adaptive_limiter import AdaptiveLimiter, RequestOutcome
+
+
+def _complete_requests(limiter: AdaptiveLimiter, count: int, latency: float, outcome: str = RequestOutcome.SUCCESS):
+    for _ in range(count):
+        limiter.acquire()
+        limiter.release(latency, outcome)
+
+
+def test_limit_increases_with_stable_latency():
+    limiter = AdaptiveLimiter(max_limit=16, initial_limit=2)
+    _complete_requests(limiter, 50, 0.1)
+    assert limiter.limit > 2
+    _complete_requests(limiter, 1000, 0.1)
+    assert limiter.limit == 16
+
+
+def test_limit_decreases_on_throttling_and_errors():
+    limiter = AdaptiveLimiter(max_limit=16, initial_limit=16)
+    _complete_requests(limiter, 1, 0, RequestOutcome.THROTTLED)
+    assert limiter.limit == 8
+    _complete_requests(limiter, 1, 0, RequestOutcome.ERROR)
+    assert limiter.limit == 4
+    _complete_requests(limiter, 10, 0, RequestOutcome.ERROR)
+    assert limiter.limit == 1
+
+
+def test_limit_decreases_once_for_a_burst_of_errors():
+    limiter = AdaptiveLimiter(max_limit=16, initial_limit=16)
+    for _ in range(16):
+        limiter.acquire()
+    # all requests were sent before the first error, so they saw the same congestion
+    for _ in range(16):
+        limiter.release(0.1, RequestOutcome.THROTTLED)
+    assert limiter.limit == 8
+
+
+def test_limit_decreases_on_latency_inflation():
+    limiter = AdaptiveLimiter(max_limit=16, initial_limit=8)
+    _complete_requests(limiter, 1, 0.1)
+    limit_before = limiter.limit
+    _complete_requests(limiter, 5, 1.0)
+    assert limiter.limit < limit_before
+
+
+def test_try_acquire_respects_limit():
+    limiter = AdaptiveLimiter(max_limit=2, initial_limit=2)
+    assert limiter.try_acquire() is True
+    assert limiter.try_acquire() is True
+    assert limiter.try_acquire() is False
+    assert limiter.in_flight == 2
+
+
+def test_latency_percentile():
+    limiter = AdaptiveLimiter(max_limit=2)
+    assert limiter.get_latency_percentile(0.95) is None
+    for latency in range(1, 101):
+        limiter.acquire()
+        limiter.release(latency / 1000, RequestOutcome.SUCCESS)
+    assert limiter.get_latency_percentile(0.95) == 0.096
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.utils.checkpoint import CheckpointException, CheckpointJournal
+
+
+def _get_module(source_file: Path, name: str = "vpc", current_version: str = "1.0.0") -> TerraformModule:
+    return TerraformModule(name=name, current_version=current_version, source_file=source_file, source_string="test/vpc/aws", start_line_number=1)
+
+
+def test_resume_resolved_patched_and_committed_resources(tmp_path: Path):
+    main_file = tmp_path.joinpath("main.tf")
+    main_file.write_text('module "vpc" {}')
+    journal = CheckpointJournal(tmp_path.joinpath("checkpoint.jsonl"))
+    module = _get_module(main_file)
+    journal.record_resolved(module, "2.0.0", "https://github.com/test/vpc")
+    module.newest_version = "2.0.0"
+    module.github_repo = "https://github.com/test/vpc"
+    main_file.write_text('module "vpc" { version = "2.0.0" }')
+    journal.record_patched(module)
+    journal.record_commit("abc", [module])
+
+    resumed = CheckpointJournal(tmp_path.joinpath("checkpoint.jsonl"), resume=True)
+
+    assert resumed.get_resolved(_get_module(main_file)) == ("2.0.0", "https://github.com/test/vpc")
+    # resolutions only apply to the same current version
+    assert resumed.get_resolved(_get_module(main_file, current_version="1.1.0")) is None
+    # the parsed version of the patched resource is the newest version
+    patched = _get_module(main_file, current_version="2.0.0")
+    assert resumed.get_patched(patched) == ("2.0.0", "https://github.com/test/vpc")
+    assert resumed.get_commit(patched) == "abc"
+    assert resumed.is_patched(_get_module(main_file, name="other")) is False
+
+
+def test_patches_of_changed_files_are_not_resumed(tmp_path: Path):
+    main_file = tmp_path.joinpath("main.tf")
+    main_file.write_text('module "vpc" { version = "2.0.0" }')
+    journal = CheckpointJournal(tmp_path.joinpath("checkpoint.jsonl"))
+    module = _get_module(main_file)
+    module.newest_version = "2.0.0"
+    journal.record_patched(module)
+
+    main_file.write_text('module "vpc" { version = "1.0.0" }')
+
+    assert CheckpointJournal(tmp_path.joinpath("checkpoint.jsonl"), resume=True).is_patched(module) is False
+
+
+def test_incomplete_records_are_skipped(tmp_path: Path):
+    journal_file = tmp_path.joinpath("checkpoint.jsonl")
+    journal = CheckpointJournal(journal_file)
+    journal.record_resolved(_get_module(tmp_path.joinpath("main.tf")), "2.0.0", None)
+    # the process was killed while writing the second record
+    with open(journal_file, "a") as file:
+        file.write('{"type": "resolved", "key": ')
+
+    resumed = CheckpointJournal(journal_file, resume=True)
+
+    assert resumed.get_resolved(_get_module(tmp_path.joinpath("main.tf"))) == ("2.0.0", None)
+
+
+def test_journal_is_kept_without_resume_and_removed_when_completed(tmp_path: Path):
+    journal_file = tmp_path.joinpath("checkpoint.jsonl")
+    CheckpointJournal(journal_file).record_resolved(_get_module(tmp_path.joinpath("main.tf")), "2.0.0", None)
+
+    # the journal of the interrupted run is not discarded by a new run
+    with pytest.raises(CheckpointException):
+        CheckpointJournal(journal_file)
+    assert journal_file.exists()
+
+    journal = CheckpointJournal(journal_file, resume=True)
+    journal.record_resolved(_get_module(tmp_path.joinpath("main.tf")), "2.0.0", None)
+    journal.complete()
+    assert not journal_file.exists()
@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from infrapatch.core.utils.file_watcher import InotifyFileWatcher, PollingFileWatcher
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    tmp_path.joinpath("modules").mkdir()
+    tmp_path.joinpath("main.tf").write_text("")
+    tmp_path.joinpath("modules", "vpc.tf").write_text("")
+    return tmp_path
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on linux")
+def test_inotify_file_watcher(project: Path):
+    watcher = InotifyFileWatcher(project)
+    try:
+        assert watcher.wait_for_changes(timeout=0.1).is_empty()
+
+        project.joinpath("main.tf").write_text("changed")
+        project.joinpath("modules", "vpc.tf").unlink()
+        project.joinpath("README.md").write_text("")
+        project.joinpath(".terraform").mkdir()
+        project.joinpath(".terraform", "downloaded.tf").write_text("")
+        # files of new directories are reported, even if they were created before the directory was watched
+        project.joinpath("new").mkdir()
+        project.joinpath("new", "nested.tf").write_text("")
+        changes = watcher.wait_for_changes(timeout=1)
+        assert changes.files == {project.joinpath("main.tf"), project.joinpath("modules", "vpc.tf"), project.joinpath("new", "nested.tf")}
+        assert changes.rescan_all is False
+
+        project.joinpath("new", "nested.tf").write_text("changed")
+        assert watcher.wait_for_changes(timeout=1).files == {project.joinpath("new", "nested.tf")}
+
+        project.joinpath("modules").rename(project.joinpath(".hidden"))
+        assert watcher.wait_for_changes(timeout=1).rescan_all is True
+    finally:
+        watcher.close()
+
+
+def test_polling_file_watcher(project: Path):
+    watcher = PollingFileWatcher(project, interval=0.01)
+    assert watcher.wait_for_changes(timeout=0.05).is_empty()
+
+    project.joinpath("main.tf").write_text("changed")
+    project.joinpath("modules", "vpc.tf").unlink()
+    project.joinpath("modules", "new.tf").write_text("")
+    project.joinpath("README.md").write_text("changed")
+
+    assert watcher.wait_for_changes(timeout=1).files == {project.joinpath("main.tf"), project.joinpath("modules", "vpc.tf"), project.joinpath("modules", "new.tf")}
@@ -0,0 +1,147 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from infrapatch.core.utils.git import Git, GitException
+
+
+def _commit(repo_path: Path, message: str) -> None:
+    subprocess.run(["git", "add", "-A"], cwd=repo_path, check=True)
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-q", "-m", message], cwd=repo_path, check=True)
+
+
+def test_get_changed_files(tmp_path: Path):
+    subprocess.run(["git", "init", "-q", tmp_path.as_posix()], check=True)
+    tmp_path.joinpath("main.tf").write_text("a")
+    tmp_path.joinpath("unchanged.tf").write_text("b")
+    tmp_path.joinpath("old.tf").write_text("c" * 100)
+    _commit(tmp_path, "initial")
+    git = Git(tmp_path)
+    head_commit = git.get_head_commit()
+
+    tmp_path.joinpath("main.tf").write_text("changed")
+    tmp_path.joinpath("old.tf").rename(tmp_path.joinpath("new.tf"))
+    _commit(tmp_path, "change")
+
+    assert sorted(git.get_changed_files(head_commit)) == sorted([tmp_path.joinpath("main.tf"), tmp_path.joinpath("old.tf"), tmp_path.joinpath("new.tf")])
+    assert git.get_changed_files("HEAD") == []
+
+
+def _create_remote(tmp_path: Path, commits: int) -> Path:
+    # a repository with a main branch and a feature branch which diverged in the middle of the history
+    source = tmp_path.joinpath("source")
+    subprocess.run(["git", "init", "-q", "-b", "main", source.as_posix()], check=True)
+    source.joinpath("main.tf").write_text("initial")
+    source.joinpath("README.md").write_text("readme")
+    _commit(source, "initial")
+    for index in range(commits):
+        source.joinpath("README.md").write_text(f"readme {index}")
+        _commit(source, f"readme {index}")
+    subprocess.run(["git", "branch", "feature"], cwd=source, check=True)
+    for index in range(commits):
+        source.joinpath("main.tf").write_text(f"main {index}")
+        _commit(source, f"main {index}")
+    subprocess.run(["git", "checkout", "-q", "feature"], cwd=source, check=True)
+    for index in range(commits):
+        source.joinpath("feature.tf").write_text(f"feature {index}")
+        _commit(source, f"feature {index}")
+    subprocess.run(["git", "checkout", "-q", "main"], cwd=source, check=True)
+    return source
+
+
+def _clone(remote: Path, target: Path, depth: int) -> Git:
+    subprocess.run(["git", "clone", "-q", f"--depth={depth}", "--no-single-branch", remote.absolute().as_uri(), target.as_posix()], check=True)
+    return Git(target)
+
+
+def test_fetch_branches_with_depth(tmp_path: Path):
+    remote = _create_remote(tmp_path, commits=3)
+    git = _clone(remote, tmp_path.joinpath("clone"), depth=1)
+    assert git.is_shallow()
+    assert not git.is_partial_clone()
+
+    remote.joinpath("main.tf").write_text("new")
+    _commit(remote, "new")
+    git.fetch_branches(["main"], depth=1)
+
+    stdout, _ = git.run_git_command(["rev-list", "--count", "origin/main"])
+    assert stdout.strip() == "1"
+    stdout, _ = git.run_git_command(["log", "-1", "--format=%s", "origin/main"])
+    assert stdout.strip() == "new"
+
+
+def test_ensure_merge_base_deepens_history(tmp_path: Path):
+    remote = _create_remote(tmp_path, commits=5)
+    git = _clone(remote, tmp_path.joinpath("clone"), depth=1)
+    assert not git._has_merge_base("origin/main", "origin/feature")
+
+    git.ensure_merge_base("origin/main", "origin/feature", ["main", "feature"], deepen_by=2)
+
+    assert git._has_merge_base("origin/main", "origin/feature")
+    # the history is only deepened as far as needed
+    assert git.is_shallow()
+
+
+def test_ensure_merge_base_unshallows_history(tmp_path: Path):
+    remote = _create_remote(tmp_path, commits=5)
+    git = _clone(remote, tmp_path.joinpath("clone"), depth=1)
+
+    git.ensure_merge_base("origin/main", "origin/feature", ["main", "feature"], deepen_by=1, max_attempts=1)
+
+    assert git._has_merge_base("origin/main", "origin/feature")
+    assert not git.is_shallow()
+
+
+def test_enable_sparse_checkout(tmp_path: Path):
+    remote = _create_remote(tmp_path, commits=1)
+    git = _clone(remote, tmp_path.joinpath("clone"), depth=1)
+
+    git.enable_sparse_checkout(["*.tf"])
+
+    assert tmp_path.joinpath("clone", "main.tf").is_file()
+    assert not tmp_path.joinpath("clone", "README.md").exists()
+
+
+def test_commit_files(tmp_path: Path):
+    subprocess.run(["git", "init", "-q", tmp_path.as_posix()], check=True)
+    tmp_path.joinpath("modules").mkdir()
+    tmp_path.joinpath("main.tf").write_text("a")
+    tmp_path.joinpath("modules", "vpc.tf").write_text("b")
+    tmp_path.joinpath("removed.tf").write_text("c")
+    _commit(tmp_path, "initial")
+    git = Git(tmp_path)
+    head_commit = git.get_head_commit()
+
+    tmp_path.joinpath("main.tf").write_text("changed")
+    tmp_path.joinpath("modules", "vpc.tf").write_text("changed")
+    tmp_path.joinpath("removed.tf").unlink()
+    # files which are not passed are not committed
+    tmp_path.joinpath("other.tf").write_text("d")
+    assert git.commit_files([tmp_path.joinpath("main.tf")], "first") is not None
+    assert git.commit_files([tmp_path.joinpath("modules", "vpc.tf"), tmp_path.joinpath("removed.tf")], "second") is not None
+    assert git.commit_files([tmp_path.joinpath("main.tf")], "unchanged") is None
+    git.sync_index()
+
+    log = subprocess.run(["git", "log", "--format=%s", f"{head_commit}..HEAD"], cwd=tmp_path, capture_output=True, text=True, check=True)
+    assert log.stdout.splitlines() == ["second", "first"]
+    assert sorted(git.get_changed_files(head_commit)) == sorted([tmp_path.joinpath("main.tf"), tmp_path.joinpath("modules", "vpc.tf"), tmp_path.joinpath("removed.tf")])
+    status = subprocess.run(["git", "status", "--porcelain"], cwd=tmp_path, capture_output=True, text=True, check=True)
+    assert status.stdout.splitlines() == ["?? other.tf"]
+
+
+def test_checkout_and_reset_branch(tmp_path: Path):
+    remote = _create_remote(tmp_path, commits=2)
+    subprocess.run(["git", "clone", "-q", remote.absolute().as_uri(), tmp_path.joinpath("clone").as_posix()], check=True)
+    git = Git(tmp_path.joinpath("clone"))
+
+    git.checkout_branch("infrapatch", "origin/feature")
+    assert tmp_path.joinpath("clone", "feature.tf").is_file()
+    with pytest.raises(GitException):
+        git.checkout_branch("infrapatch", "origin/main")
+
+    git.reset_branch("infrapatch", "origin/main")
+    assert not tmp_path.joinpath("clone", "feature.tf").exists()
+    head = subprocess.run(["git", "rev-parse", "--abbrev-ref", "HEAD"], cwd=tmp_path.joinpath("clone"), capture_output=True, text=True, check=True)
+    assert head.stdout.strip() == "infrapatch"
+    assert git.get_head_commit() == subprocess.run(["git", "rev-parse", "origin/main"], cwd=tmp_path.joinpath("clone"), capture_output=True, text=True, check=True).stdout.strip()
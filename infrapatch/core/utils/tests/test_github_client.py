@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from infrapatch.core.utils.github_client import GithubClient, GithubClientException
+
+
+class StandInGithub(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInGithubRequestHandler)
+        self.requests: list[tuple[str, str]] = []
+        self.rate_limit_remaining = 5000
+        self.branches = {"main": "abc123"}
+        self.pulls = [
+            {"number": 1, "head": {"ref": "infrapatch"}, "base": {"ref": "main"}, "body": "old body", "html_url": "https://github.com/test/repo/pull/1"},
+            {"number": 2, "head": {"ref": "feature"}, "base": {"ref": "main"}, "body": "", "html_url": "https://github.com/test/repo/pull/2"},
+        ]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInGithubRequestHandler(BaseHTTPRequestHandler):
+    server: StandInGithub
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        url = urlparse(self.path)
+        if url.path.startswith("/repos/test/repo/branches/"):
+            name = url.path.split("/")[-1]
+            if name not in self.server.branches:
+                return self._send(404, {"message": "Branch not found"})
+            return self._send(200, {"name": name, "commit": {"sha": self.server.branches[name]}})
+        if url.path == "/repos/test/repo/pulls":
+            query = parse_qs(url.query)
+            head = query["head"][0].split(":")[1]
+            return self._send(200, [pull for pull in self.server.pulls if pull["head"]["ref"] == head and pull["base"]["ref"] == query["base"][0]])
+        self._send(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        values = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(("POST", self.path))
+        if self.path == "/repos/test/repo/git/refs":
+            self.server.branches[values["ref"].removeprefix("refs/heads/")] = values["sha"]
+            return self._send(201, {"ref": values["ref"]})
+        pull = {"number": 3, "head": {"ref": values["head"]}, "base": {"ref": values["base"]}, "body": values["body"], "html_url": ""}
+        self.server.pulls.append(pull)
+        self._send(201, pull)
+
+    def do_PATCH(self):
+        values = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(("PATCH", self.path))
+        self._send(200, {**self.server.pulls[0], **values})
+
+    def _send(self, status: int, document):
+        body = json.dumps(document).encode()
+        etag = f'"{hash(body)}"'
+        if self.command == "GET" and status == 200 and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.server.rate_limit_remaining -= 1
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Remaining", str(self.server.rate_limit_remaining))
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def github():
+    server = StandInGithub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get_client(github: StandInGithub, cache_directory=None) -> GithubClient:
+    return GithubClient("token", "test/repo", api_url=github.url, cache_directory=cache_directory)
+
+
+def test_branches_are_memoized(github: StandInGithub):
+    github_client = _get_client(github)
+    branch = github_client.get_branch("main")
+    assert branch is not None and branch.sha == "abc123"
+    assert github_client.get_branch("main") == branch
+    assert github_client.get_branch("missing") is None
+    assert len(github.requests) == 2
+
+    github_client.create_branch("infrapatch", "abc123")
+    branch = github_client.get_branch("infrapatch")
+    assert branch is not None and branch.sha == "abc123"
+
+
+def test_conditional_requests_between_runs(github: StandInGithub, tmp_path: Path):
+    github_client = _get_client(github, tmp_path)
+    github_client.get_branch("main")
+    github_client.save()
+
+    github_client = _get_client(github, tmp_path)
+    branch = github_client.get_branch("main")
+    assert branch is not None and branch.sha == "abc123"
+    assert github_client.get_stats()["not_modified"] == 1
+    assert github.rate_limit_remaining == 4999
+
+
+def test_pull_requests(github: StandInGithub):
+    github_client = _get_client(github)
+    pull_request = github_client.get_pull_request(head="infrapatch", base="main")
+    assert pull_request is not None and pull_request.number == 1
+    # the pull requests are filtered by the server
+    assert github.requests == [("GET", "/repos/test/repo/pulls?state=open&head=test%3Ainfrapatch&base=main")]
+    assert github_client.get_pull_request(head="missing", base="main") is None
+
+    assert github_client.update_pull_request_body(pull_request, "old body\n") is False
+    assert github_client.update_pull_request_body(pull_request, "new body") is True
+    assert ("PATCH", "/repos/test/repo/pulls/1") in github.requests
+
+    created = github_client.create_pull_request("title", "body", head="other", base="main")
+    assert created.number == 3
+
+
+def test_errors(github: StandInGithub):
+    with pytest.raises(GithubClientException):
+        _get_client(github)._get("/unknown")
+
+
+def test_throttle_when_quota_runs_low(github: StandInGithub, monkeypatch: pytest.MonkeyPatch):
+    github_client = GithubClient("token", "test/repo", api_url=github.url, min_remaining_requests=100, max_throttle_seconds=30)
+    github.rate_limit_remaining = 10
+    github_client.get_branch("main")
+    assert github_client.rate_limit_remaining == 9
+
+    delays = []
+    monkeypatch.setattr(time, "sleep", lambda seconds: delays.append(seconds))
+    github_client.get_branch("missing")
+    # 3600 seconds until the reset spread over the remaining 9 requests, limited to the maximum delay
+    assert delays == [30]
@@ -0,0 +1,26 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from infrapatch.core.utils.json_file import write_json_atomically
+
+
+def test_concurrent_writes(tmp_path: Path):
+    file = tmp_path.joinpath("cache", "cache.json")
+    contents = [{"writer": index, "entries": list(range(1000))} for index in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda content: write_json_atomically(file, content), contents * 5))
+    # the file is one of the complete writes and no temporary files are left
+    assert json.loads(file.read_text()) in contents
+    assert [path.name for path in file.parent.iterdir()] == ["cache.json"]
+
+
+def test_failed_write_keeps_the_file(tmp_path: Path):
+    file = tmp_path.joinpath("cache.json")
+    write_json_atomically(file, {"version": 1})
+    with pytest.raises(TypeError):
+        write_json_atomically(file, {"version": object()})
+    assert json.loads(file.read_text()) == {"version": 1}
+    assert [path.name for path in tmp_path.iterdir()] == ["cache.json"]
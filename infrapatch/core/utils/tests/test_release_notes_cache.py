@@ -0,0 +1,38 @@
+import time
+from pathlib import Path
+
+from infrapatch.core.utils.release_notes_cache import ReleaseNotesCache
+
+
+def test_entries_are_persisted(tmp_path: Path):
+    release_notes_cache = ReleaseNotesCache(tmp_path)
+    release_notes_cache.set("Test/Test_Module", "v1.0.0", "release notes")
+    release_notes_cache.set("test/test_module", "v2.0.0", None)
+    release_notes_cache.save()
+
+    release_notes_cache = ReleaseNotesCache(tmp_path)
+    entry = release_notes_cache.get("test/test_module", "v1.0.0")
+    assert entry is not None and entry.body == "release notes"
+    missing_entry = release_notes_cache.get("test/test_module", "v2.0.0")
+    assert missing_entry is not None and missing_entry.body is None
+    assert release_notes_cache.get("test/test_module", "V1.0.0") is None
+
+
+def test_missing_releases_expire_sooner(tmp_path: Path):
+    release_notes_cache = ReleaseNotesCache(tmp_path, ttl=3600, missing_ttl=0)
+    release_notes_cache.set("test/test_module", "v1.0.0", "release notes")
+    release_notes_cache.set("test/test_module", "v2.0.0", None)
+    time.sleep(0.01)
+    assert release_notes_cache.get("test/test_module", "v1.0.0") is not None
+    assert release_notes_cache.get("test/test_module", "v2.0.0") is None
+
+    # expired entries are not saved
+    release_notes_cache.save()
+    assert ReleaseNotesCache(tmp_path, missing_ttl=3600).get("test/test_module", "v2.0.0") is None
+
+
+def test_without_cache_directory():
+    release_notes_cache = ReleaseNotesCache()
+    release_notes_cache.set("test/test_module", "v1.0.0", "release notes")
+    release_notes_cache.save()
+    assert release_notes_cache.get("test/test_module", "v1.0.0") is not None
@@ -0,0 +1,183 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request
+
+import pytest
+
+from infrapatch.core.utils.adaptive_limiter import RequestOutcome
+from infrapatch.core.utils.request_scheduler import HostLimits, RequestScheduler, RequestSchedulerException, TokenBucket, _parse_retry_after
+
+
+class StandInRegistry(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInRegistryRequestHandler)
+        self.responses: list[tuple[int, dict[str, str]]] = []
+        self.delays: list[float] = []
+        self.request_count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/modules/test/test/test/versions"
+
+
+class StandInRegistryRequestHandler(BaseHTTPRequestHandler):
+    server: StandInRegistry
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            status, headers = self.server.responses.pop(0) if len(self.server.responses) > 0 else (200, {})
+            delay = self.server.delays.pop(0) if len(self.server.delays) > 0 else self.server.delay
+        time.sleep(delay)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(b'{"status": "ok"}')
+        with self.server.lock:
+            self.server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def registry():
+    server = StandInRegistry()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_retry_on_transient_errors(registry: StandInRegistry):
+    registry.responses = [(502, {}), (429, {"Retry-After": "0"})]
+    scheduler = RequestScheduler(backoff_base=0.01)
+    assert scheduler.get(request.Request(registry.url)) == b'{"status": "ok"}'
+    assert registry.request_count == 3
+
+
+def test_retry_after_is_honored_beyond_the_backoff(registry: StandInRegistry):
+    registry.responses = [(429, {"Retry-After": "1"})]
+    scheduler = RequestScheduler(backoff_base=0.01, backoff_max=0.1)
+    start = time.monotonic()
+    assert scheduler.get(request.Request(registry.url)) == b'{"status": "ok"}'
+    assert time.monotonic() - start >= 1
+    assert registry.request_count == 2
+
+    # retries which would wait past the deadline are not sent
+    registry.responses = [(429, {"Retry-After": "120"})]
+    start = time.monotonic()
+    with pytest.raises(RequestSchedulerException):
+        scheduler.get(request.Request(registry.url), timeout=5)
+    assert time.monotonic() - start < 1
+    assert registry.request_count == 3
+
+
+def test_retries_are_limited(registry: StandInRegistry):
+    registry.responses = [(503, {})] * 10
+    scheduler = RequestScheduler(default_limits=HostLimits(max_retries=2), backoff_base=0.01)
+    with pytest.raises(RequestSchedulerException) as e:
+        scheduler.get(request.Request(registry.url))
+    assert e.value.status == 503
+    assert registry.request_count == 3
+
+
+def test_no_retry_on_client_errors(registry: StandInRegistry):
+    registry.responses = [(404, {})]
+    scheduler = RequestScheduler(backoff_base=0.01)
+    with pytest.raises(RequestSchedulerException) as e:
+        scheduler.get(request.Request(registry.url))
+    assert e.value.status == 404
+    assert registry.request_count == 1
+
+
+def test_concurrency_is_capped_per_host(registry: StandInRegistry):
+    registry.delay = 0.05
+    scheduler = RequestScheduler(host_limits={"127.0.0.1": HostLimits(max_concurrency=2)})
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: scheduler.get(request.Request(registry.url)), range(8)))
+    assert registry.request_count == 8
+    assert registry.max_in_flight <= 2
+
+
+def test_concurrency_limit_adapts_to_throttling(registry: StandInRegistry):
+    registry.responses = [(429, {"Retry-After": "0"})] * 3
+    scheduler = RequestScheduler(host_limits={"127.0.0.1": HostLimits(max_concurrency=16, initial_concurrency=8)}, backoff_base=0.01)
+    scheduler.get(request.Request(registry.url))
+    # halved three times from 8 to 1, then increased by one for the successful request
+    assert scheduler.get_concurrency_limit("127.0.0.1") == 2
+
+
+def test_slow_requests_are_hedged(registry: StandInRegistry):
+    scheduler = RequestScheduler(host_limits={"127.0.0.1": HostLimits(hedge=True)}, hedge_min_samples=1)
+    scheduler.get(request.Request(registry.url))
+    registry.delays = [2]
+    start = time.monotonic()
+    assert scheduler.get(request.Request(registry.url)) == b'{"status": "ok"}'
+    assert time.monotonic() - start < 1
+    assert registry.request_count == 3
+    scheduler.close()
+    assert scheduler._hedge_executor is None
+
+
+def test_hedged_errors_are_scheduler_errors(registry: StandInRegistry):
+    scheduler = RequestScheduler(host_limits={"127.0.0.1": HostLimits(hedge=True)}, hedge_min_samples=1)
+    scheduler.get(request.Request(registry.url))
+    # the hedged request fails after the primary request
+    registry.responses = [(404, {}), (404, {})]
+    registry.delays = [0.3, 0.6]
+    with pytest.raises(RequestSchedulerException) as e:
+        scheduler.get(request.Request(registry.url))
+    assert e.value.status == 404
+    assert registry.request_count == 3
+    scheduler.close()
+
+
+def test_hedged_requests_respect_the_rate_limit(registry: StandInRegistry):
+    scheduler = RequestScheduler(host_limits={"127.0.0.1": HostLimits(hedge=True, requests_per_second=0.1)}, hedge_min_samples=1)
+    limiter = scheduler._get_host_state("127.0.0.1").limiter
+    limiter.acquire()
+    limiter.release(0.01, RequestOutcome.SUCCESS)
+    registry.delays = [0.3]
+    # the only token of the bucket is used by the primary request
+    assert scheduler.get(request.Request(registry.url)) == b'{"status": "ok"}'
+    assert registry.request_count == 1
+    assert limiter.in_flight == 0
+    scheduler.close()
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # the first token is available immediately, the following four need 50ms each
+    assert time.monotonic() - start >= 0.18
+
+
+def test_host_limits_from_dict():
+    limits = HostLimits.from_dict({"max_concurrency": "2", "requests_per_second": "0.5", "hedge": "true"})
+    assert limits.max_concurrency == 2
+    assert limits.requests_per_second == 0.5
+    assert limits.hedge is True
+    with pytest.raises(Exception):
+        HostLimits.from_dict({"unknown": 1})
+    with pytest.raises(Exception):
+        HostLimits.from_dict({"max_concurrency": 0})
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after(None) is None
+    assert _parse_retry_after("120") == 120
+    assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert _parse_retry_after("invalid") is None
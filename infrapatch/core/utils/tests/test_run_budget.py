@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from infrapatch.core.utils.run_budget import BudgetPhase, RunBudget, parse_phase_budgets
+
+
+def test_unlimited_budget():
+    run_budget = RunBudget(request_timeout=10)
+    with run_budget.phase(BudgetPhase.RESOLVE):
+        assert run_budget.remaining() is None
+        assert run_budget.expired() is False
+        assert run_budget.get_request_timeout() == 10
+
+
+def test_phase_budget():
+    run_budget = RunBudget(phase_budgets={BudgetPhase.RESOLVE: 0.1})
+    with run_budget.phase(BudgetPhase.PARSE):
+        assert run_budget.remaining() is None
+    with run_budget.phase(BudgetPhase.RESOLVE):
+        assert run_budget.expired() is False
+        assert run_budget.get_request_timeout() <= 0.1
+        time.sleep(0.15)
+        assert run_budget.expired() is True
+    # the phase budget only applies within the phase
+    assert run_budget.expired() is False
+
+
+def test_phase_budget_is_shared_by_all_entries():
+    run_budget = RunBudget(phase_budgets={BudgetPhase.RESOLVE: 0.2})
+    # e.g. the resolve phases of two providers
+    with run_budget.phase(BudgetPhase.RESOLVE):
+        time.sleep(0.15)
+    with run_budget.phase(BudgetPhase.RESOLVE):
+        remaining = run_budget.remaining()
+        assert remaining is not None and remaining <= 0.05
+        time.sleep(0.1)
+        assert run_budget.expired() is True
+    assert run_budget.get_phase_elapsed(BudgetPhase.RESOLVE) >= 0.25
+
+
+def test_concurrent_entries_of_a_phase():
+    run_budget = RunBudget(phase_budgets={BudgetPhase.RESOLVE: 0.2})
+    entered = threading.Barrier(4)
+
+    def enter_phase():
+        with run_budget.phase(BudgetPhase.RESOLVE):
+            entered.wait()
+            time.sleep(0.1)
+
+    threads = [threading.Thread(target=enter_phase) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # overlapping entries count the wall time once
+    assert 0.1 <= run_budget.get_phase_elapsed(BudgetPhase.RESOLVE) < 0.2
+    with run_budget.phase(BudgetPhase.RESOLVE):
+        assert run_budget.expired() is False
+
+
+def test_run_deadline_applies_to_all_phases():
+    run_budget = RunBudget(deadline=0.05, phase_budgets={BudgetPhase.PATCH: 100})
+    time.sleep(0.1)
+    assert run_budget.expired() is True
+    with run_budget.phase(BudgetPhase.PATCH):
+        assert run_budget.expired() is True
+
+
+def test_unknown_phase():
+    with pytest.raises(Exception):
+        RunBudget(phase_budgets={"unknown": 1})
+
+
+def test_parse_phase_budgets():
+    assert parse_phase_budgets("") == {}
+    assert parse_phase_budgets("parse=60, resolve=2.5") == {"parse": 60, "resolve": 2.5}
+    with pytest.raises(Exception):
+        parse_phase_budgets("parse")
@@ -0,0 +1,63 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from infrapatch.core.models.statistics import ProviderStatistics, Statistics
+from infrapatch.core.models.versioned_resource import ResourceStatus
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.utils.shard import Shard, ShardException, ShardMode, get_merged_markdown_report, merge_statistics_files, parse_shard
+
+
+def test_parse_shard():
+    assert parse_shard("2/4", ShardMode.SOURCE) == Shard(2, 4, ShardMode.SOURCE)
+    for value in ["0/4", "5/4", "1", "a/b", "1/0"]:
+        with pytest.raises(ShardException):
+            parse_shard(value)
+    with pytest.raises(ShardException):
+        parse_shard("1/2", "unknown")
+
+
+def test_shards_partition_keys():
+    keys = [f"modules/module{index}/main.tf" for index in range(10)]
+    shards = [Shard(index, 3).select(reversed(keys)) for index in range(1, 4)]
+    assert sorted(key for shard in shards for key in shard) == sorted(keys)
+    assert [len(shard) for shard in shards] == [4, 3, 3]
+    # the selection does not depend on the order the keys were discovered in
+    assert Shard(1, 3).select(keys) == shards[0]
+
+
+def _write_partial(path: Path, resources: list[TerraformModule]) -> Path:
+    provider_statistics = ProviderStatistics(errors=0, resources_patched=0, resources_pending_update=0, total_resources=len(resources), resources=resources)
+    statistics = Statistics(errors=0, resources_patched=0, resources_pending_update=0, total_resources=len(resources), providers={"terraform_modules": provider_statistics})
+    path.write_text(statistics.model_dump_json())
+    return path
+
+
+def _get_module(name: str, newest_version: str, status: str = ResourceStatus.UNPATCHED) -> TerraformModule:
+    module = TerraformModule(name=name, current_version="1.0.0", source_file=Path(f"{name}.tf"), source_string=f"test/{name}/aws", start_line_number=1)
+    module.newest_version = newest_version
+    module.status = status
+    return module
+
+
+def test_merge_statistics_files(tmp_path: Path):
+    first = _write_partial(tmp_path.joinpath("first.json"), [_get_module("vpc", "2.0.0"), _get_module("dns", "1.0.0")])
+    second = _write_partial(tmp_path.joinpath("second.json"), [_get_module("iam", "2.0.0", ResourceStatus.PATCHED)])
+    # the same shard uploaded twice is only counted once
+    merged = merge_statistics_files([first, second, second])
+
+    assert {key: value for key, value in merged.items() if key != "providers"} == {
+        "errors": 0,
+        "resources_patched": 1,
+        "resources_pending_update": 1,
+        "resources_timed_out": 0,
+        "total_resources": 3,
+    }
+    assert [resource["name"] for resource in merged["providers"]["terraform_modules"]["resources"]] == ["dns", "iam", "vpc"]
+    # the merged file has the same shape as the partial files
+    assert Statistics.model_validate(json.loads(json.dumps(merged))).total_resources == 3
+
+    report = get_merged_markdown_report(merged)
+    assert "test/vpc/aws" in report and "test/iam/aws" in report
+    assert "test/dns/aws" not in report
@@ -0,0 +1,55 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from infrapatch.core.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    single_flight = SingleFlight()
+    calls = 0
+    calls_lock = threading.Lock()
+
+    def slow_call():
+        nonlocal calls
+        with calls_lock:
+            calls += 1
+        time.sleep(0.2)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: single_flight.do("key", slow_call), range(8)))
+
+    assert results == ["result"] * 8
+    assert calls == 1
+    assert single_flight.in_flight() == 0
+
+
+def test_errors_are_shared_with_waiters():
+    single_flight = SingleFlight()
+    started = threading.Event()
+
+    def failing_call():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("lookup failed")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do, "key", failing_call)
+        started.wait()
+        follower = executor.submit(single_flight.do, "key", failing_call)
+        with pytest.raises(ValueError):
+            leader.result()
+        with pytest.raises(ValueError):
+            follower.result()
+    assert single_flight.in_flight() == 0
+
+
+def test_different_keys_are_not_coalesced():
+    single_flight = SingleFlight()
+    assert single_flight.do("key1", lambda: 1) == 1
+    assert single_flight.do("key2", lambda: 2) == 2
+    # a completed flight is not cached
+    assert single_flight.do("key1", lambda: 3) == 3
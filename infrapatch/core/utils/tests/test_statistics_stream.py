@@ -0,0 +1,49 @@
+import gzip
+import json
+from pathlib import Path
+
+from infrapatch.core.models.statistics import Statistics
+from infrapatch.core.models.versioned_resource import ResourceStatus
+from infrapatch.core.models.versioned_terraform_resources import TerraformModule
+from infrapatch.core.utils.statistics_stream import StatisticsCounter, StatisticsStreamWriter
+
+
+def _get_module(name: str, newest_version: str, status: str = ResourceStatus.UNPATCHED) -> TerraformModule:
+    module = TerraformModule(name=name, current_version="1.0.0", source_file=Path("main.tf"), source_string=f"test/{name}/aws", start_line_number=1)
+    module.newest_version = newest_version
+    if status != ResourceStatus.UNPATCHED:
+        module.status = status
+    return module
+
+
+def test_statistics_counter():
+    counter = StatisticsCounter()
+    for module in [
+        _get_module("vpc", "2.0.0"),
+        _get_module("dns", "1.0.0"),
+        _get_module("iam", "2.0.0", ResourceStatus.PATCHED),
+        _get_module("s3", "2.0.0", ResourceStatus.PATCH_ERROR),
+    ]:
+        counter.add(module)
+
+    assert counter == StatisticsCounter(errors=1, resources_patched=1, resources_pending_update=2, resources_timed_out=0, total_resources=4)
+
+
+def test_stream_statistics_to_gzip_file(tmp_path: Path):
+    statistics_file = tmp_path.joinpath("statistics.ndjson.gz")
+    counter = StatisticsCounter()
+    with StatisticsStreamWriter(statistics_file) as writer:
+        for module in [_get_module("vpc", "2.0.0"), _get_module("dns", "1.0.0")]:
+            counter.add(module)
+            writer.write_resource("terraform_modules", module)
+        provider_statistics = counter.get_provider_statistics()
+        writer.write_statistics(Statistics(**provider_statistics.model_dump(exclude={"resources"}), providers={"terraform_modules": provider_statistics}))
+
+    with gzip.open(statistics_file, "rt") as file:
+        records = [json.loads(line) for line in file]
+
+    assert [record["type"] for record in records] == ["resource", "resource", "provider_statistics", "statistics"]
+    assert TerraformModule.model_validate(records[0]["resource"]).source == "test/vpc/aws"
+    assert records[2]["provider"] == "terraform_modules"
+    assert records[3]["total_resources"] == 2
+    assert records[3]["resources_pending_update"] == 1